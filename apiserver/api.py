@@ -9,20 +9,30 @@ from django.conf.urls.defaults import patterns, url, include
 # original imports in tastypie.api
 import warnings
 from django.core.exceptions import ImproperlyConfigured
-from django.core.urlresolvers import reverse
-from django.http import HttpResponse
+from django.core.urlresolvers import reverse, resolve, Resolver404
+from django.http import HttpResponse, HttpResponseNotFound
 from apiserver.exceptions import NotRegistered
 from apiserver.serializers import Serializer
 from apiserver.utils import is_valid_jsonp_callback_value
 from apiserver.utils.mime import determine_format, build_content_type
+from apiserver.utils.concurrency import Future, get_pool
 from apiserver.resources import Resource
+from apiserver.router import Router, RouterPattern, ReversePattern
 from apiserver import decorators
 
 class API(object):
-    def __init__(self, version=''):
+    def __init__(self, version='', router=False):
         self.urlconf = []
         self.patterns = []
         self.version = '^' + version.rstrip('/')
+        
+        # opt-in: resolve paths using a trie of route segments
+        # instead of trying each resource's regex in turn
+        if router:
+            self.router = Router()
+            self.patterns.append(RouterPattern(self.router))
+        else:
+            self.router = None
     
     # canonical only for parity with tastypie, doesn't currently do anything
     def register(self, module, canonical=True):
@@ -48,13 +58,40 @@ class API(object):
                 decorators.on_error(NotImplementedError, 501).decorate_cls(instance)
                 decorators.on_error(BaseException, 500).decorate_cls(instance)
             
+            instance.freeze_methods()
+            
             # in special cases, specifically when somebody needs a detail view
             # but not a collection view, a resource can be routeless
             if instance._meta.parsed_route:
-                self.patterns.append(url(instance._meta.parsed_route, instance.dispatch, name=instance.name))
+                if self.router:
+                    self.router.connect(instance._meta.route, instance.dispatch, instance.name)
+                    self.patterns.append(ReversePattern(instance._meta.parsed_route, instance.dispatch, name=instance.name))
+                else:
+                    self.patterns.append(url(instance._meta.parsed_route, instance.dispatch, name=instance.name))
 
         self.urlconf += patterns('', (self.version, include(self.patterns)))
 
+    def dispatch_async(self, request):
+        """
+        An entry point for servers that can wait on a ``Future`` rather than 
+        a thread: resolves the request's path and hands the request to its
+        resource's ``dispatch_async``. Returns a ``Future`` for the response.
+        
+        (ASGI needs Python 3, where this would be an ``async def`` instead.)
+        """
+        try:
+            view, args, kwargs = resolve(request.path_info)
+        except Resolver404:
+            future = Future()
+            future.set_result(HttpResponseNotFound())
+            return future
+        
+        resource = getattr(view, 'im_self', None)
+        if isinstance(resource, Resource):
+            return resource.dispatch_async(request, **kwargs)
+        else:
+            return get_pool().submit(view, request, *args, **kwargs)
+    
     def unregister(self, resource_name):
         """
         If present, unregisters a resource from the API.
@@ -1,3 +1,140 @@
 # encoding: utf-8
 
-from tastypie.cache import *
\ No newline at end of file
+import time
+from hashlib import md5
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.encoding import smart_str
+from django.utils.http import urlencode
+
+from tastypie.cache import *
+
+from apiserver.utils.conditional import get_variant
+
+# bump whenever the layout of keys or of what's stored under them changes, 
+# so that entries written by an older release are never misread
+KEY_VERSION = 1
+# generation counters should outlive the entries they're used in
+GENERATION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def get_namespace(resource):
+    """
+    Identifies a resource class (or the class of a resource) in cache keys.
+    """
+    if not isinstance(resource, type):
+        resource = type(resource)
+    return "apiserver:%d:%s.%s" % (KEY_VERSION, resource.__module__, resource.__name__)
+
+
+def seed_generation():
+    # seeded from the clock, so a counter that got evicted comes back 
+    # ahead of where it was instead of at a number it's been at before
+    return int(time.time() * 1000000)
+
+
+def get_generation(resource):
+    """
+    Returns the current generation of a resource. Every cache key 
+    for the resource includes it, so bumping it invalidates them all.
+    """
+    key = get_namespace(resource) + ":generation"
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, seed_generation(), GENERATION_TIMEOUT)
+        # somebody else might have gotten there first
+        generation = cache.get(key) or 0
+    return generation
+
+
+def bump_generation(resource):
+    """
+    Invalidates every cache entry for a resource, in constant time.
+    """
+    key = get_namespace(resource) + ":generation"
+    try:
+        return cache.incr(key)
+    except ValueError:
+        generation = seed_generation()
+        cache.set(key, generation, GENERATION_TIMEOUT)
+        return generation
+
+
+def make_key(resource, kind, *bits):
+    """
+    Builds a cache key like 
+    ``apiserver:1:myapp.resources.People:1318846500000000:detail:<hash>``
+    out of the resource class, its current generation, the kind of entry 
+    and a hash of its route and of any other bits that tell entries apart.
+    Dictionaries (like filters) are sorted, so order doesn't matter.
+    """
+    hashed = [unicode(resource._meta.route)]
+    for bit in bits:
+        if isinstance(bit, dict):
+            bit = urlencode(sorted(bit.items()))
+        hashed.append(smart_str(bit))
+
+    # hashed, because memcached doesn't like long keys with spaces
+    digest = md5(smart_str("\n".join(hashed))).hexdigest()
+    return "%s:%d:%s:%s" % (get_namespace(resource), get_generation(resource), kind, digest)
+
+
+class NoResponseCache(object):
+    """
+    A response cache that doesn't cache anything. The default.
+    """
+    def get_key(self, resource, request, filters, format):
+        """
+        Returns ``None``, which tells dispatch not to bother.
+        """
+        return None
+
+
+class ResponseCache(NoResponseCache):
+    """
+    Caches entire responses to GET requests: the serialized content
+    along with its status and headers, so a cache hit doesn't touch
+    the ORM or the serializer at all. HEAD requests are answered from
+    the same cache entries.
+
+    Responses are cached per route, query string, format and, unless
+    ``per_user`` is ``False``, per user as told apart by the resource's
+    authentication. (With the default ``Authentication`` that means per
+    IP address and hostname, so you'll want to switch ``per_user`` off
+    for public resources.)
+
+    Optionally accepts a ``timeout`` in seconds, which defaults to the
+    cache backend's default timeout, and a ``backend``, which defaults
+    to Django's ``CACHE_BACKEND``. Generation counters are always kept
+    in the latter.
+    """
+    def __init__(self, timeout=None, per_user=True, backend=None):
+        self.timeout = timeout
+        self.per_user = per_user
+        self.backend = backend or cache
+
+    def get_scope(self, resource, request):
+        if self.per_user:
+            return resource._meta.authentication.get_identifier(request)
+        else:
+            return ''
+
+    def get_key(self, resource, request, filters, format):
+        # the same variant as in the ETag of the response
+        variant = get_variant(request.GET)
+        return make_key(resource, 'response', filters, variant, format, self.get_scope(resource, request))
+
+    def get(self, key):
+        cached = self.backend.get(key)
+        if cached is None:
+            return None
+
+        status, headers, content = cached
+        response = HttpResponse(content, status=status)
+        for header, value in headers:
+            response[header] = value
+        return response
+
+    def set(self, key, response):
+        self.backend.set(key, (response.status_code, response.items(), response.content), self.timeout)
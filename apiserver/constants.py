@@ -1,3 +1,16 @@
 # encoding: utf-8
 
-from tastypie.constants import *
\ No newline at end of file
+from tastypie.constants import *
+
+# where prefetched related objects are kept on an object
+PREFETCH_CACHE = '_prefetched'
+# how many objects to fetch related objects for at once, when streaming
+PREFETCH_BATCH_SIZE = 100
+# how many dehydration plans for sparse fieldsets a resource keeps
+FIELDSET_PLANS = 64
+# how many rows to insert per statement, when creating objects in bulk
+BULK_INSERT_BATCH_SIZE = 500
+# requests that don't change anything, which a batch can run at the same time
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# how many threads run sync views for `dispatch_async`, by default
+THREAD_POOL_SIZE = 10
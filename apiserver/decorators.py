@@ -1,10 +1,14 @@
 # encoding: utf-8
 
+import inspect
+import sys
 import types
 from functools import wraps
 from django.http import HttpResponse
 from django.conf import settings
 
+from apiserver.utils import Future
+
 class on_view(object):
     def __init__(self, fn):
         self.wrapper = fn
@@ -41,6 +45,9 @@ class on_error(on_view):
     Works on Resource classes as well, in which case
     the class decorator will decorate the 'show', 'create', 
     'update' and 'destroy' methods.
+    
+    Coroutine views only raise once they run, so they're
+    wrapped in a coroutine that catches what they raise.
     """
     
     def __init__(self, *vargs):
@@ -55,6 +62,9 @@ class on_error(on_view):
         self.exceptions = tuple(vargs)
 
     def decorate_fn(self, fn):
+        if inspect.isgeneratorfunction(fn):
+            return self.decorate_coroutine(fn)
+        
         @wraps(fn)
         def safe_fn(*vargs, **kwargs):
             try:
@@ -63,6 +73,34 @@ class on_error(on_view):
                 return self.message(*vargs, **kwargs), self.status
                 
         return safe_fn
+    
+    def decorate_coroutine(self, fn):
+        @wraps(fn)
+        def safe_coroutine(*vargs, **kwargs):
+            # passes on the futures the view waits for, and what 
+            # they come back with, until it yields its result
+            try:
+                coroutine = fn(*vargs, **kwargs)
+                yielded = coroutine.next()
+                while isinstance(yielded, Future):
+                    try:
+                        value = yield yielded
+                    except GeneratorExit:
+                        coroutine.close()
+                        raise
+                    except Exception:
+                        yielded = coroutine.throw(*sys.exc_info())
+                    else:
+                        yielded = coroutine.send(value)
+            except StopIteration:
+                yielded = None
+            except GeneratorExit:
+                raise
+            except self.exceptions:
+                yielded = self.message(*vargs, **kwargs), self.status
+            yield yielded
+        
+        return safe_coroutine
 
 class only(on_view):
     """
@@ -77,7 +115,12 @@ class only(on_view):
         self.methods = methods
     
     def decorate_fn(self, fn):
-        if fn.__name__ in self.methods + ('options',):
+        # HEAD is available wherever GET is
+        allowed = self.methods + ('options',)
+        if 'show' in self.methods:
+            allowed += ('head',)
+        
+        if fn.__name__ in allowed:
             return fn
         else:
             def wrapped_fn(*vargs, **kwargs):
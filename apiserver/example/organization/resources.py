@@ -91,4 +91,9 @@ class People(api.ModelCollection, Person):
     def show(self, request, filters, format):
         organization, filters = api.utils.extract('org', filters)
         filters['organization__name'] = organization.upper()
-        return super(People, self).show(request, filters, format)
\ No newline at end of file
+        return super(People, self).show(request, filters, format)
+
+    def head(self, request, filters, format):
+        organization, filters = api.utils.extract('org', filters)
+        filters['organization__name'] = organization.upper()
+        return super(People, self).head(request, filters, format)
\ No newline at end of file
@@ -8,8 +8,18 @@ class TOC(api.TOC):
         route = ''
         resources = [organization.resources.Organizations]
 
+class Batch(api.Batch):
+    class Meta:
+        route = '/batch'
+
+class Metrics(api.Metrics):
+    class Meta:
+        route = '/metrics'
+
 v1 = api.API('v1')
 v1.register(TOC)
+v1.register(Batch)
+v1.register(Metrics)
 v1.register(organization.resources)
 
 urlpatterns = patterns('',
@@ -1,3 +1,80 @@
 # encoding: utf-8
 
-from tastypie.fields import *
\ No newline at end of file
+from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
+
+from tastypie.fields import *
+from tastypie.bundle import Bundle
+
+from apiserver.constants import PREFETCH_CACHE
+
+
+def resource_from_uri(fk_resource, uri, request=None):
+    """
+    Returns a bundle with the object a URI links to. Hydration only 
+    needs the object, so unlike tastypie, this doesn't dehydrate it.
+    """
+    try:
+        obj = fk_resource.get_via_uri(uri, request=request)
+    except ObjectDoesNotExist:
+        raise ApiFieldError("Could not find the provided object via resource URI '%s'." % uri)
+    except MultipleObjectsReturned:
+        raise ApiFieldError("The resource URI '%s' links to more than one object." % uri)
+    return Bundle(obj=obj, request=request)
+
+
+class ToOneField(ToOneField):
+    def resource_from_uri(self, fk_resource, uri, request=None, related_obj=None, related_name=None):
+        return resource_from_uri(fk_resource, uri, request)
+
+
+class ForeignKey(ToOneField):
+    """
+    A convenience subclass for those who prefer to mirror ``django.db.models``.
+    """
+    pass
+
+
+class OneToOneField(ToOneField):
+    """
+    A convenience subclass for those who prefer to mirror ``django.db.models``.
+    """
+    pass
+
+
+class ToManyField(ToManyField):
+    def resource_from_uri(self, fk_resource, uri, request=None, related_obj=None, related_name=None):
+        return resource_from_uri(fk_resource, uri, request)
+    
+    def dehydrate(self, bundle):
+        """
+        Uses the related objects ``ModelResource.prefetch_related`` fetched 
+        for the whole page if they're there, rather than querying for them.
+        """
+        related = getattr(bundle.obj, PREFETCH_CACHE, {}).get(self.attribute)
+        if related is None:
+            return super(ToManyField, self).dehydrate(bundle)
+        
+        self.m2m_resources = []
+        m2m_dehydrated = []
+        
+        for m2m in related:
+            m2m_resource = self.get_related_resource(m2m)
+            m2m_bundle = Bundle(obj=m2m, request=bundle.request)
+            self.m2m_resources.append(m2m_resource)
+            m2m_dehydrated.append(self.dehydrate_related(m2m_bundle, m2m_resource))
+        
+        return m2m_dehydrated
+
+
+class ManyToManyField(ToManyField):
+    """
+    A convenience subclass for those who prefer to mirror ``django.db.models``.
+    """
+    pass
+
+
+class OneToManyField(ToManyField):
+    """
+    A convenience subclass for those who prefer to mirror ``django.db.models``.
+    """
+    pass
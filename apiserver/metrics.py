@@ -0,0 +1,168 @@
+# encoding: utf-8
+
+import threading
+from bisect import bisect_left
+
+# upper bounds, in milliseconds, of the buckets request latencies are counted in
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram(object):
+    """
+    Counts observations in buckets with fixed upper bounds, 
+    plus one for everything above the last bound.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+    
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def cumulative(self):
+        """
+        Returns ``(upper bound, count)`` pairs, each count including the
+        buckets before it, with ``None`` as the bound of the last bucket.
+        """
+        total = 0
+        pairs = []
+        for bound, count in zip(list(self.buckets) + [None], self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class ResourceMetrics(object):
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.latency = Histogram(buckets)
+        self.statuses = {}
+        self.objects = 0
+        self.queries = 0
+        self.query_time = 0
+        self.repeated = {}
+    
+    def to_dict(self):
+        return {
+            'requests': self.latency.count,
+            'latency': {
+                'buckets': [[bound, count] for bound, count in self.latency.cumulative()],
+                'sum': round(self.latency.sum, 3),
+                'count': self.latency.count,
+                },
+            'statuses': dict((str(status), count) for status, count in self.statuses.items()),
+            'objects': self.objects,
+            'queries': {
+                'count': self.queries,
+                'time': round(self.query_time, 3),
+                'repeated': dict(self.repeated),
+                },
+            }
+
+
+class Registry(object):
+    """
+    Keeps track, per resource, of how long requests take (in milliseconds), 
+    which statuses they get, how many objects get dehydrated and, for 
+    resources that log their queries, how many queries they run and which 
+    fields query once per object, in memory and per process. 
+    
+    Resources report to the registry in their ``Meta.metrics``. 
+    The ``Metrics`` resource shows what's in it.
+    
+    Requests that authentication or throttling turn away aren't counted
+    separately: ``dispatch`` leaves those checks to the views (only 
+    ``Batch`` makes them), and their responses count by status anyway.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.resources = {}
+        self.lock = threading.Lock()
+    
+    def get(self, name):
+        # (only ever called with the lock held)
+        if not name in self.resources:
+            self.resources[name] = ResourceMetrics(self.buckets)
+        return self.resources[name]
+    
+    def observe(self, name, status, milliseconds):
+        """
+        Records a request that got a response.
+        """
+        with self.lock:
+            metrics = self.get(name)
+            metrics.latency.observe(milliseconds)
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+    
+    def dehydrated(self, name, count=1):
+        with self.lock:
+            self.get(name).objects += count
+    
+    def queried(self, name, log):
+        """
+        Records the queries in a ``querylog.QueryLog``, and the fields
+        that ran a query once per object.
+        """
+        repeated = set([field for field, shape, count in log.repeated()])
+        with self.lock:
+            metrics = self.get(name)
+            metrics.queries += log.count
+            metrics.query_time += log.time
+            for field in repeated:
+                metrics.repeated[field] = metrics.repeated.get(field, 0) + 1
+    
+    def reset(self):
+        with self.lock:
+            self.resources = {}
+    
+    def to_dict(self):
+        with self.lock:
+            return {'resources': dict((name, metrics.to_dict()) 
+                for name, metrics in self.resources.items())}
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus(data):
+    """
+    Renders what ``Registry.to_dict`` returns in Prometheus' text format.
+    Latencies are converted to seconds, as Prometheus prefers.
+    """
+    latency = ['# HELP apiserver_request_duration_seconds How long requests took.',
+        '# TYPE apiserver_request_duration_seconds histogram']
+    statuses = ['# HELP apiserver_responses_total Responses, by status code.',
+        '# TYPE apiserver_responses_total counter']
+    objects = ['# HELP apiserver_dehydrated_objects_total Objects dehydrated for responses.',
+        '# TYPE apiserver_dehydrated_objects_total counter']
+    queries = ['# HELP apiserver_queries_total SQL queries run, by resources that log them.',
+        '# TYPE apiserver_queries_total counter']
+    query_time = ['# HELP apiserver_query_duration_seconds_total Time spent running those queries.',
+        '# TYPE apiserver_query_duration_seconds_total counter']
+    repeated = ['# HELP apiserver_repeated_queries_total Requests in which a field ran a query once per object.',
+        '# TYPE apiserver_repeated_queries_total counter']
+    
+    for name, metrics in sorted(data['resources'].items()):
+        label = 'resource="%s"' % escape(name)
+        for bound, count in metrics['latency']['buckets']:
+            le = bound is None and '+Inf' or repr(bound / 1000.0)
+            latency.append('apiserver_request_duration_seconds_bucket{%s,le="%s"} %d' % (label, le, count))
+        latency.append('apiserver_request_duration_seconds_sum{%s} %r' % (label, metrics['latency']['sum'] / 1000.0))
+        latency.append('apiserver_request_duration_seconds_count{%s} %d' % (label, metrics['latency']['count']))
+        for status, count in sorted(metrics['statuses'].items()):
+            statuses.append('apiserver_responses_total{%s,status="%s"} %d' % (label, status, count))
+        objects.append('apiserver_dehydrated_objects_total{%s} %d' % (label, metrics['objects']))
+        queries.append('apiserver_queries_total{%s} %d' % (label, metrics['queries']['count']))
+        query_time.append('apiserver_query_duration_seconds_total{%s} %r' % (label, metrics['queries']['time'] / 1000.0))
+        for field, count in sorted(metrics['queries']['repeated'].items()):
+            repeated.append('apiserver_repeated_queries_total{%s,field="%s"} %d' % (label, escape(field), count))
+    
+    return '\n'.join(latency + statuses + objects + queries + query_time + repeated) + '\n'
+
+
+# the registry the `Metrics` resource shows, unless it's given another
+registry = Registry()
@@ -6,6 +6,8 @@ from tastypie.cache import NoCache
 from tastypie.throttle import BaseThrottle
 from tastypie.validation import Validation
 
+from apiserver.cache import NoResponseCache
+from apiserver.paginator import Paginator, ExactCount
 from apiserver.serializers import Serializer
 
 # options that work in tastypie but have been removed from apiserver:
@@ -26,9 +28,14 @@ class ResourceOptions(object):
     authentication = Authentication()
     authorization = ReadOnlyAuthorization()
     cache = NoCache()
+    response_cache = NoResponseCache()
     throttle = BaseThrottle()
     validation = Validation()
     limit = getattr(settings, 'API_LIMIT_PER_PAGE', 20)
+    # or `CursorPaginator`, for big collections
+    paginator_class = Paginator
+    # or `CachedCount()`, `EstimatedCount()` or `NoCount()`
+    count_strategy = ExactCount()
     route = None
     default_format = 'application/json'
     filtering = {}
@@ -39,9 +46,32 @@ class ResourceOptions(object):
     excludes = []
     include_resource_uri = True
     include_absolute_url = False
+    # a timestamp or version attribute, for conditional GET
+    version = None
+    # serialize collections object by object, as they're sent
+    stream = False
+    # a `TimingSink` that gets how long every request took, per phase
+    timing_sink = None
+    # whether to send that timing along in a `Server-Timing` header
+    server_timing = False
+    # a `metrics.Registry` to report latency, statuses and dehydrated
+    # objects to, e.g. `apiserver.metrics.registry`
+    metrics = None
+    # whether to log the SQL of every request and look for fields that
+    # query once per object; the log goes to the metrics and the timing
+    # sink, and, with `DEBUG` on, into the meta of collections
+    query_log = False
+    # the unique field that PUT on a collection matches objects on
+    match_on = 'pk'
+    # filled in for model resources, based on their related fields
+    select_related = []
+    prefetch = []
     
     # only applies to TOC resource
     resources = []
+    # only applies to Batch resource
+    max_batch_size = 50
+    max_batch_concurrency = 4
     
     # only here for compatibility / deprecated
     api_name = None
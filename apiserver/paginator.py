@@ -1,3 +1,325 @@
 # encoding: utf-8
 
-from tastypie.paginator import *
\ No newline at end of file
+import base64
+import binascii
+import datetime
+import re
+from decimal import Decimal
+from hashlib import md5
+from urllib import urlencode
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.utils import simplejson
+from django.utils.encoding import smart_str
+
+from tastypie.paginator import *
+from tastypie.exceptions import BadRequest
+
+from apiserver.utils.objects import traverse
+
+
+def encode_value(value):
+    # unlike `DjangoJSONEncoder`, keeps microseconds, which 
+    # matter when they're what tells two objects apart
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time, Decimal)):
+        return str(value)
+    raise TypeError("%r is not JSON serializable" % value)
+
+
+def count(objects):
+    try:
+        return objects.count()
+    except (AttributeError, TypeError):
+        # If it's not a QuerySet (or it's ilk), fallback to ``len``.
+        return len(objects)
+
+
+def get_sql(objects):
+    """
+    Returns the SQL and parameters for a queryset, minus its ordering,
+    or ``None`` if Django can tell the queryset is empty without asking.
+    """
+    try:
+        return objects.order_by().query.get_compiler(objects.db).as_sql()
+    except EmptyResultSet:
+        return None
+
+
+def explain_estimate(objects):
+    """
+    Asks PostgreSQL's planner how many rows a queryset will return,
+    which costs next to nothing but can be well off the mark for 
+    complicated filters. Returns ``None`` for other databases.
+    """
+    connection = connections[objects.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    query = get_sql(objects)
+    if query is None:
+        return 0
+
+    sql, params = query
+    cursor = connection.cursor()
+    cursor.execute('EXPLAIN ' + sql, params)
+    plan = cursor.fetchone()[0]
+    match = re.search(r'rows=(\d+)', plan)
+    return match and int(match.group(1)) or None
+
+
+class ExactCount(object):
+    """
+    Counts every object, every time. Accurate, but on big tables
+    the count can take longer than fetching the page itself.
+    """
+    name = 'exact'
+    # whether the count can be trusted to tell if there's a next page
+    exact = True
+
+    def count(self, objects):
+        return count(objects)
+
+
+class CachedCount(ExactCount):
+    """
+    Counts objects exactly, then reuses that count for ``timeout`` 
+    seconds for any request that filters the objects the same way.
+    Objects added or removed in the meantime don't show up in the 
+    count, though they do on the pages themselves.
+    """
+    name = 'cached'
+    exact = False
+
+    def __init__(self, timeout=60, backend=None):
+        self.timeout = timeout
+        self.backend = backend or cache
+
+    def get_key(self, objects, sql=None):
+        """
+        Returns the cache key for the count of a queryset, going by its
+        SQL, which can be passed in if it's been compiled already.
+        """
+        sql, params = sql or get_sql(objects)
+        digest = md5(smart_str(sql) + smart_str(repr(params))).hexdigest()
+        return "apiserver:count:%s.%s:%s" % (
+            objects.model._meta.app_label, objects.model._meta.object_name, digest)
+
+    def count(self, objects):
+        sql = hasattr(objects, 'query') and get_sql(objects)
+        if not sql:
+            return count(objects)
+
+        key = self.get_key(objects, sql)
+        total = self.backend.get(key)
+        if total is None:
+            total = count(objects)
+            self.backend.set(key, total, self.timeout)
+        return total
+
+
+class EstimatedCount(ExactCount):
+    """
+    Gets the count from an ``estimator``, a function that takes a 
+    queryset and returns a guess at how many objects are in it, 
+    or ``None`` if it can't tell. The default, ``explain_estimate``,
+    asks the database's query planner.
+    
+    Estimates below ``threshold`` are replaced with an exact count, 
+    which is cheap at that size and where being off shows the most.
+    """
+    name = 'estimated'
+    exact = False
+
+    def __init__(self, estimator=explain_estimate, threshold=1000):
+        self.estimator = estimator
+        self.threshold = threshold
+
+    def count(self, objects):
+        if not hasattr(objects, 'query'):
+            return count(objects)
+
+        estimate = self.estimator(objects)
+        if estimate is None or estimate < self.threshold:
+            return count(objects)
+        return estimate
+
+
+class NoCount(object):
+    """
+    Doesn't count at all. The paginator fetches a single object beyond
+    the page instead, to find out whether there's a next one.
+    """
+    name = 'none'
+    exact = False
+
+    def count(self, objects):
+        return None
+
+
+class Paginator(Paginator):
+    """
+    Like tastypie's ``Paginator``, but with a pluggable ``count_strategy``
+    that ``page`` names in the meta it returns. Unless the count is 
+    exact, whether there's a next page is decided by fetching one
+    object more than the limit.
+    """
+    def __init__(self, request_data, objects, resource_uri=None, limit=None, offset=0, count_strategy=None):
+        super(Paginator, self).__init__(request_data, objects, resource_uri, limit, offset)
+        self.count_strategy = count_strategy or ExactCount()
+
+    def get_count(self):
+        return self.count_strategy.count(self.objects)
+
+    def page(self):
+        limit = self.get_limit()
+        offset = self.get_offset()
+        count = self.get_count()
+        meta = {
+            'offset': offset,
+            'limit': limit,
+            'total_count': count,
+            'count_strategy': self.count_strategy.name,
+        }
+
+        if not limit:
+            objects = self.get_slice(limit, offset)
+        elif self.count_strategy.exact:
+            objects = self.get_slice(limit, offset)
+            meta['previous'] = self.get_previous(limit, offset)
+            meta['next'] = self.get_next(limit, offset, count)
+        else:
+            objects = list(self.get_slice(limit + 1, offset))
+            meta['previous'] = self.get_previous(limit, offset)
+            meta['next'] = None
+            if len(objects) > limit:
+                meta['next'] = self._generate_uri(limit, offset + limit)
+            objects = objects[:limit]
+
+        return {
+            'objects': objects,
+            'meta': meta,
+        }
+
+
+class CursorPaginator(Paginator):
+    """
+    Pages through objects by remembering where the previous page stopped
+    rather than by counting how many objects to skip, so any page costs
+    the same as the first and pages don't shift when objects are added.
+
+    The objects are paged on their ordering (the queryset's ``order_by``
+    or otherwise the model's default ordering) with the primary key added
+    at the end to make it unique, so that ordering should be indexed.
+    Fields that can be NULL can't be paged on: nothing compares greater
+    or smaller than NULL, so a cursor that stops on one goes nowhere.
+    Clients get an opaque ``cursor`` in the link to the next page; there
+    are no offsets, no links back and no total count.
+
+    Pages hold at most ``max_limit`` objects. A limit of 0, which other
+    paginators take to mean everything, gets the largest page there is.
+    """
+    max_limit = 1000
+
+    def get_limit(self):
+        limit = super(CursorPaginator, self).get_limit()
+        if limit == 0 or limit > self.max_limit:
+            return self.max_limit
+        return limit
+
+    def get_offset(self):
+        if 'offset' in self.request_data:
+            raise BadRequest("This collection is paged using cursors rather than offsets. Please follow the link in 'next'.")
+        return 0
+
+    def get_ordering(self):
+        ordering = list(self.objects.query.order_by) or list(self.objects.model._meta.ordering)
+        pk_name = self.objects.model._meta.pk.name
+        if not [field for field in ordering if field.lstrip('-') in ('pk', pk_name)]:
+            ordering.append('pk')
+        for field in ordering:
+            if self.is_nullable(field.lstrip('-')):
+                raise BadRequest("Can't page through objects ordered on '%s', which can be empty." % field)
+        return ordering
+
+    def is_nullable(self, name):
+        """
+        Whether a (possibly related) ordering field can come out as NULL,
+        either because it's nullable or because a relationship on the
+        way there is. Reverse relationships always can.
+        """
+        model = self.objects.model
+        for part in name.split('__'):
+            if part == 'pk':
+                field = model._meta.pk
+            else:
+                field = model._meta.get_field_by_name(part)[0]
+            if not hasattr(field, 'null') or field.null:
+                return True
+            if field.rel:
+                model = field.rel.to
+        return False
+
+    def encode_cursor(self, obj, ordering):
+        values = [traverse(obj, field.lstrip('-')) for field in ordering]
+        return base64.urlsafe_b64encode(simplejson.dumps(values, default=encode_value))
+
+    def decode_cursor(self, cursor, ordering):
+        try:
+            values = simplejson.loads(base64.urlsafe_b64decode(str(cursor)))
+        except (TypeError, ValueError, binascii.Error):
+            values = None
+
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise BadRequest("Invalid cursor '%s' provided." % cursor)
+        return values
+
+    def get_slice(self, limit, ordering):
+        """
+        Returns the objects after the cursor, if any, and a single
+        object beyond those, which tells us whether there's a next page.
+        """
+        objects = self.objects.order_by(*ordering)
+
+        cursor = self.request_data.get('cursor')
+        if cursor:
+            values = self.decode_cursor(cursor, ordering)
+            # (a > x) or (a = x and b > y) or (a = x and b = y and c > z)
+            after = Q()
+            for i, field in enumerate(ordering):
+                name = field.lstrip('-')
+                if field.startswith('-'):
+                    condition = Q(**{name + '__lt': values[i]})
+                else:
+                    condition = Q(**{name + '__gt': values[i]})
+                for previous, value in zip(ordering[:i], values):
+                    condition &= Q(**{previous.lstrip('-'): value})
+                after |= condition
+            objects = objects.filter(after)
+
+        return list(objects[:limit + 1])
+
+    def get_next(self, limit, objects, ordering):
+        if len(objects) <= limit or self.resource_uri is None:
+            return None
+
+        request_params = dict([k, v.encode('utf-8')] for k, v in self.request_data.items())
+        request_params.update({'limit': limit, 'cursor': self.encode_cursor(objects[limit - 1], ordering)})
+        return '%s?%s' % (self.resource_uri, urlencode(request_params))
+
+    def page(self):
+        limit = self.get_limit()
+        self.get_offset()
+        ordering = self.get_ordering()
+        objects = self.get_slice(limit, ordering)
+        meta = {
+            'limit': limit,
+            'next': self.get_next(limit, objects, ordering),
+        }
+
+        return {
+            'objects': objects[:limit],
+            'meta': meta,
+        }
@@ -0,0 +1,183 @@
+# encoding: utf-8
+
+import re
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'(?<![\w".])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b')
+VALUES = re.compile(r'\((?:\?, )+\?\)')
+SPACE = re.compile(r'\s+')
+
+_local = threading.local()
+
+
+def normalize(sql):
+    """
+    Returns the shape of an SQL statement: the statement with its literals
+    replaced with ``?`` and any list of values (as in ``IN (1, 2, 3)``)
+    with ``(...)``, so statements that differ only in what they're looking
+    for come out the same.
+    """
+    sql = STRING.sub('?', sql)
+    sql = NUMBER.sub('?', sql)
+    sql = VALUES.sub('(...)', sql)
+    return SPACE.sub(' ', sql).strip()
+
+
+class QueryLog(object):
+    """
+    The SQL statements run during a single request: how many, how long
+    they took (in milliseconds) and what shape they had.
+
+    Statements are captured through Django's own debug cursor, which
+    is turned on while the log ``capture``s, whether or not ``DEBUG``
+    is. Database connections are per thread, and so is capturing: a
+    request that moves between threads is captured on each in turn.
+
+    Resources tell the log which field they're dehydrating (see
+    ``enter``, ``mark`` and ``blame``) so that statements that run
+    once for every object can be traced back to the field that runs them.
+    """
+    def __init__(self, databases=None):
+        self.databases = databases
+        self.connections = []
+        self.captured = []
+        self.depth = 0
+        self.objects = 0
+
+    def capture(self):
+        """
+        Starts capturing the statements run on the current thread.
+        """
+        self.connections = self.databases or connections.all()
+        self.offsets = self.mark()
+        self.debug = [connection.use_debug_cursor for connection in self.connections]
+        for connection in self.connections:
+            connection.use_debug_cursor = True
+        self.fields = {}
+
+    def release(self):
+        """
+        Stops capturing statements on the current thread. What would
+        otherwise not have been kept in ``connection.queries`` is taken
+        out of it again.
+        """
+        self.captured = self.get_statements()
+        for connection, debug, offset in zip(self.connections, self.debug, self.offsets):
+            connection.use_debug_cursor = debug
+            if not (debug or (debug is None and settings.DEBUG)):
+                del connection.queries[offset:]
+        self.connections = []
+
+    def mark(self):
+        return [len(connection.queries) for connection in self.connections]
+
+    def enter(self):
+        """
+        Starts dehydrating an object. Only objects at the top level count,
+        not those embedded in them.
+        """
+        self.depth += 1
+        if self.depth == 1:
+            self.objects += 1
+
+    def exit(self):
+        self.depth -= 1
+
+    def blame(self, mark, field):
+        """
+        Attributes the statements run since ``mark`` to a top-level field.
+        """
+        if self.depth != 1:
+            return
+        for i, connection in enumerate(self.connections):
+            for j in range(mark[i], len(connection.queries)):
+                self.fields[i, j] = field
+
+    def get_statements(self):
+        """
+        Returns the statements run so far, as ``(shape, milliseconds, field)``
+        tuples, with ``field`` the field they were run for, if any.
+        """
+        statements = list(self.captured)
+        for i, connection in enumerate(self.connections):
+            for j, query in enumerate(connection.queries[self.offsets[i]:], self.offsets[i]):
+                statements.append((normalize(query['sql']),
+                    float(query['time']) * 1000, self.fields.get((i, j))))
+        return statements
+
+    @property
+    def count(self):
+        return len(self.get_statements())
+
+    @property
+    def time(self):
+        return sum([milliseconds for shape, milliseconds, field in self.get_statements()])
+
+    def shapes(self):
+        """
+        Returns ``(shape, count, milliseconds)`` for every shape of
+        statement, the most frequent first.
+        """
+        shapes = {}
+        for shape, milliseconds, field in self.get_statements():
+            count, total = shapes.get(shape, (0, 0))
+            shapes[shape] = (count + 1, total + milliseconds)
+        return sorted([(shape, count, total) for shape, (count, total) in shapes.items()],
+            key=lambda item: (-item[1], item[0]))
+
+    def repeated(self):
+        """
+        Returns ``(field, shape, count)`` for statements that were run at
+        least once for every object that was dehydrated, when there was more
+        than one: the telltale sign of a field that queries per object,
+        rather than once for all of them.
+        """
+        if self.objects < 2:
+            return []
+
+        counts = {}
+        for shape, milliseconds, field in self.get_statements():
+            if field is not None:
+                counts[field, shape] = counts.get((field, shape), 0) + 1
+        return sorted([(field, shape, count) for (field, shape), count in counts.items()
+            if count >= self.objects])
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'time': round(self.time, 3),
+            'objects': self.objects,
+            'shapes': [{'sql': shape, 'count': count, 'time': round(total, 3)}
+                for shape, count, total in self.shapes()],
+            'repeated': [{'field': field, 'sql': shape, 'count': count}
+                for field, shape, count in self.repeated()],
+            }
+
+
+def resume(log):
+    """
+    Logs the queries run on the current thread to ``log``, which may
+    have started on another thread. Returns the log they went to 
+    before, to hand to ``suspend``.
+    """
+    log.capture()
+    previous = getattr(_local, 'log', None)
+    _local.log = log
+    return previous
+
+
+def suspend(log, previous):
+    log.release()
+    _local.log = previous
+
+
+def current():
+    """
+    Returns the ``QueryLog`` of the request on this thread,
+    or ``None`` if its queries aren't being logged.
+    """
+    return getattr(_local, 'log', None)
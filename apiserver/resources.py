@@ -3,21 +3,32 @@
 import logging
 import inspect
 import re
+import sys
+import time
+import types
 
 from copy import copy
 
+from django.conf import settings
 from django.conf.urls.defaults import patterns, url
-from django.http import HttpResponse, HttpResponseRedirect
-from django.core.exceptions import ObjectDoesNotExist
-from django.core.urlresolvers import reverse, NoReverseMatch
+from django.db import router, transaction, DatabaseError
+from django.db.models import signals
+from django.http import HttpRequest, HttpResponse, HttpResponseRedirect, HttpResponseNotModified, QueryDict
+from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned, ImproperlyConfigured, ValidationError
+from django.core.urlresolvers import reverse, resolve, NoReverseMatch, Resolver404
 
+import mimeparse
 from surlex import surlex_to_regex
 import django_filters as filters
 from tastypie import resources as tastypie
 
-from apiserver import bundle, dispatch, serializers, utils, options
-from apiserver.paginator import Paginator
+from apiserver import bundle, cache, dispatch, serializers, utils, options, timing, metrics, querylog
+from apiserver.utils import conditional
+from apiserver.decorators import only
+from apiserver.exceptions import BadRequest, ApiFieldError, ImmediateHttpResponse
+from apiserver.paginator import Paginator, CursorPaginator
 from apiserver.fields import *
+from apiserver.http import *
 from apiserver.constants import *
 
 try:
@@ -39,6 +50,153 @@ log = logging.getLogger("apiserver")
 class r(str):
     pass
 
+def unpack(retval):
+    """
+    Views may return a status code in addition to a structured response; 
+    they may also return just a status code or just a response.
+    
+    Returns a ``(raw_response, status)`` tuple either way.
+    """
+    if isinstance(retval, tuple):
+        return retval
+    elif isinstance(retval, int):
+        return {}, retval
+    else:
+        return retval, 200
+
+class Measurement(object):
+    """
+    What a resource measures of a request, as configured in its ``Meta``: 
+    how long it took, per phase, and what SQL it ran, reported to its 
+    metrics, its timing sink and a ``Server-Timing`` header once there's 
+    a response.
+    
+    Timing and query logs are kept per thread, so the measurement is only
+    taken on the thread it's ``resume``d on, until it's ``suspend``ed.
+    """
+    def __init__(self, resource, request):
+        self.resource = resource
+        self.request = request
+        self.start = time.time()
+        meta = resource._meta
+        timed = meta.timing_sink is not None or meta.server_timing
+        self.timing = timed and timing.Timing() or None
+        self.queries = meta.query_log and querylog.QueryLog() or None
+        self.previous = None, None
+    
+    def resume(self):
+        previous_timing = previous_queries = None
+        if self.timing:
+            previous_timing = timing.resume(self.timing)
+        if self.queries:
+            previous_queries = querylog.resume(self.queries)
+        self.previous = previous_timing, previous_queries
+    
+    def suspend(self):
+        previous_timing, previous_queries = self.previous
+        if self.queries:
+            querylog.suspend(self.queries, previous_queries)
+        if self.timing:
+            timing.suspend(previous_timing)
+    
+    def report(self, response=None):
+        """
+        Reports the request as done; without a response, as failed.
+        """
+        meta = self.resource._meta
+        name = self.resource.name
+        if self.timing:
+            self.timing.stop()
+        
+        if meta.metrics is not None:
+            status = response is not None and response.status_code or 500
+            meta.metrics.observe(name, status, (time.time() - self.start) * 1000)
+            if response is not None and self.queries:
+                meta.metrics.queried(name, self.queries)
+        if response is None or not self.timing:
+            return response
+        
+        self.timing.queries = self.queries
+        
+        if meta.server_timing:
+            response['Server-Timing'] = self.timing.to_header()
+        if meta.timing_sink is not None:
+            meta.timing_sink.record(self.resource, self.request, response, self.timing)
+        return response
+
+# the fields whose ``convert`` does the same for a raw column value as it
+# does for the attribute of an object, unlike, say, ``FileField``'s
+ROW_CONVERSIONS = set([field.convert.im_func for field in (ApiField, CharField, 
+    IntegerField, FloatField, DecimalField, BooleanField, DateField, DateTimeField, TimeField)])
+
+def is_stock(resource, name, base):
+    """
+    Tells whether a resource's method is still the one ``base`` comes with,
+    rather than an override on its class or on the resource itself.
+    """
+    method = getattr(resource, name)
+    return getattr(method, 'im_func', None) is getattr(base, name).im_func
+
+def is_unchanged(field, old, new):
+    """
+    Tells whether a model field's value stayed the same, going by 
+    its Python value rather than by what a client sent.
+    """
+    try:
+        return field.to_python(old) == field.to_python(new)
+    except ValidationError:
+        return False
+
+def save_changes(obj, columns, before, using):
+    """
+    Saves an existing object through its ``save`` method, so whatever that
+    does (like keeping a timestamp) still happens, but only UPDATEs the
+    ``columns`` that differ from their values ``before``, including those
+    that ``save`` or a field's ``pre_save`` (``auto_now``) changed.
+    ``pre_save`` and ``post_save`` are sent, as with any save. Columns
+    inherited from a parent model are UPDATEd in the parent's table.
+    """
+    model = type(obj)
+
+    def save_base(**kwargs):
+        signals.pre_save.send(sender=model, instance=obj, raw=False, using=using)
+        values = {}
+        for field, value in zip(columns, before):
+            new = field.pre_save(obj, False)
+            if not is_unchanged(field, value, new):
+                values[field.name] = new
+        if values:
+            model._default_manager.db_manager(using).filter(pk=obj.pk).update(**values)
+        obj._state.db = using
+        signals.post_save.send(sender=model, instance=obj, created=False, raw=False, using=using)
+
+    # `Model.save` hands over to `save_base`, which would save every column
+    obj.save_base = save_base
+    try:
+        obj.save(using=using)
+    finally:
+        del obj.save_base
+
+def compile_dehydration(resource_class):
+    """
+    Works out once, for every field of a resource class, which key it 
+    dehydrates to and which ``dehydrate_<field>`` hook, if any, runs 
+    after it, so ``full_dehydrate`` doesn't have to look them up for 
+    every object. Returns a list of ``(key, hook name)`` tuples.
+    """
+    plan = []
+    for field_name, field_object in resource_class.base_fields.items():
+        # A touch leaky but it makes URI resolution work.
+        if isinstance(field_object, RelatedField):
+            field_object.api_name = resource_class._meta.api_name
+            field_object.resource_name = resource_class._meta.resource_name
+        
+        hook = "dehydrate_%s" % field_name
+        if not callable(getattr(resource_class, hook, None)):
+            hook = None
+        plan.append((field_name, hook))
+    return plan
+
 class DeclarativeMetaclass(type):
     def __new__(cls, name, bases, attrs):
         attrs['base_fields'] = {}
@@ -67,6 +225,13 @@ class DeclarativeMetaclass(type):
         opts = getattr(new_class, 'Meta', None)
         new_class._meta = options.ResourceOptions(opts)
         
+        # compile the route into a template for building URIs
+        route = new_class._meta.route
+        if route is None:
+            new_class._meta.uri_template = None
+        else:
+            new_class._meta.uri_template = utils.URITemplate(name, route, raw=isinstance(route, r))
+        
         if getattr(new_class._meta, 'include_resource_uri', True):
             if not 'resource_uri' in new_class.base_fields:
                 new_class.base_fields['resource_uri'] = CharField(readonly=True)
@@ -77,6 +242,7 @@ class DeclarativeMetaclass(type):
             if hasattr(field_object, 'contribute_to_class'):
                 field_object.contribute_to_class(new_class, field_name)
         
+        new_class._meta.dehydration_plan = compile_dehydration(new_class)
         return new_class
 
 
@@ -95,7 +261,7 @@ class Resource(object):
     __metaclass__ = DeclarativeMetaclass
 
     method_mapping = {
-        'HEAD': 'show',
+        'HEAD': 'head',
         'GET': 'show',
         'POST': 'create',
         'PUT': 'update',
@@ -125,6 +291,12 @@ class Resource(object):
         self._parse_route()
         # fields
         self.fields = deepcopy(self.base_fields)
+        # the dehydration plan, bound to this resource's fields and hooks
+        self._dehydration_plan = [
+            (key, self.fields[key].dehydrate, hook and getattr(self, hook))
+            for key, hook in self._meta.dehydration_plan]
+        self._fieldset_plans = {}
+        self._row_plans = {}
     
     def __getattr__(self, name):
         if name in self.fields:
@@ -135,8 +307,14 @@ class Resource(object):
     def name(self):
         return self.__class__.__name__
 
+    # a frozen copy of `methods`, see `freeze_methods`
+    _methods = None
+
     @property
     def methods(self):
+        if self._methods is not None:
+            return self._methods
+        
         mapping = copy(self.method_mapping)
         for method, fn in self.method_mapping.items():
             view = getattr(self, fn)
@@ -146,6 +324,17 @@ class Resource(object):
                 mapping[method] = view
         
         return mapping
+
+    def freeze_methods(self):
+        """
+        Computes the mapping of HTTP methods to views once, so dispatch
+        doesn't have to look them up on every request.
+        
+        Called by ``API.register`` after any decorators have been
+        applied. Views that are swapped out afterwards won't be picked up.
+        """
+        self._methods = None
+        self._methods = utils.frozendict(self.methods)
   
     # not decided yet on whether to do this like Tastypie or differently
     def wrap_view(self, view):
@@ -178,6 +367,7 @@ class Resource(object):
         version suitable for transfer over the wire.
         
         Mostly a hook, this uses the ``Serializer`` from ``Resource._meta``.
+        Streaming resources get an iterator of chunks instead of a string.
         """
         options = options or {}
         
@@ -190,7 +380,10 @@ class Resource(object):
             
             options['callback'] = callback
         
-        return self._meta.serializer.serialize(data, format, options)
+        if self._meta.stream:
+            return self._meta.serializer.stream(data, format, options)
+        else:
+            return self._meta.serializer.serialize(data, format, options)
     
     def deserialize(self, request, data, format='application/json'):
         """
@@ -208,30 +401,187 @@ class Resource(object):
         Handles the common operations (allowed HTTP method, authentication,
         throttling, method lookup) surrounding most CRUD interactions.
         """
-        if request.method in self.methods:
-            view = self.methods[request.method]
-        else:
+        view = self.methods.get(request.method)
+        if view is None:
             raise NotImplementedError()
         
+        timed = self._meta.timing_sink is not None or self._meta.server_timing
+        if not timed and self._meta.metrics is None and not self._meta.query_log:
+            return self.dispatch_view(request, view, kwargs)
+        
+        measurement = Measurement(self, request)
+        measurement.resume()
+        try:
+            response = self.dispatch_view(request, view, kwargs, measurement)
+        except Exception:
+            measurement.suspend()
+            measurement.report()
+            raise
+        measurement.suspend()
+        return measurement.report(response)
+    
+    def dispatch_view(self, request, view, kwargs, measurement=None):
+        """
+        Does the actual work of ``dispatch`` for a ``view``, other 
+        than measuring it.
+        """
         raw_format, kwargs = utils.extract('__format', kwargs)
+        format = self.determine_format(request, raw_format)
+        
+        response, cache_key, validators = self.precheck(request, kwargs, format)
+        if response is not None:
+            return response
+        
         retval = view(request, kwargs, raw_format)
+        # coroutine views work here too, they just hold on to the thread
+        # (while the threads they're picked up on do the measuring)
+        if isinstance(retval, types.GeneratorType):
+            if measurement is None:
+                retval = utils.run_coroutine(retval).result()
+            else:
+                measurement.suspend()
+                try:
+                    retval = utils.run_coroutine(retval, 
+                        measurement.resume, measurement.suspend).result()
+                finally:
+                    measurement.resume()
+        return self.respond(request, retval, format, cache_key, validators)
+    
+    def is_coroutine(self, method):
+        """
+        Tells whether the view for an HTTP method is a coroutine: a generator
+        that yields ``Future`` instances to wait for and then yields its 
+        result. (Python 2 has no ``async def``.)
+        """
+        name = self.method_mapping.get(method)
+        return name is not None and inspect.isgeneratorfunction(getattr(type(self), name, None))
+    
+    def dispatch_async(self, request, **kwargs):
+        """
+        Like ``dispatch``, but returns a ``Future`` for the response rather 
+        than the response itself. 
+        
+        Coroutine views run until they wait for something, and are then 
+        picked up again by whichever thread finishes what they're waiting 
+        for, so they don't tie up a thread in the meantime. Other views 
+        are dispatched as usual, on a thread from the shared pool.
+        """
+        if not self.is_coroutine(request.method):
+            return utils.get_pool().submit(self.dispatch, request, **kwargs)
+        
+        view = self.methods.get(request.method)
+        if view is None:
+            raise NotImplementedError()
+        
+        raw_format, kwargs = utils.extract('__format', kwargs)
+        measurement = Measurement(self, request)
+        future = utils.Future()
         
-        # views may return a status code in addition to a structured response; 
-        # they may also return just a status code or just a response;
-        # for true customization, we can also deal with a regular HttpResponse
-        if isinstance(retval, tuple):
-            raw_response, status = retval
-        elif isinstance(retval, int):
-            status = retval
-            raw_response = {}
-        elif isinstance(retval, HttpResponse):
+        measurement.resume()
+        try:
+            format = self.determine_format(request, raw_format)
+            response, cache_key, validators = self.precheck(request, kwargs, format)
+        except Exception:
+            measurement.suspend()
+            measurement.report()
+            raise
+        measurement.suspend()
+        if response is not None:
+            future.set_result(measurement.report(response))
+            return future
+        
+        def finish(coroutine):
+            measurement.resume()
+            try:
+                response = self.respond(request, coroutine.result(), format, cache_key, validators)
+            except Exception:
+                measurement.suspend()
+                measurement.report()
+                future.set_exception(sys.exc_info())
+            else:
+                measurement.suspend()
+                future.set_result(measurement.report(response))
+        
+        coroutine = view(request, kwargs, raw_format)
+        utils.run_coroutine(coroutine, measurement.resume, measurement.suspend).add_done_callback(finish)
+        return future
+    
+    def precheck(self, request, filters, format):
+        """
+        Answers a request without calling its view, if the response cache
+        or the client's copy of the resource can do that. Returns a 
+        ``(response, cache key, validators)`` tuple; the response is 
+        ``None`` if it's up to the view after all.
+        """
+        # resources with a response cache can skip everything below; 
+        # HEAD requests are answered from cached GET responses
+        cache_key = None
+        if request.method in ('GET', 'HEAD'):
+            cache_key = self._meta.response_cache.get_key(self, request, filters, format)
+        if cache_key:
+            response = self._meta.response_cache.get(cache_key)
+            if response is not None:
+                validators = conditional.get_response_validators(response)
+                if conditional.not_modified(request, *validators):
+                    return conditional.add_validators(HttpResponseNotModified(), *validators), None, None
+                if request.method == 'HEAD':
+                    response.content = ''
+                return response, None, None
+        
+        # conditional GET: if the resource is versioned, a narrow lookup 
+        # of its version tells us whether the client's copy is still
+        # fresh, before we go and fetch the whole thing; if there's no
+        # copy to check, GET takes its version from the object it fetches
+        # (see ``respond``), so only HEAD needs the lookup
+        validators = None
+        if self._meta.version and (request.method == 'HEAD' or 
+                request.method == 'GET' and conditional.is_conditional(request)):
+            with timing.phase('query'):
+                version = self.get_version(request, filters)
+            if version is not None:
+                validators = conditional.get_validators(version, format, conditional.get_variant(request.GET))
+                if conditional.not_modified(request, *validators):
+                    return conditional.add_validators(HttpResponseNotModified(), *validators), None, None
+        
+        return None, cache_key, validators
+    
+    def respond(self, request, retval, format, cache_key=None, validators=None):
+        """
+        Turns what a view returned into a response: serialized,
+        with validators and stored in the response cache, as needed.
+        """
+        # for true customization, views can return a regular HttpResponse
+        if isinstance(retval, HttpResponse):
             return retval
+        
+        raw_response, status = unpack(retval)
+        content_type = utils.build_content_type(format)
+        
+        if validators is None and self._meta.version and request.method == 'GET' and status == 200:
+            version = self.get_response_version(request, raw_response)
+            if version is not None:
+                validators = conditional.get_validators(version, format, conditional.get_variant(request.GET))
+        
+        # HEAD views return headers rather than a body, 
+        # and there's nothing to serialize
+        if request.method == 'HEAD':
+            response = HttpResponse(status=status, content_type=content_type)
+            if status < 400:
+                for header, value in raw_response.items():
+                    response[header] = value
         else:
-            raw_response = retval
-            status = 200
-                    
-        format = self.determine_format(request, raw_format)
-        return HttpResponse(self.serialize(request, raw_response, format), status=status)
+            with timing.phase('serialize'):
+                content = self.serialize(request, raw_response, format)
+            response = HttpResponse(content, status=status, content_type=content_type)
+        
+        if validators and status == 200:
+            conditional.add_validators(response, *validators)
+        
+        # (streamed responses can only be read once)
+        if cache_key and request.method == 'GET' and status == 200 and not self._meta.stream:
+            self._meta.response_cache.set(cache_key, response)
+        
+        return response
 
         """
         allowed_methods = getattr(self._meta, "%s_allowed_methods" % request_type, None)
@@ -282,6 +632,30 @@ class Resource(object):
         """
         raise NotImplementedError()
 
+    def get_version(self, request, filters):
+        """
+        Returns the current value of the attribute named by the ``version``
+        option for the resource at ``filters``: a timestamp, or any other value
+        that changes whenever the resource does. Returning None skips
+        conditional GET for that request.
+        
+        This needs to be implemented at the user level.
+        
+        ``ModelResource`` includes a full working version specific to Django's
+        ``Models``.
+        """
+        return None
+
+    def get_response_version(self, request, data):
+        """
+        Returns the version of the resource in ``data``, as a view returned 
+        it, so unconditional GETs can get validators without looking up the
+        version separately. Only works for bundles; returns None otherwise.
+        """
+        if isinstance(data, bundle.Bundle) and data.obj is not None:
+            return utils.traverse(data.obj, self._meta.version)
+        return None
+
     def is_authorized(self, request, object=None):
         """
         Handles checking of permissions to see if the user has authorization
@@ -393,10 +767,10 @@ class Resource(object):
         return ''
 
     # NEEDS WORK (c&p from tastypie)
-    def get_via_uri(self, uri):
+    def get_via_uri(self, uri, request=None):
         """
         This pulls apart the salient bits of the URI and populates the
-        resource via a ``obj_get``.
+        resource via a ``obj_get``, with the filters in its route.
         
         If you need custom behavior based on other portions of the URI,
         simply override this method.
@@ -406,31 +780,90 @@ class Resource(object):
         except Resolver404:
             raise NotFound("The URL provided '%s' was not a link to a valid resource." % uri)
         
-        return self.obj_get(filters)
+        if not isinstance(getattr(view, 'im_self', None), type(self)):
+            raise NotFound("The URL provided '%s' was not a link to a %s." % (uri, self.name))
+        
+        raw_format, filters = utils.extract('__format', kwargs)
+        return self.obj_get(request, filters)
 
     # Data preparation.
     
-    def full_dehydrate(self, obj):
+    def prefetch_related(self, objects, fieldset=None):
+        """
+        A hook to fetch whatever related data a list of objects needs 
+        in bulk, before they're dehydrated one by one. Returns the list.
+        
+        ``ModelResource`` includes a full working version that fetches the
+        objects behind ``ToManyField`` fields.
+        """
+        return objects
+
+    def get_fieldset(self, request):
+        """
+        Returns the names of the fields a client asked for using 
+        ``?fields=a,b,c``, or ``None`` if it didn't ask for specific ones.
+        ``resource_uri`` is always included.
+        
+        Raises ``BadRequest`` for fields the resource doesn't have.
+        """
+        if request is None or not request.GET.get('fields'):
+            return None
+        
+        fieldset = [name.strip() for name in request.GET['fields'].split(',') if name.strip()]
+        unknown = [name for name in fieldset if name not in self.fields]
+        if unknown:
+            raise BadRequest("Unknown fields: %s." % ", ".join(unknown))
+        
+        if 'resource_uri' in self.fields and not 'resource_uri' in fieldset:
+            fieldset.append('resource_uri')
+        return fieldset
+
+    def get_dehydration_plan(self, fieldset=None):
+        """
+        Returns the ``(key, accessor, hook)`` steps that dehydrate an 
+        object, for all fields or for only those in ``fieldset``.
+        """
+        if fieldset is None:
+            return self._dehydration_plan
+        
+        fieldset = tuple(fieldset)
+        plan = self._fieldset_plans.get(fieldset)
+        if plan is None:
+            plan = [step for step in self._dehydration_plan if step[0] in fieldset]
+            # clients choose the fieldsets, so don't keep them all (and
+            # another thread may clear them at any time)
+            if len(self._fieldset_plans) >= FIELDSET_PLANS:
+                self._fieldset_plans.clear()
+            self._fieldset_plans[fieldset] = plan
+        return plan
+    
+    def full_dehydrate(self, obj, fieldset=None):
         """
         Given an object instance, extract the information from it to populate
-        the resource.
+        the resource, or only the fields in ``fieldset`` if given.
         """
         bundle = Bundle(obj=obj)
+        data = bundle.data
         
-        # Dehydrate each field.
-        for field_name, field_object in self.fields.items():
-            # A touch leaky but it makes URI resolution work.
-            if isinstance(field_object, RelatedField):
-                field_object.api_name = self._meta.api_name
-                field_object.resource_name = self._meta.resource_name
-                
-            bundle.data[field_name] = field_object.dehydrate(bundle)
-            
-            # Check for an optional method to do further dehydration.
-            method = getattr(self, "dehydrate_%s" % field_name, None)
-            
-            if method:
-                bundle.data[field_name] = method(bundle)
+        # when queries are being logged, the log needs to 
+        # know which field each of them is run for
+        queries = querylog.current()
+        if queries is not None:
+            queries.enter()
+        
+        # Dehydrate each field, then run its optional method 
+        # to do further dehydration.
+        try:
+            for key, accessor, hook in self.get_dehydration_plan(fieldset):
+                mark = queries and queries.mark()
+                data[key] = accessor(bundle)
+                if hook is not None:
+                    data[key] = hook(bundle)
+                if queries is not None:
+                    queries.blame(mark, key)
+        finally:
+            if queries is not None:
+                queries.exit()
         
         bundle = self.dehydrate(bundle)
         return bundle
@@ -533,17 +966,28 @@ class Resource(object):
     
     def generate_cache_key(self, *args, **kwargs):
         """
-        Creates a unique-enough cache key.
+        Creates a cache key that's unique to this resource class, its route
+        and the given args/kwargs, the first of which is usually the kind of
+        entry (``list`` or ``detail``).
         
-        This is based off the current api_name/resource_name/args/kwargs.
+        Keys include the resource's generation, so ``bump_cache_generation``
+        invalidates every one of them at once.
         """
-        smooshed = []
+        if args:
+            kind, bits = args[0], args[1:]
+        else:
+            kind, bits = '', ()
         
-        for key, value in kwargs.items():
-            smooshed.append("%s=%s" % (key, value))
+        if kwargs:
+            bits = bits + (kwargs, )
         
-        # Use a list plus a ``.join()`` because it's faster than concatenation.
-        return "%s:%s:%s:%s" % (self._meta.api_name, self._meta.resource_name, ':'.join(args), ':'.join(smooshed))
+        return cache.make_key(self, kind, *bits)
+    
+    def bump_cache_generation(self):
+        """
+        Invalidates all cached lists, objects and responses for this resource.
+        """
+        return cache.bump_generation(self)
 
     # Data access methods.
     
@@ -584,6 +1028,10 @@ class Resource(object):
         A version of ``obj_get_list`` that uses the cache as a means to get
         commonly-accessed data faster.
         """
+        # don't bother looking up generations for a cache that does nothing
+        if type(self._meta.cache) is cache.NoCache:
+            return self.obj_get_list(request, filters)
+        
         cache_key = self.generate_cache_key('list', filters)
         obj_list = self._meta.cache.get(cache_key)
         
@@ -610,6 +1058,9 @@ class Resource(object):
         A version of ``obj_get`` that uses the cache as a means to get
         commonly-accessed data faster.
         """
+        if type(self._meta.cache) is cache.NoCache:
+            return self.obj_get(request, filters)
+        
         cache_key = self.generate_cache_key('detail', filters)
         bundle = self._meta.cache.get(cache_key)
         
@@ -711,15 +1162,38 @@ class Resource(object):
         Should return a HttpResponse (200 OK).
         """
         try:
+            fieldset = self.get_fieldset(request)
             obj = self.cached_obj_get(request, filters)
+        except BadRequest, e:
+            return {"error": str(e)}, 400
         except ObjectDoesNotExist:
             return 404
         except MultipleObjectsReturned:
             return {"error": "More than one resource is found at this URI."}, 300
         
-        bundle = self.full_dehydrate(obj)
+        bundle = self.full_dehydrate(obj, fieldset)
         return bundle
 
+    def head(self, request, filters, format):
+        """
+        Returns the headers for a single resource, without its body.
+        
+        There's no way of knowing whether an arbitrary resource exists
+        without getting it, so this calls ``show`` and throws away the
+        result, which only saves on serialization. ``ModelResource`` and
+        ``Collection`` make do with much cheaper queries.
+        
+        Should return a dictionary of headers (200 OK).
+        """
+        retval = self.show(request, filters, format)
+        if isinstance(retval, types.GeneratorType):
+            retval = utils.run_coroutine(retval).result()
+        if isinstance(retval, HttpResponse):
+            return retval.status_code
+        
+        raw_response, status = unpack(retval)
+        return {}, status
+
     def update(self, request, filters, format):
         """
         Either updates an existing resource or creates a new one with the
@@ -810,11 +1284,107 @@ class ModelDeclarativeMetaclass(DeclarativeMetaclass):
         elif 'absolute_url' in new_class.base_fields and not 'absolute_url' in attrs:
             del(new_class.base_fields['absolute_url'])
         
+        # plan how to fetch related objects, so dehydrating a page 
+        # of objects takes the same number of queries whatever its size
+        select_related, prefetch = utils.plan_queries(new_class._meta.object_class, new_class.base_fields)
+        new_class._meta.select_related = select_related
+        new_class._meta.prefetch = prefetch
+        
+        # keep whatever the resource caches in step with its model
+        # (and, see ``ModelResource.__init__``, its related models)
+        if new_class._meta.queryset is not None and new_class.is_cached():
+            new_class.watch([new_class._meta.object_class])
+        
+        # recompiled, now that the model's fields are in
+        new_class._meta.dehydration_plan = compile_dehydration(new_class)
         return new_class
 
 
 class ModelResource(Resource):
     __metaclass__ = ModelDeclarativeMetaclass
+    
+    def __init__(self):
+        super(ModelResource, self).__init__()
+        # only instances fill caches, so changes to related models
+        # don't matter until there is one, and by then related
+        # resources can be imported
+        if self.is_cached() and self._meta.queryset is not None \
+                and not '_dependencies' in type(self).__dict__:
+            self.watch(self.get_dependencies())
+    
+    @classmethod
+    def is_cached(cls):
+        return type(cls._meta.cache) is not cache.NoCache \
+            or type(cls._meta.response_cache) is not cache.NoResponseCache
+    
+    @classmethod
+    def get_dependencies(cls):
+        """
+        Returns the models that the resource embeds or links to 
+        through its ``ToOneField`` and ``ToManyField`` fields.
+        """
+        # related resources are often only importable once all 
+        # resources are, so this is worked out on first use
+        if not '_dependencies' in cls.__dict__:
+            dependencies = set()
+            for field in cls.base_fields.values():
+                if isinstance(field, RelatedField):
+                    model = field.to_class()._meta.object_class
+                    if model is not None:
+                        dependencies.add(model)
+            cls._dependencies = dependencies
+        
+        return cls._dependencies
+    
+    @classmethod
+    def watch(cls, models):
+        """
+        Has ``invalidate`` listen for changes to instances of ``models``,
+        and to the many-to-many relations they have.
+        """
+        uid = cache.get_namespace(cls)
+        for model in models:
+            for signal in (signals.post_save, signals.post_delete):
+                signal.connect(cls.invalidate, sender=model, weak=False, dispatch_uid=uid)
+            
+            relations = [field.rel.through for field in model._meta.many_to_many]
+            relations += [related.field.rel.through 
+                for related in model._meta.get_all_related_many_to_many_objects()]
+            for through in relations:
+                if not isinstance(through, basestring):
+                    signals.m2m_changed.connect(cls.invalidate, sender=through, weak=False, dispatch_uid=uid)
+    
+    @classmethod
+    def invalidate(cls, sender, instance=None, **kwargs):
+        """
+        Listens for changes to model instances. When one of the resource's
+        own objects changes, collections have their generation bumped and
+        detail resources evict that object's cache entry. When a related
+        object changes, there's no telling which entries embed it, so the
+        generation gets bumped either way.
+        
+        Entries under a URI the object has since moved away from (e.g.
+        because the field that's in its route changed) are left to expire.
+        """
+        action = kwargs.get('action')
+        if action is not None and not action.startswith('post_'):
+            return
+        
+        model = cls._meta.object_class
+        changed = set([type(instance), kwargs.get('model')])
+        
+        if type(instance) is model and action is None \
+            and not issubclass(cls, Collection) \
+            and type(cls._meta.response_cache) is cache.NoResponseCache:
+            try:
+                lookup = dict(zip(cls._meta.uri_template.names, cls._meta.uri_template.values(instance)))
+            except (ObjectDoesNotExist, AttributeError):
+                cache.bump_generation(cls)
+            else:
+                # tastypie's caches can't delete, but a ``None`` reads as a miss
+                cls._meta.cache.set(cache.make_key(cls, 'detail', lookup), None)
+        elif model in changed or changed & cls.get_dependencies():
+            cache.bump_generation(cls)
 
     @classmethod
     def should_skip_field(cls, field):
@@ -910,32 +1480,83 @@ class ModelResource(Resource):
         else:
             obj = bundle_or_obj
         
-        if format:
-            format = '.' + format
-        else:
-            format = ''
+        uri_template = self._meta.uri_template
+        if uri_template is None:
+            return None
         
-        filters = re.compile(self._meta.parsed_route).groupindex
-        if '__format' in filters:
-            del filters["__format"]
-        for attr in filters:
-            filters[attr] = utils.traverse(obj, attr)  
-
         try:
-            return reverse(self.name, kwargs=filters) + format
-        except NotImplementedError:
-            return None
+            return uri_template.fill(uri_template.values(obj), format)
         except NoReverseMatch:
             return None
 
+    def prefetch_related(self, objects, fieldset=None):
+        plan = self._meta.prefetch
+        if fieldset is not None:
+            attributes = [self.fields[field_name].attribute for field_name in fieldset]
+            plan = [(attribute, lookups) for attribute, lookups in plan if attribute in attributes]
+        
+        return utils.prefetch(list(objects), plan)
+
+    def get_uri_names(self):
+        """
+        Returns the attributes that go into an object's URI.
+        """
+        if self._meta.uri_template is None:
+            return []
+        return self._meta.uri_template.names
+
+    def get_columns(self, fieldset):
+        """
+        Returns the columns needed to dehydrate the fields in ``fieldset``
+        (along with whatever the route needs), or ``None`` if there's no
+        telling, e.g. because one of the fields is backed by a method.
+        """
+        model = self._meta.object_class
+        attributes = [name.split('__')[0] for name in self.get_uri_names()]
+        
+        for field_name in fieldset:
+            field = self.fields[field_name]
+            if field_name == 'resource_uri' or getattr(field, 'is_m2m', False):
+                continue
+            if not isinstance(field.attribute, basestring):
+                return None
+            attributes.append(field.attribute.split('__')[0])
+        
+        attributes = set(attributes)
+        if 'pk' in attributes:
+            attributes.remove('pk')
+            attributes.add(model._meta.pk.name)
+        
+        if not attributes.issubset([field.name for field in model._meta.fields]):
+            return None
+        return list(attributes)
+
     def get_object_list(self, request):
         """
         An ORM-specific implementation of ``get_object_list``.
         
         Returns a queryset that may have been limited by authorization or other
-        overrides.
+        overrides. Clients that ask for specific fields get the columns
+        those need, rather than entire rows.
         """
         base_object_list = self._meta.queryset
+        select_related = self._meta.select_related
+        
+        # views let clients know about bad fieldsets
+        try:
+            fieldset = self.get_fieldset(request)
+        except BadRequest:
+            fieldset = None
+        
+        if fieldset is not None:
+            columns = self.get_columns(fieldset)
+            if columns is not None:
+                base_object_list = base_object_list.only(*columns)
+                # deferred foreign keys can't be followed
+                select_related = [lookup for lookup in select_related if lookup.split('__')[0] in columns]
+        
+        if select_related:
+            base_object_list = base_object_list.select_related(*select_related)
         
         # Limit it as needed.
         authed_object_list = self.apply_authorization_limits(request, base_object_list)
@@ -955,6 +1576,19 @@ class ModelResource(Resource):
     
         return qs
     
+    def get_version(self, request, filters):
+        """
+        An ORM-specific implementation of ``get_version``, which only 
+        fetches the version column.
+        """
+        versions = list(self.obj_get_list(request, filters).values_list(self._meta.version, flat=True)[:2])
+        
+        # let `show` deal with missing or ambiguous objects
+        if len(versions) == 1:
+            return versions[0]
+        else:
+            return None
+
     def obj_get(self, request=None, filters={}):
         """
         A ORM-specific implementation of ``obj_get``.
@@ -977,13 +1611,38 @@ class ModelResource(Resource):
         Should return a HttpResponse (200 OK).
         """
         try:
-            obj = self.obj_get(request, filters)
+            fieldset = self.get_fieldset(request)
+            with timing.phase('query'):
+                obj = self.cached_obj_get(request, filters)
+        except BadRequest, e:
+            return {"error": str(e)}, 400
         except ObjectDoesNotExist:
-            return None
+            return 404
+        except MultipleObjectsReturned:
+            return {"error": "More than one resource is found at this URI."}, 300
 
-        bundle = self.full_dehydrate(obj)
+        with timing.phase('dehydrate'):
+            bundle = self.full_dehydrate(obj, fieldset)
+        if self._meta.metrics is not None:
+            self._meta.metrics.dehydrated(self.name)
         return bundle
 
+    def head(self, request, filters, format):
+        """
+        Returns the headers for a single resource, without its body.
+        
+        Only fetches the primary key of (at most two) matching rows, 
+        enough to tell whether ``show`` would find the object.
+        """
+        matches = len(self.obj_get_list(request, filters).values_list('pk', flat=True)[:2])
+        
+        if matches == 0:
+            return 404
+        elif matches > 1:
+            return 300
+        else:
+            return {}
+
     # TODO
     def update(self, request, filters, format):
         raise NotImplementedError()
@@ -1000,12 +1659,147 @@ class ModelResource(Resource):
     # TODO
     def destroy(self, request, filters, format):
         raise NotImplementedError()
+    
+    def hydrate_partial(self, bundle):
+        """
+        Like ``full_hydrate`` followed by ``hydrate_m2m``, but only for 
+        the fields that are in the bundle's data, on an existing object. 
+        Unlike ``full_hydrate``, a ``null`` does get set on the object.
+        
+        ``hydrate_FOO`` hooks only run for the fields that are there; 
+        ``hydrate`` runs either way.
+        """
+        for field_name, field_object in self.fields.items():
+            if not field_name in bundle.data or not field_object.attribute or field_object.readonly:
+                continue
+            
+            if getattr(field_object, 'is_m2m', False):
+                bundle.data[field_name] = field_object.hydrate_m2m(bundle)
+            else:
+                value = field_object.hydrate(bundle)
+                if value is not None and getattr(field_object, 'is_related', False):
+                    value = value.obj
+                setattr(bundle.obj, field_object.attribute, value)
+            
+            method = getattr(self, "hydrate_%s" % field_name, None)
+            if method:
+                bundle = method(bundle) or bundle
+        
+        return self.hydrate(bundle)
+    
+    def validate_partial(self, bundle, changed, request=None):
+        """
+        Checks the model fields that ``changed`` with their own validation
+        (``Field.clean``), and runs ``Meta.validation``, but only keeps 
+        the errors for fields that are in the bundle's data.
+        """
+        errors = {}
+        for field in changed:
+            try:
+                field.clean(field.value_from_object(bundle.obj), bundle.obj)
+            except ValidationError, e:
+                errors[field.name] = e.messages
+        
+        for key, value in self._meta.validation.is_valid(bundle, request).items():
+            if key in bundle.data:
+                errors.setdefault(key, value)
+        
+        return errors
+    
+    def patch(self, request, filters, format):
+        """
+        Changes some of the fields of a single resource, leaving the
+        others as they are. 
+        
+        Only the fields in the data provided get hydrated, validated
+        and, if they changed, saved, along with whatever ``Model.save``
+        changes (see ``save_changes``).
+        
+        Return ``HttpAccepted`` (202 Accepted).
+        """
+        deserialized = self.deserialize(request, request.raw_post_data, format=request.META.get('CONTENT_TYPE', 'application/json'))
+        if not isinstance(deserialized, dict):
+            return {"error": "Please provide the fields to change as an object."}, 400
+        
+        unknown = [key for key in deserialized if not key in self.fields]
+        if unknown:
+            return {"error": "Unknown fields: %s." % ", ".join(sorted(unknown))}, 400
+        
+        try:
+            obj = self.obj_get(request, filters)
+        except BadRequest, e:
+            return {"error": str(e)}, 400
+        except ObjectDoesNotExist:
+            return 404
+        except MultipleObjectsReturned:
+            return {"error": "More than one resource is found at this URI."}, 300
+        
+        # (`fields` rather than `local_fields`, so that what's inherited 
+        # from a parent model gets saved as well)
+        columns = [field for field in obj._meta.fields if not field.primary_key]
+        before = [field.value_from_object(obj) for field in columns]
+        
+        try:
+            bundle = self.hydrate_partial(self.build_bundle(obj=obj, data=utils.dict_strip_unicode_keys(deserialized)))
+        except (ApiFieldError, NotFound), e:
+            return {"error": str(e)}, 400
+        
+        changed = [field for field, value in zip(columns, before) 
+            if not is_unchanged(field, value, field.value_from_object(obj))]
+        errors = self.validate_partial(bundle, changed, request)
+        if errors:
+            return {"errors": errors}, 400
+        
+        using = router.db_for_write(type(obj))
+        try:
+            with transaction.commit_on_success(using=using):
+                if changed:
+                    save_changes(obj, columns, before, using)
+                self.save_m2m(bundle, replace=True)
+        except DatabaseError, e:
+            return {"error": str(e)}, 409
+        
+        return HttpAccepted()
+    
+    def save_m2m(self, bundle, replace=False):
+        """
+        Adds the related objects that ``hydrate_m2m`` put in a bundle to 
+        its (saved) object or, with ``replace``, makes them the only ones,
+        if they aren't already. Fields that aren't in the bundle's data
+        are left alone.
+        """
+        for field_name, field_object in self.fields.items():
+            if not getattr(field_object, 'is_m2m', False) or field_object.readonly:
+                continue
+            if not field_name in bundle.data:
+                continue
+            related = [related_bundle.obj for related_bundle in bundle.data.get(field_name) or []]
+            manager = getattr(bundle.obj, field_object.attribute)
+            if replace:
+                if set(manager.values_list('pk', flat=True)) == set(obj.pk for obj in related):
+                    continue
+                manager.clear()
+            if related:
+                manager.add(*related)
 
 class Collection(object):
+    def get_version(self, request, filters):
+        # any of a collection's objects might have changed, 
+        # been added or been removed, so there's no single version
+        return None
+    
     # Views.
     
     def get_resource_collection_uri(self, filters={}):
-        return reverse(self.name, kwargs=filters)
+        uri_template = self._meta.uri_template
+        if uri_template is None:
+            raise NoReverseMatch("%s has no route." % self.name)
+        try:
+            values = [filters[name] for name in uri_template.names]
+        except KeyError:
+            raise NoReverseMatch("Can't build a URI for %s from %s." % (self.name, filters))
+        
+        return uri_template.fill(values)
     
     def show(self, request, filters, format):    
         """
@@ -1018,16 +1812,89 @@ class Collection(object):
         """
         # TODO: Uncached for now. Invalidation that works for everyone
         # may be impossible.
+        try:
+            fieldset = self.get_fieldset(request)
+        except BadRequest, e:
+            return {"error": str(e)}, 400
+        
         objects = self.obj_get_list(request, filters)
         sorted_objects = self.apply_sorting(objects, options=request.GET)
         
-        uri = self.get_resource_collection_uri(filters)
-        paginator = Paginator(request.GET, sorted_objects, resource_uri=uri, limit=self._meta.limit)
-        to_be_serialized = paginator.page()
+        # collections of plain columns skip model instances altogether
+        plan = self.get_row_plan(fieldset)
+        if plan is not None:
+            columns, steps, uri_columns = plan
+            sorted_objects = sorted_objects.values_list(*columns)
         
-        # Dehydrate the bundles in preparation for serialization.
-        to_be_serialized['objects'] = [self.full_dehydrate(obj) for obj in to_be_serialized['objects']]
+        uri = self.get_resource_collection_uri(filters)
+        paginator = self._meta.paginator_class(request.GET, sorted_objects, resource_uri=uri, 
+            limit=self._meta.limit, count_strategy=self._meta.count_strategy)
+        try:
+            with timing.phase('query'):
+                to_be_serialized = paginator.page()
+        except BadRequest, e:
+            return {"error": str(e)}, 400
+        
+        # Dehydrate the bundles in preparation for serialization, or, 
+        # when streaming, as they get serialized, without caching the 
+        # objects on the queryset (and outside of any timing).
+        objects = to_be_serialized['objects']
+        if self._meta.stream:
+            objects = getattr(objects, 'iterator', objects.__iter__)()
+            if plan is not None:
+                to_be_serialized['objects'] = (self.dehydrate_row(row, plan) for row in objects)
+            else:
+                batches = utils.batches(objects, PREFETCH_BATCH_SIZE)
+                to_be_serialized['objects'] = (self.full_dehydrate(obj, fieldset) 
+                    for batch in batches for obj in self.prefetch_related(batch, fieldset))
+        elif plan is not None:
+            with timing.phase('query'):
+                objects = list(objects)
+            with timing.phase('dehydrate'):
+                to_be_serialized['objects'] = [self.dehydrate_row(row, plan) for row in objects]
+        else:
+            with timing.phase('query'):
+                objects = self.prefetch_related(list(objects), fieldset)
+            with timing.phase('dehydrate'):
+                to_be_serialized['objects'] = [self.full_dehydrate(obj, fieldset) for obj in objects]
+        
+        if self._meta.metrics is not None and not self._meta.stream:
+            self._meta.metrics.dehydrated(self.name, len(to_be_serialized['objects']))
+        queries = querylog.current()
+        if settings.DEBUG and self._meta.query_log and queries is not None and not self._meta.stream:
+            to_be_serialized['meta']['queries'] = queries.to_dict()
         return to_be_serialized
+    
+    def get_row_plan(self, fieldset=None):
+        """
+        Returns a plan for dehydrating rows rather than objects, 
+        or ``None`` if the collection needs objects. See 
+        ``ModelCollection.get_row_plan``.
+        """
+        return None
+
+    def head(self, request, filters, format):
+        """
+        Returns the headers for a collection of resources, without its body.
+        
+        Instead of fetching and dehydrating a page of resources, this
+        only counts them, and returns the count in an ``X-Total-Count``
+        header, unless the collection's ``count_strategy`` doesn't count 
+        or it's paged with cursors, which never count.
+        
+        If you override ``show`` to change which objects get shown, 
+        you'll want to override ``head`` in the same way.
+        """
+        if issubclass(self._meta.paginator_class, CursorPaginator):
+            return {}
+        
+        objects = self.obj_get_list(request, filters)
+        paginator = self._meta.paginator_class(request.GET, objects, limit=self._meta.limit, 
+            count_strategy=self._meta.count_strategy)
+        count = paginator.get_count()
+        if count is None:
+            return {}
+        return {"X-Total-Count": count}
 
     def update(self, request, filters, format):
         """
@@ -1087,13 +1954,342 @@ class Collection(object):
         """
         self.obj_delete_list(request, filters)
         return HttpAccepted()
+    
+    def patch(self, request, filters, format):
+        """
+        Collections can't be patched, even if the detail resources 
+        they inherit from can.
+        """
+        raise NotImplementedError()
+    patch.not_implemented = True
 
 
 class ModelCollection(Collection):
+    # the detail resource this collection consists of
+    _detail = None
+    
+    def get_detail(self):
+        # instantiating a resource isn't cheap, so only do it once
+        if self._detail is None:
+            for base in self.__class__.__bases__:
+                if issubclass(base, Resource) and base not in [Resource, ModelResource]:
+                    self._detail = base()
+                    break
+        
+        return self._detail
+    
     def get_resource_uri(self, bundle_or_obj, format=None):
-        for base in self.__class__.__bases__:
-            if issubclass(base, Resource) and base not in [Resource, ModelResource]:
-                return base().get_resource_uri(bundle_or_obj)
+        detail = self.get_detail()
+        if detail is None:
+            return None
+        
+        return detail.get_resource_uri(bundle_or_obj)
+    
+    def get_uri_names(self):
+        detail = self.get_detail()
+        if detail is None:
+            return []
+        
+        return detail.get_uri_names()
+    
+    def hydrate_new(self, data, request=None, filters={}):
+        """
+        Builds a bundle with a new, unsaved object out of ``data``, 
+        under the (non-traversing) ``filters`` in the collection's URI.
+        
+        Raises ``ApiFieldError`` or ``NotFound`` for data that can't 
+        be hydrated, e.g. because of missing fields or related 
+        resources that don't exist.
+        """
+        bundle = self.build_bundle(data=utils.dict_strip_unicode_keys(data))
+        for key, value in filters.items():
+            if not '__' in key:
+                setattr(bundle.obj, key, value)
+        
+        bundle = self.full_hydrate(bundle)
+        return self.hydrate_m2m(bundle)
+    
+    def obj_create_list(self, bundles, request=None):
+        """
+        Saves the new objects in ``bundles`` using batched INSERTs, along 
+        with their many-to-many relations, in a single transaction, which
+        gets rolled back if anything fails. ``pre_save`` and ``post_save``
+        are sent for every object (see ``bulk_insert``).
+        """
+        model = self._meta.object_class
+        objects = [bundle.obj for bundle in bundles]
+        using = router.db_for_write(model)
+        
+        with transaction.commit_on_success(using=using):
+            utils.bulk_insert(objects, using=using)
+            for bundle in bundles:
+                self.save_m2m(bundle)
+        
+        return bundles
+    
+    def get_match_field(self):
+        """
+        Returns the model field that ``Meta.match_on`` names, and 
+        the name of the resource field that it's exposed as.
+        """
+        model = self._meta.object_class
+        if self._meta.match_on == 'pk':
+            match_field = model._meta.pk
+            # the primary key of a child model is a link to its parent's
+            while match_field.rel and match_field.rel.parent_link:
+                match_field = match_field.rel.get_related_field()
+        else:
+            match_field = model._meta.get_field(self._meta.match_on)
+        
+        for field_name, field_object in self.fields.items():
+            if field_object.attribute in (match_field.name, match_field.attname):
+                return match_field, field_name
+        raise ImproperlyConfigured("%s doesn't have a field for '%s' to match objects on." % (self.name, self._meta.match_on))
+    
+    def update(self, request, filters, format):
+        """
+        Replaces a collection of resources with the ``{"objects": [...]}``
+        provided, by working out the difference between the two.
+        
+        Objects are matched to existing ones on ``Meta.match_on`` (the 
+        primary key by default). Existing objects that aren't in the 
+        new collection get deleted, objects that don't exist yet get 
+        inserted in bulk, and objects that do exist get saved, but 
+        only if they've changed, and only the columns that did (see
+        ``save_changes``). 
+        That happens in a single transaction, after every object 
+        has been hydrated and validated.
+        
+        Return ``HttpAccepted`` (202 Accepted).
+        """
+        deserialized = self.deserialize(request, request.raw_post_data, format=request.META.get('CONTENT_TYPE', 'application/json'))
+        if not isinstance(deserialized, dict) or not isinstance(deserialized.get('objects'), list):
+            return {"error": "Please provide the collection's objects as {\"objects\": [...]}."}, 400
+        
+        model = self._meta.object_class
+        match_field, match_name = self.get_match_field()
+        columns = [field for field in model._meta.fields if not field.primary_key]
+        existing = dict((getattr(obj, match_field.attname), obj) 
+            for obj in self.obj_get_list(request, filters))
+        
+        created = []
+        updated = []
+        seen = set()
+        errors = {}
+        for i, data in enumerate(deserialized['objects']):
+            if not isinstance(data, dict):
+                errors[i] = "Expected an object."
+                continue
+            
+            try:
+                key = data.get(match_name)
+                if key is not None:
+                    key = match_field.to_python(key)
+                    if key in seen:
+                        raise ApiFieldError("There's more than one object with %s '%s'." % (match_name, key))
+                    seen.add(key)
+                
+                if key in existing:
+                    obj = existing[key]
+                    before = [field.value_from_object(obj) for field in columns]
+                    bundle = self.build_bundle(obj=obj, data=utils.dict_strip_unicode_keys(data))
+                    bundle = self.hydrate_m2m(self.full_hydrate(bundle))
+                    updated.append((bundle, before))
+                else:
+                    bundle = self.hydrate_new(data, request, filters)
+                    created.append(bundle)
+            except (ApiFieldError, NotFound, ValidationError), e:
+                errors[i] = str(e)
+                continue
+            
+            invalid = self._meta.validation.is_valid(bundle, request)
+            if invalid:
+                errors[i] = invalid
+        
+        if errors:
+            return {"errors": errors}, 400
+        
+        deleted = [obj.pk for key, obj in existing.items() if not key in seen]
+        changed = [(bundle, before) for bundle, before in updated 
+            if [field for field, value in zip(columns, before) 
+                if not is_unchanged(field, value, field.value_from_object(bundle.obj))]]
+        using = router.db_for_write(model)
+        manager = model._default_manager.db_manager(using)
+        
+        try:
+            with transaction.commit_on_success(using=using):
+                for batch in utils.batches(deleted, BULK_INSERT_BATCH_SIZE):
+                    manager.filter(pk__in=batch).delete()
+                utils.bulk_insert([bundle.obj for bundle in created], using=using)
+                for bundle, before in changed:
+                    save_changes(bundle.obj, columns, before, using)
+                for bundle in created:
+                    self.save_m2m(bundle)
+                for bundle, before in updated:
+                    self.save_m2m(bundle, replace=True)
+        except DatabaseError, e:
+            return {"error": str(e)}, 409
+        
+        return HttpAccepted()
+    
+    def create(self, request, filters, format):
+        """
+        Creates a new resource or, given ``{"objects": [...]}``, any 
+        number of them at once.
+        
+        Every object is hydrated and validated before any of them is 
+        saved; objects with errors have those returned by their index 
+        in the list, and nothing gets created. Otherwise, they're saved 
+        with ``obj_create_list``, so either all of them are created or
+        none are.
+        
+        Returns ``HttpCreated`` (201 Created) with the location of a single
+        new resource, or the URIs of all new resources, in order.
+        """
+        deserialized = self.deserialize(request, request.raw_post_data, format=request.META.get('CONTENT_TYPE', 'application/json'))
+        many = isinstance(deserialized, dict) and isinstance(deserialized.get('objects'), list)
+        if many:
+            items = deserialized['objects']
+        else:
+            items = [deserialized]
+        
+        bundles = []
+        errors = {}
+        for i, data in enumerate(items):
+            if not isinstance(data, dict):
+                errors[i] = "Expected an object."
+                continue
+            try:
+                bundle = self.hydrate_new(data, request, filters)
+            except (ApiFieldError, NotFound), e:
+                errors[i] = str(e)
+                continue
+            
+            invalid = self._meta.validation.is_valid(bundle, request)
+            if invalid:
+                errors[i] = invalid
+            bundles.append(bundle)
+        
+        if errors and many:
+            return {"errors": errors}, 400
+        elif errors and isinstance(errors[0], basestring):
+            return {"error": errors[0]}, 400
+        elif errors:
+            return {"errors": errors[0]}, 400
+        
+        try:
+            self.obj_create_list(bundles, request)
+        except DatabaseError, e:
+            return {"error": str(e)}, 409
+        
+        if many:
+            return {"objects": [self.get_resource_uri(bundle) for bundle in bundles]}, 201
+        return HttpCreated(location=self.get_resource_uri(bundles[0]))
+    
+    def get_row_plan(self, fieldset=None):
+        """
+        Returns the row plan for ``fieldset`` (or all fields), which is
+        worked out once per fieldset, like the dehydration plan. See 
+        ``build_row_plan``.
+        """
+        if fieldset is not None:
+            fieldset = tuple(fieldset)
+        try:
+            return self._row_plans[fieldset]
+        except KeyError:
+            pass
+        
+        plan = self.build_row_plan(fieldset)
+        # clients choose the fieldsets, so don't keep them all
+        if len(self._row_plans) >= FIELDSET_PLANS:
+            self._row_plans.clear()
+        self._row_plans[fieldset] = plan
+        return plan
+    
+    def build_row_plan(self, fieldset=None):
+        """
+        Works out whether the fields in ``fieldset`` (or all fields) can
+        be dehydrated straight from ``values_list()`` rows, without going
+        through model instances and bundles: they all have to be plain
+        columns of plain values (not files), without ``dehydrate_<field>`` 
+        hooks or related fields,
+        and the collection can't have changed how it dehydrates or 
+        builds URIs, or be paged with cursors.
+        
+        Returns a ``(columns, steps, uri_columns)`` tuple, where the steps
+        are ``(key, column index, field)`` and ``uri_columns`` are the 
+        indexes of the columns that go into ``resource_uri``, or ``None``.
+        """
+        if issubclass(self._meta.paginator_class, CursorPaginator):
+            return None
+        for name in ('full_dehydrate', 'dehydrate', 'dehydrate_resource_uri'):
+            if not is_stock(self, name, Resource):
+                return None
+        
+        model = self._meta.object_class
+        concrete = set(field.name for field in model._meta.fields)
+        pk_name = model._meta.pk.name
+        columns = []
+        steps = []
+        uri_columns = None
+        
+        def add_column(name):
+            if name == 'pk':
+                name = pk_name
+            if not name in columns:
+                columns.append(name)
+            return columns.index(name)
+        
+        for key, accessor, hook in self.get_dehydration_plan(fieldset):
+            field = self.fields[key]
+            if key == 'resource_uri':
+                detail = self.get_detail()
+                if detail is None or detail._meta.uri_template is None \
+                        or not is_stock(self, 'get_resource_uri', ModelCollection) \
+                        or not is_stock(detail, 'get_resource_uri', ModelResource):
+                    return None
+                uri_columns = [add_column(name) for name in detail.get_uri_names()]
+                continue
+            
+            if hook is not None or isinstance(field, RelatedField):
+                return None
+            if type(field).dehydrate.im_func is not ApiField.dehydrate.im_func:
+                return None
+            if not type(field).convert.im_func in ROW_CONVERSIONS:
+                return None
+            if not isinstance(field.attribute, basestring):
+                return None
+            if field.attribute != 'pk' and not field.attribute in concrete:
+                return None
+            steps.append((key, add_column(field.attribute), field))
+        
+        return columns, steps, uri_columns
+    
+    def dehydrate_row(self, row, plan):
+        """
+        Does for a row what ``full_dehydrate`` does for an object,
+        following a plan made by ``get_row_plan``.
+        """
+        columns, steps, uri_columns = plan
+        data = {}
+        
+        for key, index, field in steps:
+            value = row[index]
+            if value is None:
+                if field.has_default():
+                    value = field._default
+                elif not field.null:
+                    raise ApiFieldError("The row '%r' has an empty column '%s' and doesn't allow a default or null value." % (row, columns[index]))
+            data[key] = field.convert(value)
+        
+        if uri_columns is not None:
+            uri_template = self.get_detail()._meta.uri_template
+            try:
+                data['resource_uri'] = uri_template.fill([row[index] for index in uri_columns])
+            except NoReverseMatch:
+                data['resource_uri'] = None
+        
+        return data
 
 
 class TOC(Resource):
@@ -1104,6 +2300,208 @@ class TOC(Resource):
         return toc
 
 
+@only('show')
+class Metrics(Resource):
+    """
+    Shows what's in a metrics registry: ``Meta.metrics`` or otherwise 
+    ``apiserver.metrics.registry``. Renders JSON, or Prometheus' text 
+    format for ``text/plain`` requests or with a ``.txt`` extension.
+    """
+    def get_registry(self):
+        return self._meta.metrics or metrics.registry
+    
+    def determine_format(self, request, raw_format):
+        if raw_format == 'txt':
+            return 'text/plain'
+        accept = request.META.get('HTTP_ACCEPT', '*/*')
+        if not raw_format and accept != '*/*':
+            if mimeparse.best_match(['application/json', 'text/plain'], accept) == 'text/plain':
+                return 'text/plain'
+        return super(Metrics, self).determine_format(request, raw_format)
+    
+    def serialize(self, request, data, format, options=None):
+        if format == 'text/plain':
+            return metrics.to_prometheus(data)
+        return super(Metrics, self).serialize(request, data, format, options)
+    
+    def show(self, request, filters, format):
+        return self.get_registry().to_dict()
+
+
+def build_subrequest(request, method, path, body=''):
+    """
+    Builds a request for a single item in a batch, which shares 
+    everything but its method, path and body with the batch request.
+    """
+    path, _, query = path.partition('?')
+    subrequest = HttpRequest()
+    subrequest.method = method.upper()
+    subrequest.path = subrequest.path_info = path
+    subrequest.GET = QueryDict(query)
+    subrequest.COOKIES = getattr(request, 'COOKIES', {})
+    subrequest.META = dict(request.META, 
+        REQUEST_METHOD=subrequest.method, 
+        PATH_INFO=path, 
+        QUERY_STRING=query, 
+        CONTENT_TYPE='application/json', 
+        CONTENT_LENGTH=str(len(body)))
+    subrequest._raw_post_data = body
+    for attribute in ('user', 'session'):
+        if hasattr(request, attribute):
+            setattr(subrequest, attribute, getattr(request, attribute))
+    return subrequest
+
+
+@only('create')
+class Batch(Resource):
+    """
+    Takes a list of requests, as ``{"method": ..., "path": ..., "body": ...}``
+    items, and answers them all in one response, saving clients a round 
+    trip for every request but the first.
+    
+    Paths are resolved against the urlconf, and each item goes straight to
+    the ``dispatch`` of the resource it's routed to. Authentication and 
+    throttling are up to the batch resource, and happen once per batch. 
+    Responses are listed in the order of the requests, each with its 
+    ``status``, ``headers`` and (deserialized JSON) ``body``.
+    
+    Safe requests, and those marked ``"independent": true``, run on 
+    threads borrowed from the shared pool, each with its own database 
+    connection, as many at a time as the batch's ``concurrency`` and 
+    ``Meta.max_batch_concurrency`` allow (and the pool has to spare). Other requests wait for everything before them to finish, 
+    and vice versa. How long every request took, in milliseconds, is 
+    listed in the ``timings`` in the meta.
+    """
+    def resolve(self, path):
+        """
+        Returns the resource a path is routed to and the filters 
+        in that route, or raises ``NotFound``.
+        """
+        try:
+            view, args, kwargs = resolve(path.partition('?')[0])
+        except Resolver404:
+            raise NotFound("No resource is found at '%s'." % path)
+        
+        resource = getattr(view, 'im_self', None)
+        if not isinstance(resource, Resource) or isinstance(resource, Batch):
+            raise NotFound("No resource is found at '%s'." % path)
+        return resource, kwargs
+    
+    def get_batch(self, request, format):
+        """
+        Returns the items in the batch and how many of them can run 
+        at the same time, or raises ``BadRequest``.
+        """
+        deserialized = self.deserialize(request, request.raw_post_data, format=format)
+        if not isinstance(deserialized, dict):
+            deserialized = {'objects': deserialized}
+        
+        items = deserialized.get('objects')
+        if not isinstance(items, list):
+            raise BadRequest("Please provide a list of requests, as {\"objects\": [...]}.")
+        if len(items) > self._meta.max_batch_size:
+            raise BadRequest("A batch takes at most %d requests." % self._meta.max_batch_size)
+        
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get('path'), basestring):
+                raise BadRequest("Every request needs at least a 'path'.")
+        
+        concurrency = deserialized.get('concurrency', self._meta.max_batch_concurrency)
+        if not isinstance(concurrency, int) or concurrency < 1:
+            raise BadRequest("The concurrency of a batch should be a positive number.")
+        
+        return items, min(concurrency, self._meta.max_batch_concurrency)
+    
+    def is_concurrent(self, item):
+        """
+        Tells whether an item can run alongside others: if it's safe, or 
+        if it's marked as ``independent`` of the rest of the batch.
+        """
+        return item.get('method', 'GET').upper() in SAFE_METHODS or item.get('independent') is True
+    
+    def run(self, request, items, concurrency):
+        """
+        Processes the items in a batch in order, except that consecutive 
+        items that are concurrent run on up to ``concurrency`` threads.
+        Returns their responses, and how long each of them took.
+        """
+        def timed_process(item):
+            start = time.time()
+            response = self.process(request, item)
+            return response, round((time.time() - start) * 1000, 2)
+        
+        results = []
+        group = []
+        for item in items + [None]:
+            if item is not None and self.is_concurrent(item):
+                group.append(item)
+                continue
+            
+            results.extend(utils.run_concurrently(timed_process, group, concurrency))
+            group = []
+            if item is not None:
+                results.append(timed_process(item))
+        
+        return [response for response, duration in results], [duration for response, duration in results]
+    
+    def process(self, request, item):
+        """
+        Dispatches a single item in the batch to its resource, and 
+        returns its response as a dictionary.
+        """
+        method = item.get('method', 'GET').upper()
+        body = item.get('body')
+        body = body is not None and self._meta.serializer.to_json(body) or ''
+        
+        try:
+            resource, filters = self.resolve(item['path'])
+            subrequest = build_subrequest(request, method, item['path'], body)
+            response = resource.dispatch(subrequest, **filters)
+        except NotFound, e:
+            return {'status': 404, 'headers': {}, 'body': {"error": str(e)}}
+        except NotImplementedError:
+            return {'status': 405, 'headers': {}, 'body': {"error": "%s is not allowed here." % method}}
+        except ImmediateHttpResponse, e:
+            response = e.response
+        
+        headers = dict(response.items())
+        content = response.content
+        body = None
+        if content and headers.get('Content-Type', '').startswith('application/json'):
+            body = self._meta.serializer.from_json(content)
+        elif content:
+            body = content
+        
+        return {'status': response.status_code, 'headers': headers, 'body': body}
+    
+    def create(self, request, filters, format):
+        """
+        Answers every request in the batch.
+        
+        Should return a list of responses (200 OK).
+        """
+        try:
+            self.is_authenticated(request)
+            self.throttle_check(request)
+        except ImmediateHttpResponse, e:
+            return e.response
+        
+        try:
+            items, concurrency = self.get_batch(request, format)
+        except BadRequest, e:
+            return {"error": str(e)}, 400
+        
+        self.log_throttled_access(request)
+        responses, timings = self.run(request, items, concurrency)
+        return {
+            'objects': responses, 
+            'meta': {
+                'concurrency': concurrency, 
+                'timings': timings,
+                },
+            }
+
+
 # not implemented
 class Set(object):
     pass
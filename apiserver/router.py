@@ -0,0 +1,223 @@
+# encoding: utf-8
+
+import re
+
+from django.core.urlresolvers import RegexURLPattern, ResolverMatch
+
+from surlex import surlex_to_regex
+from surlex.grammar import Parser, TextNode, TagNode, MacroTagNode, RegexTagNode
+from surlex.macros import DefaultMacroRegistry
+
+from apiserver.resources import r
+
+FORMAT_SUFFIX = r'(\.(?P<__format>[a-z]+))?$'
+FORMAT = re.compile(r'^[a-z]+$')
+
+# a regex that might match a slash cannot be confined to a single
+# path segment (e.g. the default `.+` for tags without a macro)
+UNCONFINED = re.compile(r'(?<!\\)\.|\\[SWD]|\[\^|/')
+
+macros = DefaultMacroRegistry()
+
+
+def split_segments(node_list):
+    """
+    Splits a surlex node list into path segments, each segment
+    being a list of nodes. Returns None if the route contains
+    nodes that can span segments (wildcards, optional blocks or
+    tags that may match a slash).
+    """
+    segments = [[]]
+    for node in node_list:
+        if isinstance(node, TextNode):
+            pieces = node.token.split('/')
+            if pieces[0]:
+                segments[-1].append(TextNode(pieces[0]))
+            for piece in pieces[1:]:
+                segments.append([])
+                if piece:
+                    segments[-1].append(TextNode(piece))
+        elif isinstance(node, TagNode):
+            if isinstance(node, MacroTagNode):
+                regex = macros.get(node.macro)
+            elif isinstance(node, RegexTagNode):
+                regex = node.regex
+            else:
+                return None
+            if UNCONFINED.search(regex):
+                return None
+            segments[-1].append((node.name, regex))
+        else:
+            return None
+    return segments
+
+
+def segment_to_regex(segment):
+    # mirrors surlex' own RegexScribe, so a segment matches
+    # exactly what the full route regex would have matched
+    output = ''
+    for node in segment:
+        if isinstance(node, TextNode):
+            output += node.token.replace('.', '\.')
+        else:
+            name, regex = node
+            if name:
+                output += '(?P<%s>%s)' % (name, regex)
+            else:
+                output += regex
+    return '^' + output
+
+
+class Edge(object):
+    def __init__(self, regex):
+        self.regex = regex
+        self.pattern = re.compile(regex + '$', re.UNICODE)
+        self.terminal = re.compile(regex + FORMAT_SUFFIX, re.UNICODE)
+        self.node = Node()
+
+
+class Node(object):
+    def __init__(self):
+        self.static = {}
+        self.dynamic = []
+        self.endpoint = None
+
+    def edge(self, regex):
+        for edge in self.dynamic:
+            if edge.regex == regex:
+                return edge
+        edge = Edge(regex)
+        self.dynamic.append(edge)
+        return edge
+
+
+class Router(object):
+    """
+    Resolves paths against registered routes by walking a trie of
+    path segments, rather than by trying every route's regex in turn.
+
+    Literal segments are looked up in a dictionary, segments with
+    tags are matched one segment at a time. Routes that can't be
+    split into segments (raw regexes, wildcards, optional blocks and
+    tags without a macro) are matched linearly, after the trie.
+
+    Unlike Django's urlconf, where the first route to match wins,
+    literal segments take precedence over tags, so `/people/me`
+    will be routed to its own resource even if `/people/<name:s>`
+    was registered first.
+    """
+
+    def __init__(self):
+        self.root = Node()
+        self.fallbacks = []
+
+    def connect(self, route, view, name=None):
+        endpoint = (view, name)
+
+        if isinstance(route, r):
+            segments = None
+        else:
+            segments = split_segments(Parser(route).get_node_list())
+
+        if segments is None:
+            if not isinstance(route, r):
+                route = surlex_to_regex(route)
+            regex = re.compile('^' + route + FORMAT_SUFFIX, re.UNICODE)
+            self.fallbacks.append((regex, endpoint))
+            return
+
+        node = self.root
+        for segment in segments:
+            if all(isinstance(bit, TextNode) for bit in segment):
+                key = ''.join(bit.token for bit in segment)
+                node = node.static.setdefault(key, Node())
+            else:
+                node = node.edge(segment_to_regex(segment)).node
+
+        # like Django, the first route to claim a path keeps it
+        if node.endpoint is None:
+            node.endpoint = endpoint
+
+    def walk(self, node, segments, i, kwargs):
+        segment = segments[i]
+        last = i == len(segments) - 1
+
+        child = node.static.get(segment)
+        if child is not None:
+            if not last:
+                found = self.walk(child, segments, i + 1, kwargs)
+                if found:
+                    return found
+            elif child.endpoint:
+                return child.endpoint, dict(kwargs, __format=None)
+
+        if last and '.' in segment:
+            base, dot, format = segment.rpartition('.')
+            child = node.static.get(base)
+            if child is not None and child.endpoint and FORMAT.match(format):
+                return child.endpoint, dict(kwargs, __format=format)
+
+        for edge in node.dynamic:
+            if last:
+                if edge.node.endpoint is None:
+                    continue
+                match = edge.terminal.match(segment)
+                if match:
+                    return edge.node.endpoint, dict(kwargs, **match.groupdict())
+            else:
+                match = edge.pattern.match(segment)
+                if match:
+                    found = self.walk(edge.node, segments, i + 1,
+                        dict(kwargs, **match.groupdict()))
+                    if found:
+                        return found
+
+        return None
+
+    def resolve(self, path):
+        """
+        Returns a ``(view, kwargs, name)`` tuple for the given path,
+        or None if no route matches.
+        """
+        found = self.walk(self.root, path.split('/'), 0, {})
+
+        if not found:
+            for regex, endpoint in self.fallbacks:
+                match = regex.match(path)
+                if match:
+                    found = endpoint, match.groupdict()
+                    break
+            else:
+                return None
+
+        (view, name), kwargs = found
+        return view, kwargs, name
+
+
+class RouterPattern(RegexURLPattern):
+    """
+    A stand-in for the individual resource patterns in a urlconf,
+    which hands off resolution to a ``Router``.
+    """
+    callback = None
+
+    def __init__(self, router):
+        self.regex = re.compile(r'^')
+        self.router = router
+        self.default_args = {}
+        self.name = None
+
+    def resolve(self, path):
+        found = self.router.resolve(path)
+        if found:
+            view, kwargs, name = found
+            return ResolverMatch(view, (), kwargs, name)
+
+
+class ReversePattern(RegexURLPattern):
+    """
+    A URL pattern that only takes part in ``reverse()``,
+    leaving resolution to a ``RouterPattern``.
+    """
+    def resolve(self, path):
+        return None
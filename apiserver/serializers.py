@@ -1 +1,185 @@
-from tastypie.serializers import *
\ No newline at end of file
+# encoding: utf-8
+
+import datetime
+
+from django.core.serializers import json
+from django.db.models.query import QuerySet
+from django.utils import simplejson
+from django.utils.encoding import force_unicode
+
+from tastypie.serializers import *
+
+from apiserver.bundle import Bundle
+
+try:
+    from json.encoder import encode_basestring_ascii
+except ImportError:
+    from django.utils.simplejson.encoder import encode_basestring_ascii
+
+# how much serialized output to gather before handing it to the server
+STREAM_CHUNK_SIZE = 64 * 1024
+# how many different sets of keys a `JSONSerializer` remembers the encoding of
+KEY_LAYOUTS = 256
+
+
+class Serializer(Serializer):
+    def stream(self, data, format='application/json', options={}):
+        """
+        Like ``serialize``, but returns an iterator of chunks rather than a
+        single string. For JSON, the ``objects`` in ``data`` are serialized
+        one at a time, as they're consumed, so they can be a generator and
+        the complete list never has to be in memory. Other formats don't
+        support this and get serialized in one go.
+        """
+        if format == self.content_types.get('json'):
+            return self.stream_json(data, options)
+
+        if isinstance(data, dict) and 'objects' in data:
+            data = dict(data, objects=list(data['objects']))
+        return iter([self.serialize(data, format, options)])
+
+    def stream_json(self, data, options=None):
+        """
+        Produces the same output as ``to_json``, in chunks.
+        """
+        options = options or {}
+
+        if not isinstance(data, dict) or not 'objects' in data:
+            yield self.to_json(data, options)
+            return
+
+        # keys are sorted, so split the rest of the data into what
+        # goes before ``objects`` and what goes after it
+        before = dict((key, value) for key, value in data.items() if key < 'objects')
+        after = dict((key, value) for key, value in data.items() if key > 'objects')
+        opening = self.to_json(before, options)[:-1]
+        if before:
+            opening += ', '
+        if after:
+            closing = '], ' + self.to_json(after, options)[1:]
+        else:
+            closing = ']}'
+
+        buffer = [opening + '"objects": [']
+        size = 0
+
+        separator = ''
+        for obj in data['objects']:
+            serialized = separator + self.to_json(obj, options)
+            buffer.append(serialized)
+            size += len(serialized)
+            separator = ', '
+
+            if size >= STREAM_CHUNK_SIZE:
+                yield ''.join(buffer)
+                buffer = []
+                size = 0
+
+        buffer.append(closing)
+        yield ''.join(buffer)
+
+
+class JSONSerializer(Serializer):
+    """
+    A ``Serializer`` that writes JSON in a single pass over the data, 
+    rather than first turning it into plain dicts, lists and strings 
+    with ``to_simple`` and then handing that to the JSON encoder. The 
+    output is the same as ``Serializer.to_json``'s. Other formats 
+    are serialized the usual way.
+    
+    Dicts and bundles that share their keys, like the objects in a
+    collection, share the encoding of those keys too.
+    
+    Keys are sorted unless ``sort_keys`` is ``False``. Output indented 
+    with ``indent`` spaces is meant for people rather than speed, and 
+    goes through ``to_simple`` and the encoder after all.
+    
+    Resources use it if their ``Meta.serializer`` is a ``JSONSerializer``.
+    """
+    def __init__(self, sort_keys=True, indent=None, **kwargs):
+        super(JSONSerializer, self).__init__(**kwargs)
+        self.sort_keys = sort_keys
+        self.indent = indent
+        self._layouts = {}
+    
+    def get_layout(self, data):
+        """
+        Returns the keys of a dict as ``(key, encoded key)`` pairs, 
+        in the order they're written in.
+        """
+        keys = tuple(data)
+        layout = self._layouts.get(keys)
+        if layout is None:
+            if len(self._layouts) >= KEY_LAYOUTS:
+                self._layouts.clear()
+            layout = [(key, encode_basestring_ascii(force_unicode(key)) + ': ') for key in keys]
+            if self.sort_keys:
+                layout.sort()
+            self._layouts[keys] = layout
+        return layout
+    
+    def encode(self, data, chunks):
+        """
+        Appends the JSON for ``data`` to a list of ``chunks``.
+        """
+        kind = type(data)
+        
+        if kind is unicode or kind is str:
+            chunks.append(encode_basestring_ascii(data))
+        elif kind is dict or kind is Bundle:
+            if kind is Bundle:
+                data = data.data
+            separator = '{'
+            for key, encoded_key in self.get_layout(data):
+                chunks.append(separator)
+                chunks.append(encoded_key)
+                self.encode(data[key], chunks)
+                separator = ', '
+            chunks.append(separator == '{' and '{}' or '}')
+        elif kind is list or kind is tuple or isinstance(data, QuerySet):
+            separator = '['
+            for item in data:
+                chunks.append(separator)
+                self.encode(item, chunks)
+                separator = ', '
+            chunks.append(separator == '[' and '[]' or ']')
+        elif data is None:
+            chunks.append('null')
+        elif data is True:
+            chunks.append('true')
+        elif data is False:
+            chunks.append('false')
+        elif kind is int or kind is long:
+            chunks.append(str(data))
+        elif kind is float:
+            if data != data or data in (float('inf'), float('-inf')):
+                raise ValueError("Out of range float values are not JSON compliant: %r" % data)
+            chunks.append(repr(data))
+        elif isinstance(data, dict):
+            self.encode(dict(data), chunks)
+        elif isinstance(data, Bundle):
+            self.encode(data.data, chunks)
+        elif isinstance(data, (list, tuple)):
+            self.encode(list(data), chunks)
+        elif hasattr(data, 'dehydrated_type'):
+            self.encode(self.to_simple(data, {}), chunks)
+        elif isinstance(data, datetime.datetime):
+            chunks.append(encode_basestring_ascii(self.format_datetime(data)))
+        elif isinstance(data, datetime.date):
+            chunks.append(encode_basestring_ascii(self.format_date(data)))
+        elif isinstance(data, datetime.time):
+            chunks.append(encode_basestring_ascii(self.format_time(data)))
+        else:
+            # subclasses of str and unicode, Decimals and everything 
+            # else end up as strings, as in ``to_simple``
+            chunks.append(encode_basestring_ascii(force_unicode(data)))
+    
+    def to_json(self, data, options=None):
+        if self.indent is not None:
+            data = self.to_simple(data, options or {})
+            return simplejson.dumps(data, cls=json.DjangoJSONEncoder, 
+                sort_keys=self.sort_keys, indent=self.indent)
+        
+        chunks = []
+        self.encode(data, chunks)
+        return ''.join(chunks)
@@ -0,0 +1,131 @@
+# encoding: utf-8
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger("apiserver")
+
+# the phases `dispatch` keeps track of, in the order they're reported in
+PHASES = ('query', 'dehydrate', 'serialize')
+
+_local = threading.local()
+
+
+class Timing(object):
+    """
+    How long a single request took, in milliseconds: altogether, and per 
+    phase. Time spent in a phase within another phase only counts towards 
+    the inner one. Whatever isn't part of any phase only shows in the total.
+    """
+    def __init__(self):
+        self.phases = {}
+        self.stack = []
+        self.start = time.time()
+        self.total = None
+        # the `querylog.QueryLog` of the request, if it logs its queries
+        self.queries = None
+    
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0) + seconds * 1000
+    
+    def enter(self, name):
+        now = time.time()
+        if self.stack:
+            outer, since = self.stack[-1]
+            self.add(outer, now - since)
+        self.stack.append([name, now])
+    
+    def exit(self):
+        now = time.time()
+        name, since = self.stack.pop()
+        self.add(name, now - since)
+        if self.stack:
+            self.stack[-1][1] = now
+    
+    def stop(self):
+        self.total = (time.time() - self.start) * 1000
+    
+    def items(self):
+        """
+        Returns ``(phase, milliseconds)`` pairs, in the order of ``PHASES``.
+        """
+        known = [(name, self.phases[name]) for name in PHASES if name in self.phases]
+        other = [(name, value) for name, value in sorted(self.phases.items()) if not name in PHASES]
+        return known + other
+    
+    def to_header(self):
+        """
+        Formats the timing as a ``Server-Timing`` header.
+        """
+        metrics = ['%s;dur=%.2f' % item for item in self.items()]
+        if self.total is not None:
+            metrics.append('total;dur=%.2f' % self.total)
+        return ', '.join(metrics)
+
+
+def resume(timing):
+    """
+    Has phases on the current thread count towards ``timing``, which 
+    may have started on another thread. Returns what they counted 
+    towards before, to hand to ``suspend``.
+    """
+    previous = getattr(_local, 'timing', None)
+    _local.timing = timing
+    return previous
+
+
+def suspend(previous):
+    _local.timing = previous
+
+
+@contextmanager
+def phase(name):
+    """
+    Counts the time spent in a block towards a phase of the request that's 
+    being timed on this thread, if any.
+    """
+    timing = getattr(_local, 'timing', None)
+    if timing is None:
+        yield
+        return
+    
+    timing.enter(name)
+    try:
+        yield
+    finally:
+        timing.exit()
+
+
+class TimingSink(object):
+    """
+    Gets the ``Timing`` of every request to a resource that has it
+    as its ``timing_sink``. Does nothing with it; subclass and 
+    override ``record`` to send it somewhere.
+    """
+    def record(self, resource, request, response, timing):
+        pass
+
+
+class LoggingTimingSink(TimingSink):
+    """
+    Logs the timing of every request, and how many queries it ran 
+    if those were logged.
+    """
+    def __init__(self, logger=log, level=logging.INFO):
+        self.logger = logger
+        self.level = level
+    
+    def record(self, resource, request, response, timing):
+        self.logger.log(self.level, "%s %s %s: %d in %.2f ms (%s)", 
+            request.method, request.path, resource.name, response.status_code, 
+            timing.total, timing.to_header())
+        if timing.queries is None:
+            return
+        
+        self.logger.log(self.level, "%s %s %s: %d queries in %.2f ms", 
+            request.method, request.path, resource.name, timing.queries.count, timing.queries.time)
+        for field, shape, count in timing.queries.repeated():
+            self.logger.warning("%s: %s ran %d times, once per object, for '%s'", 
+                resource.name, shape, count, field)
@@ -1,9 +1,11 @@
 # encoding: utf-8
 
-from apiserver.utils.dict import dict_strip_unicode_keys
+from apiserver.utils.dict import dict_strip_unicode_keys, frozendict
 from apiserver.utils.formatting import mk_datetime, format_datetime, format_date, format_time
-from apiserver.utils.urls import trailing_slash
+from apiserver.utils.urls import trailing_slash, URITemplate
 from apiserver.utils.validate_jsonp import is_valid_jsonp_callback_value
 from apiserver.utils.timer import timed
 from apiserver.utils.mime import determine_format, build_content_type
-from apiserver.utils.objects import traverse, extract
\ No newline at end of file
+from apiserver.utils.objects import traverse, extract
+from apiserver.utils.queries import plan_queries, prefetch, batches, bulk_insert
+from apiserver.utils.concurrency import run_concurrently, run_coroutine, Future, ThreadPool, get_pool
\ No newline at end of file
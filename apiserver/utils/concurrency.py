@@ -0,0 +1,277 @@
+# encoding: utf-8
+
+import sys
+import threading
+from Queue import Queue, Empty
+
+from django.core.urlresolvers import get_script_prefix, set_script_prefix, get_urlconf, set_urlconf
+from django.db import connections
+from django.utils import translation
+
+from apiserver.constants import THREAD_POOL_SIZE
+
+
+def close_connections():
+    for connection in connections.all():
+        connection.close()
+
+
+def carry_context(fn):
+    """
+    Wraps ``fn`` so that, on whichever thread it's called, it sees the 
+    script prefix, urlconf and language of the thread that wrapped it, 
+    which Django keeps per thread. The thread's own are put back after.
+    """
+    script_prefix = get_script_prefix()
+    urlconf = get_urlconf()
+    language = translation.get_language()
+    
+    def wrapper(*args, **kwargs):
+        previous = get_script_prefix(), get_urlconf(), translation.get_language()
+        set_script_prefix(script_prefix)
+        set_urlconf(urlconf)
+        translation.activate(language)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            set_script_prefix(previous[0])
+            set_urlconf(previous[1])
+            translation.activate(previous[2])
+    
+    return wrapper
+
+
+def run_concurrently(fn, items, concurrency, pool=None):
+    """
+    Calls ``fn`` for every item on at most ``concurrency`` threads and
+    returns the results in the order of the items. 
+    
+    The calling thread is one of them; the others are borrowed from
+    ``pool``, the shared pool by default, so there are never more threads
+    (or database connections) than the pool has, however many batches
+    run at a time. Those that the pool doesn't get round to before the 
+    items run out aren't waited for. 
+    
+    Django opens database connections per thread, so every thread has 
+    its own. That also means a thread can't see what's been written in
+    another thread's transaction until it's committed. The script prefix,
+    urlconf and language, which are also per thread, are carried over.
+    
+    The first exception raised by ``fn``, if any, is raised again
+    once every thread is done.
+    """
+    items = list(items)
+    if concurrency < 2 or len(items) < 2:
+        return [fn(item) for item in items]
+    
+    queue = Queue()
+    for i, item in enumerate(items):
+        queue.put((i, item))
+    results = [None] * len(items)
+    errors = []
+    # how many borrowed threads are at work, and whether any more may join
+    state = {'working': 0, 'closed': False}
+    condition = threading.Condition()
+    
+    def work():
+        while True:
+            try:
+                i, item = queue.get_nowait()
+            except Empty:
+                return
+            try:
+                results[i] = fn(item)
+            except Exception:
+                errors.append(sys.exc_info())
+    
+    def borrowed():
+        with condition:
+            if state['closed']:
+                return
+            state['working'] += 1
+        try:
+            work()
+        finally:
+            with condition:
+                state['working'] -= 1
+                condition.notify_all()
+    
+    pool = pool or get_pool()
+    borrowed = carry_context(borrowed)
+    for i in range(min(concurrency, len(items)) - 1):
+        pool.submit(borrowed)
+    work()
+    
+    with condition:
+        state['closed'] = True
+        while state['working']:
+            condition.wait()
+    
+    if errors:
+        exc_type, exc_value, traceback = errors[0]
+        raise exc_type, exc_value, traceback
+    return results
+
+
+class Future(object):
+    """
+    The result of work that's yet to finish, much like Python 3's 
+    ``concurrent.futures.Future``, which Python 2 doesn't have. 
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+    
+    def done(self):
+        return self._done.is_set()
+    
+    def result(self, timeout=None):
+        """
+        Waits for the work to finish and returns its result, or
+        raises the exception it raised.
+        """
+        self._done.wait(timeout)
+        if not self.done():
+            raise RuntimeError("Gave up waiting for a result after %s seconds." % timeout)
+        if self._exc_info:
+            exc_type, exc_value, traceback = self._exc_info
+            raise exc_type, exc_value, traceback
+        return self._result
+    
+    def exc_info(self):
+        return self._exc_info
+    
+    def add_done_callback(self, fn):
+        """
+        Calls ``fn`` with the future once it's done, from whichever
+        thread finishes it, or right away if it's done already.
+        """
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+    
+    def _finish(self, result, exc_info):
+        with self._lock:
+            self._result = result
+            self._exc_info = exc_info
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn(self)
+    
+    def set_result(self, result):
+        self._finish(result, None)
+    
+    def set_exception(self, exc_info):
+        """
+        Takes an exception as returned by ``sys.exc_info()``.
+        """
+        self._finish(None, exc_info)
+
+
+class ThreadPool(object):
+    """
+    Runs functions on up to ``size`` threads, which are started as they're
+    needed and then kept around. Like a thread that serves requests, every
+    thread closes its database connections after each function.
+    """
+    def __init__(self, size=THREAD_POOL_SIZE):
+        self.size = size
+        self.queue = Queue()
+        self.threads = []
+        self._lock = threading.Lock()
+    
+    def work(self):
+        while True:
+            future, fn, args, kwargs = self.queue.get()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                future.set_exception(sys.exc_info())
+            else:
+                future.set_result(result)
+            finally:
+                close_connections()
+    
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedules ``fn(*args, **kwargs)`` and returns a ``Future``.
+        """
+        future = Future()
+        self.queue.put((future, fn, args, kwargs))
+        with self._lock:
+            if len(self.threads) < self.size:
+                thread = threading.Thread(target=self.work)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+        return future
+
+
+_pool = None
+
+def get_pool():
+    """
+    Returns the thread pool that's shared by everything that 
+    doesn't bring its own.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ThreadPool()
+    return _pool
+
+
+def run_coroutine(coroutine, resume=None, suspend=None):
+    """
+    Runs a generator that yields ``Future`` instances to wait for them, 
+    and gets their results back (or their exceptions raised) once they're 
+    done. Whatever else it yields is its result, which is what the 
+    ``Future`` that this returns will hold.
+    
+    Waiting doesn't take up a thread: the coroutine picks up where it 
+    left off in whichever thread finishes the future it waits for.
+    Anything that's kept per thread and should follow the coroutine
+    around can be set up by ``resume`` and torn down by ``suspend``,
+    which are called before and after every step it takes.
+    """
+    future = Future()
+    
+    def step(value=None, exc_info=None):
+        if resume:
+            resume()
+        failure = None
+        try:
+            if exc_info:
+                yielded = coroutine.throw(*exc_info)
+            else:
+                yielded = coroutine.send(value)
+            if not isinstance(yielded, Future):
+                coroutine.close()
+        except StopIteration:
+            yielded = None
+        except Exception:
+            failure = sys.exc_info()
+        finally:
+            if suspend:
+                suspend()
+        
+        if failure:
+            future.set_exception(failure)
+        elif isinstance(yielded, Future):
+            yielded.add_done_callback(wake)
+        else:
+            future.set_result(yielded)
+    
+    def wake(waited):
+        if waited.exc_info():
+            step(exc_info=waited.exc_info())
+        else:
+            step(waited.result())
+    
+    step()
+    return future
@@ -0,0 +1,94 @@
+# encoding: utf-8
+
+import datetime
+from calendar import timegm
+from hashlib import md5
+
+from django.utils.http import http_date, parse_http_date_safe, parse_etags, quote_etag, urlencode
+from django.utils.tzinfo import LocalTimezone
+
+
+def get_variant(query):
+    """
+    Returns a query string, as a ``QueryDict`` or a plain dict, with its 
+    keys and values in a fixed order.
+    """
+    if hasattr(query, 'lists'):
+        items = [(key, sorted(values)) for key, values in query.lists()]
+    else:
+        items = [(key, [value]) for key, value in query.items()]
+    return urlencode(sorted(items), doseq=True)
+
+
+def get_validators(version, format, variant=''):
+    """
+    Turns a resource's version into an ``(etag, last_modified)`` tuple.
+
+    Any version makes for an ETag, one per format and ``variant`` (see
+    ``get_variant``), since query strings can choose between different
+    representations too, like sparse fieldsets or JSONP. Only timestamps 
+    make for a ``Last-Modified``; naive ones are taken to be in local
+    time, as set by ``TIME_ZONE``.
+    """
+    etag = md5("%s:%s:%s" % (version, format, variant)).hexdigest()
+
+    if isinstance(version, datetime.datetime):
+        if version.tzinfo is None:
+            version = version.replace(tzinfo=LocalTimezone(version))
+        last_modified = timegm(version.utctimetuple())
+    else:
+        last_modified = None
+
+    return etag, last_modified
+
+
+def get_response_validators(response):
+    """
+    Reads the ``(etag, last_modified)`` tuple back out of a response.
+    """
+    etag = response.get('ETag', None)
+    if etag:
+        etag = parse_etags(etag)[0]
+
+    last_modified = response.get('Last-Modified', None)
+    if last_modified:
+        last_modified = parse_http_date_safe(last_modified)
+
+    return etag, last_modified
+
+
+def is_conditional(request):
+    """
+    Whether a request comes with a copy of its own to check for freshness.
+    """
+    return 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+
+
+def not_modified(request, etag, last_modified):
+    """
+    Whether the copy a client holds is still fresh, judging by the
+    ``If-None-Match`` and ``If-Modified-Since`` headers it sent along.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+
+    # like Django's `condition` decorator, ETags take precedence
+    if if_none_match and etag:
+        try:
+            etags = parse_etags(if_none_match)
+        except ValueError:
+            return False
+        return etag in etags or '*' in etags
+
+    if if_modified_since and last_modified:
+        if_modified_since = parse_http_date_safe(if_modified_since)
+        return if_modified_since is not None and last_modified <= if_modified_since
+
+    return False
+
+
+def add_validators(response, etag, last_modified):
+    response['ETag'] = quote_etag(etag)
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -1,3 +1,13 @@
 # encoding: utf-8
 
-from tastypie.utils.dict import *
\ No newline at end of file
+from tastypie.utils.dict import *
+
+
+class frozendict(dict):
+    """
+    A dictionary that can't be changed after it's been created.
+    """
+    def _immutable(self, *vargs, **kwargs):
+        raise TypeError("'%s' object does not support item assignment" % self.__class__.__name__)
+    
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
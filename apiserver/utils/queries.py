@@ -0,0 +1,228 @@
+# encoding: utf-8
+
+from itertools import islice
+
+from django.db import connections, models, router
+from django.db.models import signals
+from django.db.models.fields import FieldDoesNotExist
+
+from apiserver.constants import PREFETCH_CACHE, BULK_INSERT_BATCH_SIZE
+from apiserver.fields import RelatedField
+
+
+def get_lookups(field):
+    """
+    Returns what a related resource will traverse for each of its objects,
+    as ``select_related`` lookups: whatever its own related fields need
+    when it's embedded, or whatever's in its route when it's linked to.
+    
+    Related resources that haven't been imported yet aren't looked into.
+    """
+    related = field.to
+    if isinstance(related, basestring):
+        return []
+    if field.full:
+        return list(related._meta.select_related)
+    if related._meta.uri_template:
+        return [name.rsplit('__', 1)[0] for name in related._meta.uri_template.names if '__' in name]
+    return []
+
+
+def plan_queries(model, fields):
+    """
+    Works out how to fetch whatever the related fields of a resource need,
+    without querying once per object. Returns a ``(select_related, prefetch)``
+    tuple: lookups to follow in the same query, and ``(attribute, lookups)``
+    for every ``ToManyField``, to fetch for a whole page of objects at once.
+    """
+    select_related = []
+    prefetch = []
+
+    if model is None:
+        return select_related, prefetch
+
+    for field in fields.values():
+        if not isinstance(field, RelatedField) or not isinstance(field.attribute, basestring):
+            continue
+
+        if getattr(field, 'is_m2m', False):
+            prefetch.append((field.attribute, get_lookups(field)))
+            continue
+
+        try:
+            model_field = model._meta.get_field(field.attribute)
+        except FieldDoesNotExist:
+            continue
+        if not isinstance(model_field, models.ForeignKey):
+            continue
+
+        select_related.append(field.attribute)
+        select_related.extend(field.attribute + '__' + lookup for lookup in get_lookups(field))
+
+    return select_related, prefetch
+
+
+def prefetch(objects, plan):
+    """
+    Fetches the objects behind the related managers in ``plan`` (as made by
+    ``plan_queries``) for all ``objects``, in one query per manager, and 
+    stores them on each object under ``PREFETCH_CACHE``. Attributes that 
+    aren't relations are skipped.
+    """
+    if not objects or not plan:
+        return objects
+
+    model = type(objects[0])
+    pks = [obj.pk for obj in objects]
+
+    for attribute, lookups in plan:
+        try:
+            relation, _, direct, m2m = model._meta.get_field_by_name(attribute)
+        except FieldDoesNotExist:
+            continue
+
+        if not m2m:
+            if direct:
+                continue
+            # a reverse foreign key, which means we can tell
+            # the related objects who they're related to
+            field = relation.field
+            lookups = [lookup for lookup in lookups if lookup.split('__')[0] != field.name]
+            rows = relation.model._default_manager.filter(**{field.name + '__in': pks})
+            if lookups:
+                rows = rows.select_related(*lookups)
+            parents = dict((obj.pk, obj) for obj in objects)
+            related = {}
+            for row in rows:
+                parent = parents[getattr(row, field.attname)]
+                setattr(row, field.get_cache_name(), parent)
+                related.setdefault(parent.pk, []).append(row)
+        else:
+            if direct:
+                field = relation
+                source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+            else:
+                field = relation.field
+                source, target = field.m2m_reverse_field_name(), field.m2m_field_name()
+            through = field.rel.through
+            source_attname = through._meta.get_field(source).attname
+            target_model = through._meta.get_field(target).rel.to
+            ordering = [
+                order.startswith('-') and '-%s__%s' % (target, order[1:]) or '%s__%s' % (target, order)
+                for order in target_model._meta.ordering]
+            rows = through._default_manager \
+                .filter(**{source + '__in': pks}) \
+                .select_related(target, *[target + '__' + lookup for lookup in lookups]) \
+                .order_by(*ordering)
+            related = {}
+            for row in rows:
+                related.setdefault(getattr(row, source_attname), []).append(getattr(row, target))
+
+        for obj in objects:
+            if not hasattr(obj, PREFETCH_CACHE):
+                setattr(obj, PREFETCH_CACHE, {})
+            getattr(obj, PREFETCH_CACHE)[attribute] = related.get(obj.pk, [])
+
+    return objects
+
+
+def batches(iterable, size):
+    """
+    Splits an iterable into lists of at most ``size`` items.
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def get_max_rows(connection, fields, batch_size):
+    """
+    Returns how many rows of ``fields`` can go into a single INSERT
+    statement, or 0 if the database only takes one row at a time.
+    """
+    if connection.vendor in ('postgresql', 'mysql'):
+        return batch_size
+    if connection.vendor == 'sqlite':
+        from django.db.backends.sqlite3.base import Database
+        if Database.sqlite_version_info < (3, 7, 11):
+            return 0
+        # SQLite takes at most 999 parameters per statement
+        return max(min(batch_size, 999 // len(fields)), 1)
+    return 0
+
+
+def bulk_insert(objects, batch_size=BULK_INSERT_BATCH_SIZE, using=None):
+    """
+    Inserts new model instances of a single model, ``batch_size`` rows
+    per INSERT statement, and gives them their primary keys. Run this 
+    in a transaction.
+    
+    Objects that don't have their primary key yet can only be inserted 
+    in bulk where the database says which keys it handed out (PostgreSQL,
+    with ``RETURNING``). Elsewhere, and for models that inherit from 
+    other models, objects get saved one by one, through ``save``. 
+    Either way, ``pre_save`` and ``post_save`` are sent for every object;
+    in bulk, they're sent for all objects before and after all INSERTs,
+    and what ``save`` would do beyond that doesn't happen.
+    """
+    if not objects:
+        return objects
+    
+    model = type(objects[0])
+    meta = model._meta
+    using = using or router.db_for_write(model)
+    connection = connections[using]
+    
+    pk = meta.pk
+    fields = meta.local_fields
+    bulk = not meta.parents and not [field for field in fields if hasattr(field, 'get_placeholder')]
+    returning = False
+    if isinstance(pk, models.AutoField):
+        missing = len([obj for obj in objects if obj.pk is None])
+        if missing == len(objects):
+            fields = [field for field in fields if field is not pk]
+            returning = True
+            bulk = bulk and connection.vendor == 'postgresql'
+        elif missing:
+            bulk = False
+    
+    rows = bulk and get_max_rows(connection, fields, batch_size) or 0
+    if not rows:
+        for obj in objects:
+            obj.save(force_insert=True, using=using)
+        return objects
+    
+    for obj in objects:
+        signals.pre_save.send(sender=model, instance=obj, raw=False, using=using)
+    
+    qn = connection.ops.quote_name
+    row = '(%s)' % ', '.join(['%s'] * len(fields))
+    cursor = connection.cursor()
+    
+    for batch in batches(objects, rows):
+        sql = 'INSERT INTO %s (%s) VALUES %s' % (
+            qn(meta.db_table), 
+            ', '.join([qn(field.column) for field in fields]), 
+            ', '.join([row] * len(batch)))
+        params = []
+        for obj in batch:
+            params.extend([field.get_db_prep_save(field.pre_save(obj, True), connection=connection) 
+                for field in fields])
+        
+        if returning:
+            cursor.execute(sql + ' RETURNING %s' % qn(pk.column), params)
+            for obj, (value, ) in zip(batch, cursor.fetchall()):
+                setattr(obj, pk.attname, value)
+        else:
+            cursor.execute(sql, params)
+        
+        for obj in batch:
+            obj._state.db = using
+            obj._state.adding = False
+    
+    for obj in objects:
+        signals.post_save.send(sender=model, instance=obj, created=True, raw=False, using=using)
+    return objects
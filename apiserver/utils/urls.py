@@ -1,3 +1,106 @@
 # encoding: utf-8
 
-from tastypie.utils.urls import *
\ No newline at end of file
+import re
+from operator import attrgetter
+
+from django.core.urlresolvers import reverse, NoReverseMatch, get_script_prefix, get_urlconf
+from django.db import models
+from django.utils.encoding import iri_to_uri
+
+from surlex import surlex_to_regex
+from surlex.grammar import Parser, TextNode, TagNode
+
+from tastypie.utils.urls import *
+
+# characters `iri_to_uri` would leave alone
+URI_SAFE = re.compile(r"^[\w/#%\[\]=:;$&()+,!?*@'~.-]*$")
+
+
+def getter(attr_string):
+    """
+    Like ``traverse``, but with the lookup compiled ahead of time.
+    """
+    get = attrgetter(attr_string.replace('__', '.'))
+
+    def get_value(obj):
+        value = get(obj)
+        if isinstance(value, models.Model):
+            value = value.pk
+        return value
+
+    return get_value
+
+
+class URITemplate(object):
+    """
+    A route, compiled into a string template and an ordered list of
+    attribute getters, so URIs can be built using plain string formatting
+    rather than by going through ``reverse()`` for every single object.
+
+    Where the API is mounted isn't known until a URI has actually been
+    reversed, so the first URI is built using ``reverse()`` and its prefix
+    reused from then on -- for as long as the script prefix and urlconf,
+    which are per thread and may differ between requests, stay the same.
+    Routes that can't be expressed as a template (raw regexes, optional
+    blocks, wildcards) always use ``reverse()``.
+    """
+    def __init__(self, name, route, raw=False):
+        self.name = name
+        # (script prefix, urlconf) -> prefix
+        self.prefixes = {}
+
+        if raw:
+            self.template = None
+            regex = route
+        else:
+            self.template = self.compile(route)
+            regex = surlex_to_regex(route)
+
+        # what `reverse()` would check a URI against
+        self.regex = re.compile('^' + regex + '$', re.UNICODE)
+        groups = sorted(self.regex.groupindex.items(), key=lambda group: group[1])
+        self.names = [group for group, index in groups]
+        self.getters = [getter(group) for group in self.names]
+
+    def compile(self, route):
+        template = ''
+        for node in Parser(route).get_node_list():
+            if isinstance(node, TextNode):
+                template += node.token.replace('%', '%%')
+            elif isinstance(node, TagNode) and node.name:
+                template += '%s'
+            else:
+                return None
+        return template
+
+    def values(self, obj):
+        return [get(obj) for get in self.getters]
+
+    def fill(self, values, format=None):
+        """
+        Returns the URI for the given values, in the order their
+        tags appear in the route.
+        """
+        if format:
+            suffix = '.' + format
+        else:
+            suffix = ''
+
+        if self.template is None:
+            return reverse(self.name, kwargs=dict(zip(self.names, values))) + suffix
+
+        path = self.template % tuple(values)
+        if not self.regex.match(path):
+            raise NoReverseMatch("'%s' is not a valid URI for %s." % (path, self.name))
+        if not URI_SAFE.match(path):
+            path = iri_to_uri(path)
+
+        key = (get_script_prefix(), get_urlconf())
+        prefix = self.prefixes.get(key)
+        if prefix is None:
+            uri = reverse(self.name, kwargs=dict(zip(self.names, values)))
+            if not uri.endswith(path):
+                return uri + suffix
+            prefix = self.prefixes[key] = uri[:len(uri) - len(path)]
+
+        return prefix + path + suffix
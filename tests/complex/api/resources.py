@@ -39,3 +39,4 @@ class PostResource(ModelResource):
     class Meta:
         queryset = Post.objects.all()
         route = '/posts'
+        version = 'updated'
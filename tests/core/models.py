@@ -26,6 +26,10 @@ class Note(models.Model):
         return '/some/fake/path/%s/' % self.pk
 
 
+class Article(Note):
+    summary = models.CharField(max_length=255, blank=True)
+
+
 class Subject(models.Model):
     notes = models.ManyToManyField(Note, related_name='subjects')
     name = models.CharField(max_length=255)
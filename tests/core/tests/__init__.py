@@ -4,13 +4,22 @@ warnings.simplefilter('ignore', Warning)
 from core.tests.api import *
 from core.tests.authentication import *
 from core.tests.authorization import *
+from core.tests.benchmarks import *
 from core.tests.cache import *
 from core.tests.commands import *
+from core.tests.dispatch import *
 from core.tests.fields import *
 from core.tests.http import *
 from core.tests.paginator import *
+from core.tests.queries import *
 from core.tests.resources import *
+from core.tests.router import *
 from core.tests.serializers import *
 from core.tests.throttle import *
 from core.tests.utils import *
 from core.tests.validation import *
+from core.tests.writes import *
+from core.tests.batch import *
+from core.tests.timing import *
+from core.tests.metrics import *
+from core.tests.querylog import *
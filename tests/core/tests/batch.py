@@ -0,0 +1,163 @@
+import threading
+import time
+from django.core.urlresolvers import get_script_prefix, set_script_prefix
+from django.test import TestCase
+from apiserver.throttle import BaseThrottle
+from apiserver.utils import ThreadPool, run_concurrently
+from core.models import Note
+from core.tests.mocks import MockRequest
+from core.tests import uri_urls
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+class CountingThrottle(BaseThrottle):
+    def __init__(self, throttled=False):
+        super(CountingThrottle, self).__init__()
+        self.throttled = throttled
+        self.checks = 0
+        self.accesses = 0
+    
+    def should_be_throttled(self, identifier, **kwargs):
+        self.checks += 1
+        return self.throttled
+    
+    def accessed(self, identifier, **kwargs):
+        self.accesses += 1
+
+
+def send_batch(resource, items, concurrency=1):
+    # other threads can't see the fixtures, which are loaded 
+    # in a transaction that never gets committed
+    request = MockRequest()
+    request.method = 'POST'
+    request.raw_post_data = json.dumps({'objects': items, 'concurrency': concurrency})
+    return resource.dispatch(request, __format=None)
+
+
+class BatchTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    
+    def test_batch(self):
+        resp = send_batch(uri_urls.NoteBatch(), [
+            {'path': '/api/v1/notes?limit=2'},
+            {'method': 'get', 'path': '/api/v1/notes/first-post/1'},
+            {'method': 'POST', 'path': '/api/v1/notes', 'body': {'title': 'New', 'slug': 'new'}},
+            {'method': 'PATCH', 'path': '/api/v1/notes/first-post/1', 'body': {'title': 'Retitled'}},
+            {'path': '/api/v1/nowhere'},
+            {'path': '/api/v1/batch'},
+            ])
+        self.assertEqual(resp.status_code, 200)
+        responses = json.loads(resp.content)['objects']
+        self.assertEqual([response['status'] for response in responses], [200, 200, 201, 202, 404, 404])
+        
+        self.assertEqual(len(responses[0]['body']['objects']), 2)
+        self.assertEqual(responses[1]['body']['title'], 'First Post!')
+        note = Note.objects.get(slug='new')
+        self.assertEqual(responses[2]['headers']['Location'], '/api/v1/notes/new/%d' % note.pk)
+        self.assertEqual(Note.objects.get(pk=1).title, 'Retitled')
+    
+    def test_invalid(self):
+        request = MockRequest()
+        request.method = 'POST'
+        request.raw_post_data = json.dumps({'path': '/api/v1/notes'})
+        resp = uri_urls.NoteBatch().dispatch(request, __format=None)
+        self.assertEqual(resp.status_code, 400)
+        
+        resp = send_batch(uri_urls.NoteBatch(), [{'method': 'GET'}])
+        self.assertEqual(resp.status_code, 400)
+        
+        class SmallBatch(uri_urls.NoteBatch):
+            class Meta(uri_urls.NoteBatch.Meta):
+                max_batch_size = 1
+        
+        resp = send_batch(SmallBatch(), [{'path': '/api/v1/notes'}] * 2)
+        self.assertEqual(resp.status_code, 400)
+    
+    def test_throttle(self):
+        class ThrottledBatch(uri_urls.NoteBatch):
+            class Meta(uri_urls.NoteBatch.Meta):
+                throttle = CountingThrottle()
+        
+        resource = ThrottledBatch()
+        resp = send_batch(resource, [{'path': '/api/v1/notes'}] * 3)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resource._meta.throttle.checks, 1)
+        self.assertEqual(resource._meta.throttle.accesses, 1)
+        
+        resource._meta.throttle.throttled = True
+        resp = send_batch(resource, [{'path': '/api/v1/notes'}] * 3)
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(resource._meta.throttle.accesses, 1)
+
+
+class ConcurrentBatchTestCase(TestCase):
+    urls = 'core.tests.uri_urls'
+    
+    def test_concurrent(self):
+        items = [{'path': '/api/v1/slow/%d' % i} for i in range(4)]
+        start = time.time()
+        resp = send_batch(uri_urls.NoteBatch(), items, concurrency=4)
+        duration = time.time() - start
+        self.assertEqual(resp.status_code, 200)
+        
+        content = json.loads(resp.content)
+        self.assertEqual([response['body']['name'] for response in content['objects']], ['0', '1', '2', '3'])
+        self.assertEqual(content['meta']['concurrency'], 4)
+        self.assertEqual(len(content['meta']['timings']), 4)
+        self.assertTrue(min(content['meta']['timings']) >= 100)
+        self.assertTrue(duration < 0.3)
+    
+    def test_sequential(self):
+        # writes wait for the reads before them, and the other way around,
+        # unless they're independent
+        items = [
+            {'path': '/api/v1/slow/0'}, 
+            {'method': 'PUT', 'path': '/api/v1/slow/1'}, 
+            {'path': '/api/v1/slow/2'},
+            {'method': 'PUT', 'path': '/api/v1/slow/3', 'independent': True},
+            ]
+        start = time.time()
+        resp = send_batch(uri_urls.NoteBatch(), items, concurrency=4)
+        duration = time.time() - start
+        self.assertEqual([response['status'] for response in json.loads(resp.content)['objects']], [200, 202, 200, 202])
+        self.assertTrue(0.3 <= duration < 0.4)
+    
+    def test_pool(self):
+        # threads come from a pool, and see what the calling thread sees
+        pool = ThreadPool(2)
+        threads = set()
+        def work(item):
+            time.sleep(0.05)
+            threads.add(threading.current_thread())
+            return get_script_prefix()
+        
+        script_prefix = get_script_prefix()
+        set_script_prefix('/mounted/')
+        try:
+            results = run_concurrently(work, range(6), 4, pool)
+        finally:
+            set_script_prefix(script_prefix)
+        self.assertEqual(results, ['/mounted/'] * 6)
+        self.assertEqual(len(pool.threads), 2)
+        self.assertTrue(threads <= set(pool.threads + [threading.current_thread()]))
+        # and the pool's threads get their own back afterwards
+        self.assertEqual(pool.submit(get_script_prefix).result(1), script_prefix)
+    
+    def test_concurrency_cap(self):
+        class NarrowBatch(uri_urls.NoteBatch):
+            class Meta(uri_urls.NoteBatch.Meta):
+                max_batch_concurrency = 2
+        
+        items = [{'path': '/api/v1/slow/%d' % i} for i in range(4)]
+        start = time.time()
+        resp = send_batch(NarrowBatch(), items, concurrency=10)
+        duration = time.time() - start
+        self.assertEqual(json.loads(resp.content)['meta']['concurrency'], 2)
+        self.assertTrue(0.2 <= duration < 0.3)
+        
+        resp = send_batch(NarrowBatch(), items, concurrency=0)
+        self.assertEqual(resp.status_code, 400)
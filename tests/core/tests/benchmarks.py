@@ -0,0 +1,240 @@
+import os
+import re
+import sys
+import time
+import datetime
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse, RegexURLResolver
+from django.http import QueryDict
+from django.test import TestCase
+from apiserver import utils
+from apiserver.bundle import Bundle
+from apiserver.fields import RelatedField
+from apiserver.serializers import Serializer, JSONSerializer
+from core.models import Note
+from core.tests.mocks import MockRequest
+
+# wall-clock comparisons are too noisy for a regular test run, so they're
+# only made with `APISERVER_BENCHMARKS` set, in the environment or settings; 
+# otherwise, the benchmarks only check that both sides agree, and that the 
+# faster side skips the work it's meant to skip
+BENCHMARKS = bool(os.environ.get('APISERVER_BENCHMARKS', 
+    getattr(settings, 'APISERVER_BENCHMARKS', False)))
+
+
+def timed(fn, n=500):
+    start = time.time()
+    for i in xrange(n):
+        fn(i)
+    return (time.time() - start) / n * 1000000
+
+
+def report(name, **timings):
+    timings = ", ".join("%s: %.1f us" % (label, timing) for label, timing in sorted(timings.items()))
+    sys.stderr.write("\n[benchmark] %s -- %s\n" % (name, timings))
+
+
+def counted(fn):
+    """
+    Wraps a function (or method) to count how often it's called.
+    """
+    def wrapper(*args, **kwargs):
+        wrapper.calls += 1
+        return fn(*args, **kwargs)
+    wrapper.calls = 0
+    return wrapper
+
+
+class Benchmark(TestCase):
+    def compare(self, name, before, after, n=500):
+        """
+        Times ``before`` and ``after``, and checks that ``after`` is faster,
+        if benchmarks are on.
+        """
+        if not BENCHMARKS:
+            return
+        before, after = timed(before, n), timed(after, n)
+        report(name, before=before, after=after)
+        self.assertTrue(after < before)
+
+
+class URIBenchmark(Benchmark):
+    urls = 'core.tests.uri_urls'
+    
+    def test_get_resource_uri(self):
+        from core.tests.uri_urls import AuthorNoteResource
+        resource = AuthorNoteResource()
+        author = User(pk=1, username='johndoe')
+        notes = [Note(pk=i + 1, author=author) for i in range(500)]
+        
+        # how `ModelResource.get_resource_uri` used to do it
+        def with_reverse(i):
+            filters = dict(re.compile(resource._meta.parsed_route).groupindex)
+            del filters['__format']
+            for attr in filters:
+                filters[attr] = utils.traverse(notes[i], attr)
+            return reverse(resource.name, kwargs=filters)
+        
+        def with_template(i):
+            return resource.get_resource_uri(notes[i])
+        
+        self.assertEqual(with_reverse(0), with_template(0))
+        
+        # templates don't go through the URL resolver at all
+        resolver_reverse = RegexURLResolver.reverse
+        RegexURLResolver.reverse = counter = counted(resolver_reverse)
+        try:
+            with_template(1)
+            self.assertEqual(counter.calls, 0)
+            with_reverse(1)
+            self.assertEqual(counter.calls, 1)
+        finally:
+            RegexURLResolver.reverse = resolver_reverse
+        
+        self.compare('get_resource_uri', with_reverse, with_template)
+
+
+class DehydrationBenchmark(Benchmark):
+    urls = 'core.tests.uri_urls'
+    
+    def test_full_dehydrate(self):
+        from core.tests.uri_urls import NoteResource
+        resource = NoteResource()
+        now = datetime.datetime(2010, 3, 30, 20, 5)
+        notes = [Note(pk=i + 1, slug='note-%d' % i, title='Note %d' % i, content='...', 
+            is_active=True, created=now, updated=now) for i in range(500)]
+        
+        # how `Resource.full_dehydrate` used to do it
+        def with_lookups(i):
+            bundle = Bundle(obj=notes[i])
+            for field_name, field_object in resource.fields.items():
+                if isinstance(field_object, RelatedField):
+                    field_object.api_name = resource._meta.api_name
+                    field_object.resource_name = resource._meta.resource_name
+                bundle.data[field_name] = field_object.dehydrate(bundle)
+                method = getattr(resource, "dehydrate_%s" % field_name, None)
+                if method:
+                    bundle.data[field_name] = method(bundle)
+            return resource.dehydrate(bundle)
+        
+        def with_plan(i):
+            return resource.full_dehydrate(notes[i])
+        
+        self.assertEqual(with_lookups(0).data, with_plan(0).data)
+        
+        # the plan doesn't go through the fields anymore
+        class Fields(dict):
+            items = counted(dict.items)
+        resource.fields = Fields(resource.fields)
+        with_plan(1)
+        self.assertEqual(Fields.items.calls, 0)
+        with_lookups(1)
+        self.assertEqual(Fields.items.calls, 1)
+        
+        self.compare('full_dehydrate', with_lookups, with_plan)
+
+
+class RowBenchmark(Benchmark):
+    urls = 'core.tests.uri_urls'
+    
+    def setUp(self):
+        for i in range(100):
+            Note.objects.create(slug='note-%d' % i, title='Note %d' % i, content='...')
+    
+    def test_show(self):
+        from core.tests.uri_urls import NoteCollection
+        request = MockRequest()
+        request.GET = QueryDict('limit=100')
+        rows = NoteCollection()
+        objects = NoteCollection()
+        # anything but the stock `full_dehydrate` needs model instances
+        full_dehydrate = objects.full_dehydrate
+        objects.full_dehydrate = lambda obj, fieldset=None: full_dehydrate(obj, fieldset)
+        
+        def with_objects(i):
+            return objects.show(request, {}, 'json')
+        
+        def with_rows(i):
+            return rows.show(request, {}, 'json')
+        
+        self.assertEqual(
+            [bundle.data for bundle in with_objects(0)['objects']], with_rows(0)['objects'])
+        
+        # rows take as many queries, but no model instances
+        init = Note.__init__
+        Note.__init__ = counter = counted(init)
+        try:
+            self.assertNumQueries(2, with_rows, 1)
+            self.assertEqual(counter.calls, 0)
+            self.assertNumQueries(2, with_objects, 1)
+            self.assertEqual(counter.calls, 100)
+        finally:
+            Note.__init__ = init
+        
+        self.compare('Collection.show (100 notes)', with_objects, with_rows, n=20)
+
+
+class SerializerBenchmark(Benchmark):
+    urls = 'core.tests.uri_urls'
+    
+    def test_to_json(self):
+        from core.tests.uri_urls import NoteResource
+        resource = NoteResource()
+        now = datetime.datetime(2010, 3, 30, 20, 5)
+        notes = [Note(pk=i + 1, slug='note-%d' % i, title='Note %d' % i, content='...', 
+            is_active=True, created=now, updated=now) for i in range(100)]
+        data = {
+            'meta': {'limit': 100, 'offset': 0, 'total_count': 100},
+            'objects': [resource.full_dehydrate(note) for note in notes],
+            }
+        simple = Serializer()
+        direct = JSONSerializer()
+        
+        self.assertEqual(simple.to_json(data), direct.to_json(data))
+        
+        # there's no `to_simple` pass
+        direct.to_simple = counter = counted(direct.to_simple)
+        direct.to_json(data)
+        self.assertEqual(counter.calls, 0)
+        
+        self.compare('to_json (100 notes)', 
+            lambda i: simple.to_json(data), lambda i: direct.to_json(data), n=50)
+
+
+class AsyncDispatchBenchmark(Benchmark):
+    def test_slow_backend(self):
+        from core.tests.dispatch import SlowGreetingResource, later
+        from apiserver.utils import ThreadPool
+        
+        # the same view, waiting on a backend that takes 50 ms, 
+        # as a coroutine and holding on to a thread
+        class BlockingGreetingResource(SlowGreetingResource):
+            def show(self, request, filters, format):
+                return {'greeting': 'hello %s' % later(filters['name']).result()}
+        
+        n = 40
+        pool = ThreadPool(4)
+        blocking = BlockingGreetingResource()
+        coroutine = SlowGreetingResource()
+        
+        def with_threads(i):
+            futures = [pool.submit(blocking.dispatch, MockRequest(), name=str(j), __format=None) for j in range(n)]
+            return [future.result() for future in futures]
+        
+        def with_coroutines(i):
+            futures = [coroutine.dispatch_async(MockRequest(), name=str(j), __format=None) for j in range(n)]
+            return [future.result() for future in futures]
+        
+        # coroutines wait without taking a thread from the pool
+        get_pool = utils.get_pool
+        utils.get_pool = counter = counted(get_pool)
+        try:
+            responses = with_coroutines(0)
+            self.assertEqual(counter.calls, 0)
+        finally:
+            utils.get_pool = get_pool
+        self.assertEqual(responses[-1].content, '{"greeting": "hello %d"}' % (n - 1))
+        
+        self.compare('slow backend, %d requests on 4 threads' % n, 
+            with_threads, with_coroutines, n=1)
@@ -1,7 +1,16 @@
 import time
+from django.conf import settings
 from django.core.cache import cache
+from django.db import connection, reset_queries
+from django.db.models import signals
+from django.http import QueryDict
 from django.test import TestCase
-from apiserver.cache import NoCache, SimpleCache
+from apiserver import fields
+from apiserver.cache import NoCache, SimpleCache, ResponseCache, get_generation, bump_generation, make_key, get_namespace
+from apiserver.resources import ModelResource
+from core.models import Note, Subject
+from core.tests.dispatch import NoteResource, NoteCollection, no_dehydration
+from core.tests.mocks import MockRequest
 
 
 class NoCacheTestCase(TestCase):
@@ -56,3 +65,245 @@ class SimpleCacheTestCase(TestCase):
         # Check expiration.
         time.sleep(2)
         self.assertEqual(cache.get('moof'), None)
+
+
+class GenerationTestCase(TestCase):
+    def setUp(self):
+        super(GenerationTestCase, self).setUp()
+        cache.clear()
+    
+    def test_keys(self):
+        key = make_key(NoteResource(), 'detail', {'pk': '1'})
+        self.assertTrue(key.startswith('apiserver:1:core.tests.dispatch.NoteResource:'))
+        self.assertEqual(make_key(NoteResource, 'detail', {'pk': '1'}), key)
+        
+        # the same filters for a different resource don't collide
+        self.assertNotEqual(make_key(NoteCollection, 'detail', {'pk': '1'}), key)
+        self.assertNotEqual(make_key(NoteResource, 'list', {'pk': '1'}), key)
+    
+    def test_bump(self):
+        generation = get_generation(NoteResource)
+        key = make_key(NoteResource, 'detail', {'pk': '1'})
+        self.assertEqual(get_generation(NoteResource()), generation)
+        
+        self.assertEqual(bump_generation(NoteResource), generation + 1)
+        self.assertNotEqual(make_key(NoteResource, 'detail', {'pk': '1'}), key)
+        self.assertEqual(get_generation(NoteCollection), get_generation(NoteCollection))
+        
+        # a counter that got evicted doesn't start over
+        cache.clear()
+        self.assertTrue(get_generation(NoteResource) > generation)
+        cache.clear()
+        self.assertTrue(bump_generation(NoteResource) > generation)
+
+
+class CachedNoteResource(NoteResource):
+    class Meta(NoteResource.Meta):
+        route = '/cached/notes/<pk:#>'
+        response_cache = ResponseCache(timeout=60)
+
+
+class CachedNoteCollection(NoteCollection):
+    class Meta(NoteCollection.Meta):
+        route = '/cached/notes'
+        response_cache = ResponseCache(timeout=60, per_user=False)
+
+
+class ResponseCacheTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    
+    def setUp(self):
+        super(ResponseCacheTestCase, self).setUp()
+        cache.clear()
+        self.request = MockRequest()
+        self.request.GET = QueryDict('')
+        self.old_debug = settings.DEBUG
+        settings.DEBUG = True
+    
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+        cache.clear()
+        super(ResponseCacheTestCase, self).tearDown()
+    
+    def test_hit(self):
+        first = CachedNoteResource().dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(first.status_code, 200)
+        
+        resource = CachedNoteResource()
+        resource.full_dehydrate = no_dehydration
+        reset_queries()
+        resp = resource.dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, first.content)
+        self.assertEqual(resp['Content-Type'], first['Content-Type'])
+        self.assertEqual(len(connection.queries), 0)
+        
+        self.request.method = 'HEAD'
+        resp = resource.dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, '')
+        self.assertEqual(len(connection.queries), 0)
+        
+        resource.bump_cache_generation()
+        reset_queries()
+        resp = CachedNoteResource().dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(len(connection.queries), 1)
+    
+    def test_errors_are_not_cached(self):
+        CachedNoteResource().dispatch(self.request, pk='9999', __format=None)
+        reset_queries()
+        resp = CachedNoteResource().dispatch(self.request, pk='9999', __format=None)
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(len(connection.queries), 1)
+    
+    def test_keys(self):
+        resource = CachedNoteResource()
+        key = resource._meta.response_cache.get_key(resource, self.request, {'pk': '1'}, 'application/json')
+        
+        # query strings are normalized
+        self.request.GET = QueryDict('b=2&a=1&a=0')
+        one = resource._meta.response_cache.get_key(resource, self.request, {'pk': '1'}, 'application/json')
+        self.request.GET = QueryDict('a=0&b=2&a=1')
+        other = resource._meta.response_cache.get_key(resource, self.request, {'pk': '1'}, 'application/json')
+        self.assertEqual(one, other)
+        self.assertNotEqual(one, key)
+        self.request.GET = QueryDict('')
+        
+        # and so on for routes, formats and users
+        keys = set([
+            key,
+            resource._meta.response_cache.get_key(resource, self.request, {'pk': '2'}, 'application/json'),
+            resource._meta.response_cache.get_key(resource, self.request, {'pk': '1'}, 'application/xml'),
+            ])
+        self.request.META['REMOTE_ADDR'] = '10.0.0.1'
+        keys.add(resource._meta.response_cache.get_key(resource, self.request, {'pk': '1'}, 'application/json'))
+        self.assertEqual(len(keys), 4)
+        
+        # unless we don't care who's asking
+        collection = CachedNoteCollection()
+        anonymous = MockRequest()
+        anonymous.GET = QueryDict('')
+        self.assertEqual(
+            collection._meta.response_cache.get_key(collection, self.request, {}, 'application/json'),
+            collection._meta.response_cache.get_key(collection, anonymous, {}, 'application/json'),
+            )
+    
+    def test_head_does_not_fill(self):
+        self.request.method = 'HEAD'
+        CachedNoteResource().dispatch(self.request, pk='1', __format=None)
+        
+        self.request.method = 'GET'
+        reset_queries()
+        resp = CachedNoteResource().dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(connection.queries), 1)
+    
+    def test_not_modified(self):
+        class CachedVersionedNoteResource(CachedNoteResource):
+            class Meta(CachedNoteResource.Meta):
+                version = 'updated'
+        
+        etag = CachedVersionedNoteResource().dispatch(self.request, pk='1', __format=None)['ETag']
+        self.request.META['HTTP_IF_NONE_MATCH'] = etag
+        reset_queries()
+        resp = CachedVersionedNoteResource().dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['ETag'], etag)
+        self.assertEqual(len(connection.queries), 0)
+
+
+class SimpleCachedNoteResource(NoteResource):
+    class Meta(NoteResource.Meta):
+        route = '/simple/notes/<pk:#>'
+        cache = SimpleCache()
+
+
+class SubjectResource(ModelResource):
+    class Meta:
+        route = '/subjects/<pk:#>'
+        queryset = Subject.objects.all()
+
+
+class CachedSubjectNoteCollection(CachedNoteCollection):
+    subjects = fields.ToManyField(SubjectResource, 'subjects')
+    
+    class Meta(CachedNoteCollection.Meta):
+        route = '/subjects/notes'
+
+
+class InvalidationTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    
+    def setUp(self):
+        super(InvalidationTestCase, self).setUp()
+        cache.clear()
+        self.old_debug = settings.DEBUG
+        settings.DEBUG = True
+    
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+        cache.clear()
+        super(InvalidationTestCase, self).tearDown()
+    
+    def test_detail(self):
+        resource = SimpleCachedNoteResource()
+        resource.cached_obj_get(filters={'pk': '1'})
+        resource.cached_obj_get(filters={'pk': '2'})
+        generation = get_generation(SimpleCachedNoteResource)
+        
+        # only the entry for the object that changed goes
+        Note.objects.get(pk=1).save()
+        reset_queries()
+        resource.cached_obj_get(filters={'pk': '2'})
+        self.assertEqual(len(connection.queries), 0)
+        resource.cached_obj_get(filters={'pk': '1'})
+        self.assertEqual(len(connection.queries), 1)
+        self.assertEqual(get_generation(SimpleCachedNoteResource), generation)
+        
+        Note.objects.get(pk=2).delete()
+        reset_queries()
+        self.assertRaises(Note.DoesNotExist, resource.cached_obj_get, filters={'pk': '2'})
+        
+        # which is where `show` gets its objects
+        resource.full_dehydrate = lambda obj, fieldset=None: obj
+        resource.show(MockRequest(), {'pk': '1'}, None)
+        reset_queries()
+        self.assertEqual(resource.show(MockRequest(), {'pk': '1'}, None).pk, 1)
+        self.assertEqual(len(connection.queries), 0)
+    
+    def test_receivers(self):
+        CachedSubjectNoteCollection()
+        uid = get_namespace(CachedSubjectNoteCollection)
+        def senders(signal):
+            return len([key for key, receiver in signal.receivers if key[0] == uid])
+        
+        # only notes and subjects, once each, however many instances there are
+        CachedSubjectNoteCollection()
+        self.assertEqual(senders(signals.post_save), 2)
+        self.assertEqual(senders(signals.post_delete), 2)
+        self.assertEqual(senders(signals.m2m_changed), 1)
+    
+    def test_collection(self):
+        generation = get_generation(CachedNoteCollection)
+        Note.objects.get(pk=1).save()
+        self.assertTrue(get_generation(CachedNoteCollection) > generation)
+        
+        # resources don't care about models they don't show
+        generation = get_generation(CachedNoteCollection)
+        subject = Subject.objects.create(name='Music', url='http://example.com/music')
+        self.assertEqual(get_generation(CachedNoteCollection), generation)
+    
+    def test_related(self):
+        # related models are listened to once there's an instance
+        CachedSubjectNoteCollection()
+        subject = Subject.objects.create(name='Music', url='http://example.com/music')
+        generation = get_generation(CachedSubjectNoteCollection)
+        
+        subject.name = 'Musicals'
+        subject.save()
+        self.assertTrue(get_generation(CachedSubjectNoteCollection) > generation)
+        
+        generation = get_generation(CachedSubjectNoteCollection)
+        subject.notes.add(Note.objects.get(pk=1))
+        self.assertTrue(get_generation(CachedSubjectNoteCollection) > generation)
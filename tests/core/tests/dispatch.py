@@ -0,0 +1,454 @@
+import datetime
+import sys
+import threading
+import time
+from django.conf import settings
+from django.db import connection, reset_queries
+from django.http import QueryDict
+from django.utils.http import http_date
+from django.test import TestCase
+from apiserver.decorators import only, on_error
+from apiserver.metrics import Registry
+from apiserver.resources import Resource, ModelResource, ModelCollection
+from apiserver.timing import TimingSink, phase
+from apiserver.utils import Future, run_coroutine
+from core.models import Note
+from core.tests.mocks import MockRequest
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+@only('show')
+class GreetingResource(Resource):
+    class Meta:
+        route = '/greetings/<name:s>'
+
+    def show(self, request, filters, format):
+        return {'greeting': 'hello %s' % filters['name']}
+
+
+def later(value, delay=0.05):
+    """
+    A stand-in for a slow backend, which answers after ``delay``
+    seconds without holding on to a thread in the meantime.
+    """
+    future = Future()
+    threading.Timer(delay, future.set_result, [value]).start()
+    return future
+
+
+def fail_later(delay=0.05):
+    future = Future()
+    def fail():
+        try:
+            raise IOError("Backend unavailable.")
+        except IOError:
+            future.set_exception(sys.exc_info())
+    threading.Timer(delay, fail).start()
+    return future
+
+
+@only('show', 'update')
+class SlowGreetingResource(Resource):
+    class Meta:
+        route = '/slow/greetings/<name:s>'
+
+    def show(self, request, filters, format):
+        name = yield later(filters['name'])
+        if name == 'nobody':
+            yield 404
+        else:
+            yield {'greeting': 'hello %s' % name}
+
+    def update(self, request, filters, format):
+        try:
+            yield fail_later()
+        except IOError, e:
+            yield {'error': str(e)}, 503
+
+
+@only('show', 'update')
+class BrokenGreetingResource(Resource):
+    class Meta:
+        route = '/broken/greetings/<name:s>'
+
+    def show(self, request, filters, format):
+        name = yield later(filters['name'])
+        if name == 'nobody':
+            raise NotImplementedError()
+        raise ValueError("Can't greet %s." % name)
+
+    def update(self, request, filters, format):
+        raise ValueError("Can't greet anyone.")
+        yield
+
+
+class RecordingSink(TimingSink):
+    def __init__(self):
+        self.records = []
+
+    def record(self, resource, request, response, timing):
+        self.records.append(timing)
+
+
+@only('show')
+class MeasuredSlowGreetingResource(Resource):
+    class Meta:
+        route = '/measured/greetings/<name:s>'
+        timing_sink = RecordingSink()
+        server_timing = True
+        metrics = Registry()
+        query_log = True
+
+    def show(self, request, filters, format):
+        # this half runs on the thread that dispatches...
+        count = Note.objects.count()
+        name = yield later(filters['name'])
+        # ...and this half on whichever thread finishes the wait
+        with phase('greet'):
+            greeting = 'hello %s' % name
+        yield {'greeting': greeting, 'count': count}
+
+
+class NoteResource(ModelResource):
+    class Meta:
+        route = '/notes/<pk:#>'
+        queryset = Note.objects.filter(is_active=True)
+
+
+class NoteCollection(ModelCollection, NoteResource):
+    class Meta(NoteResource.Meta):
+        route = '/notes'
+
+
+def no_dehydration(obj):
+    raise AssertionError("HEAD requests shouldn't dehydrate anything.")
+
+
+class DispatchTestCase(TestCase):
+    def test_freeze_methods(self):
+        resource = GreetingResource()
+        self.assertEqual(sorted(resource.methods.keys()), ['GET', 'HEAD', 'OPTIONS'])
+        self.assertFalse(hasattr(resource.head, 'not_implemented'))
+
+        resource.freeze_methods()
+        self.assertEqual(sorted(resource.methods.keys()), ['GET', 'HEAD', 'OPTIONS'])
+        self.assertTrue(resource.methods is resource.methods)
+        self.assertRaises(TypeError, resource.methods.__setitem__, 'PUT', resource.update)
+        self.assertRaises(TypeError, resource.methods.pop, 'GET')
+
+    def test_dispatch_frozen(self):
+        resource = GreetingResource()
+        resource.freeze_methods()
+        request = MockRequest()
+
+        resp = resource.dispatch(request, name='world', __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.content), {'greeting': 'hello world'})
+
+        request.method = 'PUT'
+        self.assertRaises(NotImplementedError, resource.dispatch, request, name='world', __format=None)
+
+        request.method = 'OPTIONS'
+        resp = resource.dispatch(request, name='world', __format=None)
+        self.assertEqual(sorted(resp['Allow'].split(', ')), ['GET', 'HEAD', 'OPTIONS'])
+
+
+class HeadTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+
+    def setUp(self):
+        super(HeadTestCase, self).setUp()
+        self.request = MockRequest()
+        self.request.method = 'HEAD'
+        self.old_debug = settings.DEBUG
+        settings.DEBUG = True
+
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+        super(HeadTestCase, self).tearDown()
+
+    def test_head_resource(self):
+        resource = GreetingResource()
+        resp = resource.dispatch(self.request, name='world', __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/json; charset=utf-8')
+        self.assertEqual(resp.content, '')
+
+    def test_head_model_resource(self):
+        resource = NoteResource()
+        resource.full_dehydrate = no_dehydration
+
+        reset_queries()
+        resp = resource.dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, '')
+        self.assertEqual(len(connection.queries), 1)
+
+        resp = resource.dispatch(self.request, pk='9999', __format=None)
+        self.assertEqual(resp.status_code, 404)
+
+        # the same status and content type as a GET
+        self.request.method = 'GET'
+        resp = NoteResource().dispatch(self.request, pk='9999', __format=None)
+        self.assertEqual(resp.status_code, 404)
+        resp = NoteResource().dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/json; charset=utf-8')
+
+    def test_head_collection(self):
+        collection = NoteCollection()
+        collection.full_dehydrate = no_dehydration
+
+        reset_queries()
+        resp = collection.dispatch(self.request, __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['X-Total-Count'], '4')
+        self.assertEqual(resp.content, '')
+        self.assertEqual(len(connection.queries), 1)
+
+
+class VersionedNoteResource(NoteResource):
+    class Meta(NoteResource.Meta):
+        route = '/versioned/notes/<pk:#>'
+        version = 'updated'
+
+
+class VersionedNoteCollection(ModelCollection, VersionedNoteResource):
+    class Meta(VersionedNoteResource.Meta):
+        route = '/versioned/notes'
+
+
+class ConditionalTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+
+    def setUp(self):
+        super(ConditionalTestCase, self).setUp()
+        self.request = MockRequest()
+        self.old_debug = settings.DEBUG
+        settings.DEBUG = True
+        self.last_modified = http_date(time.mktime(datetime.datetime(2010, 3, 30, 20, 5).timetuple()))
+
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+        super(ConditionalTestCase, self).tearDown()
+
+    def test_validators(self):
+        # without a copy to check, there's no need to look up the version
+        reset_queries()
+        resp = VersionedNoteResource().dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(connection.queries), 1)
+        # timestamps are in local time
+        self.assertEqual(resp['Last-Modified'], self.last_modified)
+        self.assertTrue(resp.has_header('ETag'))
+        self.request.method = 'HEAD'
+        self.assertEqual(VersionedNoteResource().dispatch(self.request, pk='1', __format=None)['ETag'], resp['ETag'])
+        self.request.method = 'GET'
+
+        # unversioned resources and collections don't get validators
+        resp = NoteResource().dispatch(self.request, pk='1', __format=None)
+        self.assertFalse(resp.has_header('ETag'))
+        self.request.method = 'HEAD'
+        resp = VersionedNoteCollection().dispatch(self.request, __format=None)
+        self.assertFalse(resp.has_header('ETag'))
+        self.request.method = 'GET'
+
+        resp = VersionedNoteResource().dispatch(self.request, pk='9999', __format=None)
+        self.assertEqual(resp.status_code, 404)
+        self.assertFalse(resp.has_header('ETag'))
+
+    def test_if_none_match(self):
+        etag = VersionedNoteResource().dispatch(self.request, pk='1', __format=None)['ETag']
+
+        resource = VersionedNoteResource()
+        resource.full_dehydrate = no_dehydration
+        self.request.META['HTTP_IF_NONE_MATCH'] = etag
+        reset_queries()
+        resp = resource.dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['ETag'], etag)
+        self.assertEqual(len(connection.queries), 1)
+
+        self.request.method = 'HEAD'
+        resp = resource.dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(resp.status_code, 304)
+
+        # other fieldsets are other representations
+        self.request.method = 'GET'
+        self.request.GET = QueryDict('fields=title')
+        resp = VersionedNoteResource().dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(sorted(json.loads(resp.content)), ['resource_uri', 'title'])
+        self.assertNotEqual(resp['ETag'], etag)
+        self.request.META['HTTP_IF_NONE_MATCH'] = resp['ETag']
+        resp = resource.dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(resp.status_code, 304)
+        self.request.GET = QueryDict('')
+        resp = VersionedNoteResource().dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.request.META['HTTP_IF_NONE_MATCH'] = etag
+
+        # a change means a new version
+        Note.objects.get(pk=1).save()
+        self.request.method = 'GET'
+        resp = VersionedNoteResource().dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+
+    def test_if_modified_since(self):
+        resource = VersionedNoteResource()
+        resource.full_dehydrate = no_dehydration
+        self.request.META['HTTP_IF_MODIFIED_SINCE'] = self.last_modified
+        resp = resource.dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(resp.status_code, 304)
+
+        self.request.META['HTTP_IF_MODIFIED_SINCE'] = http_date(time.mktime(datetime.datetime(2010, 3, 30, 20, 4, 59).timetuple()))
+        resp = VersionedNoteResource().dispatch(self.request, pk='1', __format=None)
+        self.assertEqual(resp.status_code, 200)
+
+
+class StreamingTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    
+    def test_stream(self):
+        from core.tests import uri_urls
+        request = MockRequest()
+        
+        collection = uri_urls.StreamingNoteCollection()
+        dehydrated = []
+        full_dehydrate = collection.full_dehydrate
+        collection.full_dehydrate = lambda obj, fieldset=None: dehydrated.append(obj) or full_dehydrate(obj, fieldset)
+        
+        resp = collection.dispatch(request, __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/json; charset=utf-8')
+        self.assertEqual(dehydrated, [])
+        
+        # identical to what we'd get without streaming
+        content = resp.content
+        self.assertEqual(len(dehydrated), 6)
+        self.assertEqual(content, uri_urls.NoteCollection().dispatch(request, __format=None).content)
+        self.assertEqual(json.loads(content)['meta']['total_count'], 6)
+
+
+class AsyncDispatchTestCase(TestCase):
+    urls = 'core.tests.uri_urls'
+
+    def test_run_coroutine(self):
+        def add():
+            a = yield later(1)
+            b = yield later(2, delay=0)
+            yield a + b
+
+        self.assertEqual(run_coroutine(add()).result(1), 3)
+
+        def broken():
+            yield fail_later()
+
+        self.assertRaises(IOError, run_coroutine(broken()).result, 1)
+
+    def test_coroutine_view(self):
+        resource = SlowGreetingResource()
+        self.assertTrue(resource.is_coroutine('GET'))
+        request = MockRequest()
+
+        future = resource.dispatch_async(request, name='world', __format=None)
+        self.assertFalse(future.done())
+        resp = future.result(1)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.content), {'greeting': 'hello world'})
+
+        # exceptions get thrown into the view
+        request.method = 'PUT'
+        resp = resource.dispatch_async(request, name='world', __format=None).result(1)
+        self.assertEqual(resp.status_code, 503)
+
+        # and plain dispatch waits for the view to finish
+        request.method = 'GET'
+        resp = resource.dispatch(request, name='world', __format=None)
+        self.assertEqual(json.loads(resp.content), {'greeting': 'hello world'})
+
+        # as does HEAD, which gets the same status as GET
+        self.assertEqual(resource.dispatch(request, name='nobody', __format=None).status_code, 404)
+        request.method = 'HEAD'
+        self.assertEqual(resource.dispatch(request, name='nobody', __format=None).status_code, 404)
+        resp = resource.dispatch_async(request, name='world', __format=None).result(1)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, '')
+
+    def test_errors(self):
+        # coroutine views get the same error handling as other views, 
+        # whenever they raise
+        resource = BrokenGreetingResource()
+        on_error(NotImplementedError, 501).decorate_cls(resource)
+        on_error(BaseException, 500).decorate_cls(resource)
+        resource.freeze_methods()
+        self.assertTrue(resource.is_coroutine('GET'))
+        
+        request = MockRequest()
+        for name, status in [('world', 500), ('nobody', 501)]:
+            resp = resource.dispatch_async(request, name=name, __format=None).result(1)
+            self.assertEqual(resp.status_code, status)
+            self.assertTrue('error' in json.loads(resp.content))
+            self.assertEqual(resource.dispatch(request, name=name, __format=None).status_code, status)
+        
+        request.method = 'PUT'
+        self.assertEqual(resource.dispatch_async(request, name='world', __format=None).result(1).status_code, 500)
+        
+        # and those that don't raise still wait and answer as usual
+        resource = SlowGreetingResource()
+        on_error(BaseException, 500).decorate_cls(resource)
+        resource.freeze_methods()
+        resp = resource.dispatch_async(MockRequest(), name='world', __format=None).result(1)
+        self.assertEqual(json.loads(resp.content), {'greeting': 'hello world'})
+        request.method = 'PUT'
+        self.assertEqual(resource.dispatch_async(request, name='world', __format=None).result(1).status_code, 503)
+
+    def test_measured(self):
+        resource = MeasuredSlowGreetingResource()
+        sink = resource._meta.timing_sink
+        sink.records = []
+        resource._meta.metrics.reset()
+
+        # coroutine views report the same, whether they hold on
+        # to a thread or not
+        responses = [resource.dispatch_async(MockRequest(), name='world', __format=None).result(1),
+            resource.dispatch(MockRequest(), name='world', __format=None)]
+        self.assertEqual(len(sink.records), 2)
+        for resp, timing in zip(responses, sink.records):
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue('greet' in timing.phases)
+            self.assertTrue('serialize' in timing.phases)
+            self.assertTrue(timing.total is not None)
+            self.assertEqual(timing.queries.count, 1)
+            self.assertEqual(resp['Server-Timing'], timing.to_header())
+
+        metrics = resource._meta.metrics.to_dict()['resources']['MeasuredSlowGreetingResource']
+        self.assertEqual(metrics['statuses'], {'200': 2})
+        self.assertEqual(metrics['queries']['count'], 2)
+
+    def test_sync_view(self):
+        resource = GreetingResource()
+        self.assertFalse(resource.is_coroutine('GET'))
+        resp = resource.dispatch_async(MockRequest(), name='world', __format=None).result(1)
+        self.assertEqual(json.loads(resp.content), {'greeting': 'hello world'})
+
+        request = MockRequest()
+        request.method = 'PUT'
+        self.assertRaises(NotImplementedError, resource.dispatch_async(request, name='world', __format=None).result, 1)
+
+    def test_api(self):
+        from core.tests.uri_urls import api
+        request = MockRequest()
+        request.path_info = '/api/v1/slow/1'
+        resp = api.dispatch_async(request).result(1)
+        self.assertEqual(json.loads(resp.content), {'name': '1'})
+
+        request.path_info = '/api/v1/nowhere'
+        self.assertEqual(api.dispatch_async(request).result(1).status_code, 404)
@@ -0,0 +1,87 @@
+from django.test import TestCase
+from apiserver.metrics import Registry, to_prometheus
+from apiserver.resources import Metrics
+from core.tests.mocks import MockRequest
+from core.tests import uri_urls
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+class MeasuredNoteCollection(uri_urls.NoteCollection):
+    class Meta(uri_urls.NoteCollection.Meta):
+        metrics = Registry()
+    
+    def get_resource_collection_uri(self, filters={}):
+        return '/api/v1/notes'
+
+
+class MeasuredNoteResource(uri_urls.NoteResource):
+    class Meta(uri_urls.NoteResource.Meta):
+        metrics = MeasuredNoteCollection.Meta.metrics
+
+
+class RegistryMetrics(Metrics):
+    class Meta:
+        metrics = MeasuredNoteCollection.Meta.metrics
+
+
+class MetricsTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    
+    def setUp(self):
+        super(MetricsTestCase, self).setUp()
+        self.registry = MeasuredNoteCollection.Meta.metrics
+        self.registry.reset()
+    
+    def test_registry(self):
+        registry = Registry(buckets=(10, 100))
+        registry.observe('Notes', 200, 5)
+        registry.observe('Notes', 200, 50)
+        registry.observe('Notes', 404, 500)
+        registry.dehydrated('Notes', 20)
+        
+        notes = registry.to_dict()['resources']['Notes']
+        self.assertEqual(notes['requests'], 3)
+        self.assertEqual(notes['latency'], {'buckets': [[10, 1], [100, 2], [None, 3]], 'sum': 555, 'count': 3})
+        self.assertEqual(notes['statuses'], {'200': 2, '404': 1})
+        self.assertEqual(notes['objects'], 20)
+        
+        text = to_prometheus(registry.to_dict())
+        self.assertTrue('# TYPE apiserver_request_duration_seconds histogram' in text)
+        self.assertTrue('apiserver_request_duration_seconds_bucket{resource="Notes",le="0.1"} 2\n' in text)
+        self.assertTrue('apiserver_request_duration_seconds_bucket{resource="Notes",le="+Inf"} 3\n' in text)
+        self.assertTrue('apiserver_request_duration_seconds_sum{resource="Notes"} 0.555\n' in text)
+        self.assertTrue('apiserver_responses_total{resource="Notes",status="404"} 1\n' in text)
+        self.assertTrue('apiserver_dehydrated_objects_total{resource="Notes"} 20\n' in text)
+    
+    def test_dispatch(self):
+        MeasuredNoteCollection().dispatch(MockRequest(), __format=None)
+        MeasuredNoteResource().dispatch(MockRequest(), slug='first-post', pk='1', __format=None)
+        MeasuredNoteResource().dispatch(MockRequest(), slug='first-post', pk='99', __format=None)
+        
+        resources = self.registry.to_dict()['resources']
+        self.assertEqual(resources['MeasuredNoteCollection']['statuses'], {'200': 1})
+        self.assertEqual(resources['MeasuredNoteCollection']['objects'], 6)
+        self.assertEqual(resources['MeasuredNoteResource']['statuses'], {'200': 1, '404': 1})
+        self.assertEqual(resources['MeasuredNoteResource']['objects'], 1)
+        self.assertEqual(resources['MeasuredNoteResource']['latency']['count'], 2)
+    
+    def test_resource(self):
+        MeasuredNoteCollection().dispatch(MockRequest(), __format=None)
+        resource = RegistryMetrics()
+        
+        resp = resource.dispatch(MockRequest(), __format=None)
+        self.assertEqual(resp['Content-Type'], 'application/json; charset=utf-8')
+        self.assertEqual(json.loads(resp.content)['resources']['MeasuredNoteCollection']['objects'], 6)
+        
+        resp = resource.dispatch(MockRequest(), __format='txt')
+        self.assertEqual(resp['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertTrue('apiserver_dehydrated_objects_total{resource="MeasuredNoteCollection"} 6\n' in resp.content)
+        
+        request = MockRequest()
+        request.META['HTTP_ACCEPT'] = 'text/plain;version=0.0.4;q=0.5,*/*;q=0.1'
+        resp = resource.dispatch(request, __format=None)
+        self.assertEqual(resp['Content-Type'], 'text/plain; charset=utf-8')
@@ -1,10 +1,20 @@
+import datetime
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+import apiserver.paginator
 from apiserver.exceptions import BadRequest
-from apiserver.paginator import Paginator
+from apiserver.paginator import Paginator, CursorPaginator, ExactCount, CachedCount, EstimatedCount, NoCount
 from core.models import Note
+from core.tests.mocks import MockRequest
 from core.tests.resources import NoteResource
 from django.db import reset_queries
+from django.http import QueryDict
+try:
+    import json
+except ImportError:
+    import simplejson as json
 
 
 class PaginatorTestCase(TestCase):
@@ -142,3 +152,214 @@ class PaginatorTestCase(TestCase):
         # differently.
         page = paginator.page()
         self.assertEqual(page['objects'], ['foo', 'bar'])
+
+
+class SmallCursorPaginator(CursorPaginator):
+    max_limit = 3
+
+
+class CursorPaginatorTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    
+    def setUp(self):
+        super(CursorPaginatorTestCase, self).setUp()
+        self.old_debug = settings.DEBUG
+        settings.DEBUG = True
+    
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+        super(CursorPaginatorTestCase, self).tearDown()
+    
+    def walk(self, objects, limit=2, paginator_class=CursorPaginator):
+        pages = []
+        query = ''
+        while query is not None:
+            paginator = paginator_class(QueryDict(query), objects, resource_uri='/api/v1/notes/', limit=limit)
+            reset_queries()
+            page = paginator.page()
+            self.assertEqual(len(connection.queries), 1)
+            pages.append([obj.pk for obj in page['objects']])
+            
+            if page['meta']['next']:
+                query = page['meta']['next'].split('?', 1)[1]
+            else:
+                query = None
+        return pages
+    
+    def test_pages(self):
+        self.assertEqual(self.walk(Note.objects.all()), [[1, 2], [3, 4], [5, 6]])
+        self.assertEqual(self.walk(Note.objects.all(), limit=4), [[1, 2, 3, 4], [5, 6]])
+        self.assertEqual(self.walk(Note.objects.all(), limit=0), [[1, 2, 3, 4, 5, 6]])
+        # everything at once only goes as far as the largest page
+        self.assertEqual(self.walk(Note.objects.all(), limit=0, paginator_class=SmallCursorPaginator), [[1, 2, 3], [4, 5, 6]])
+        self.assertEqual(self.walk(Note.objects.all(), limit=5, paginator_class=SmallCursorPaginator), [[1, 2, 3], [4, 5, 6]])
+        self.assertEqual(self.walk(Note.objects.filter(is_active=True)), [[1, 2], [4, 6]])
+    
+    def test_ordering(self):
+        Note.objects.filter(pk__in=[2, 5]).update(created=datetime.datetime(2010, 3, 30, 20, 5, 0, 500))
+        self.assertEqual(self.walk(Note.objects.order_by('-created')), [[6, 4], [2, 5], [1, 3]])
+        self.assertEqual(self.walk(Note.objects.order_by('created', '-pk'), limit=3), [[3, 1, 5], [2, 4, 6]])
+    
+    def test_stable(self):
+        paginator = CursorPaginator(QueryDict(''), Note.objects.all(), resource_uri='/api/v1/notes/', limit=2)
+        next = paginator.page()['meta']['next']
+        Note.objects.get(pk=1).delete()
+        
+        paginator = CursorPaginator(QueryDict(next.split('?', 1)[1]), Note.objects.all(), resource_uri='/api/v1/notes/', limit=2)
+        self.assertEqual([obj.pk for obj in paginator.page()['objects']], [3, 4])
+    
+    def test_invalid(self):
+        paginator = CursorPaginator(QueryDict('offset=2'), Note.objects.all(), limit=2)
+        self.assertRaises(BadRequest, paginator.page)
+        
+        for cursor in ['nonsense', 'WzEsIDJd', 'e30=']:
+            paginator = CursorPaginator(QueryDict('cursor=' + cursor), Note.objects.all(), limit=2)
+            self.assertRaises(BadRequest, paginator.page)
+    
+    def test_nullable(self):
+        for ordering in ['author', '-author__username', 'author__notes__title']:
+            paginator = CursorPaginator(QueryDict(''), Note.objects.order_by(ordering), limit=2)
+            self.assertRaises(BadRequest, paginator.page)
+        self.assertEqual(CursorPaginator(QueryDict(''), Note.objects.order_by('-title'), limit=2).get_ordering(), ['-title', 'pk'])
+    
+    def test_collection(self):
+        from core.tests.uri_urls import CursorNoteCollection
+        request = MockRequest()
+        request.GET = QueryDict('')
+        resp = CursorNoteCollection().dispatch(request, __format=None)
+        content = json.loads(resp.content)
+        self.assertEqual(len(content['objects']), 4)
+        self.assertEqual(sorted(content['meta'].keys()), ['limit', 'next'])
+        self.assertTrue(content['meta']['next'].startswith('/api/v1/cursor/notes?'))
+        
+        request.GET = QueryDict('offset=4')
+        resp = CursorNoteCollection().dispatch(request, __format=None)
+        self.assertEqual(resp.status_code, 400)
+        
+        # HEAD doesn't count either
+        request.GET = QueryDict('')
+        request.method = 'HEAD'
+        reset_queries()
+        resp = CursorNoteCollection().dispatch(request, __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(resp.has_header('X-Total-Count'))
+        self.assertEqual(len(connection.queries), 0)
+
+
+class CountStrategyTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    
+    def setUp(self):
+        super(CountStrategyTestCase, self).setUp()
+        cache.clear()
+        self.old_debug = settings.DEBUG
+        settings.DEBUG = True
+    
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+        super(CountStrategyTestCase, self).tearDown()
+    
+    def page(self, strategy, objects=None, offset=0):
+        if objects is None:
+            objects = Note.objects.all()
+        paginator = Paginator({}, objects, resource_uri='/api/v1/notes/', limit=2, offset=offset, count_strategy=strategy)
+        reset_queries()
+        return paginator.page()
+    
+    def test_exact(self):
+        page = self.page(ExactCount())
+        self.assertEqual(page['meta']['total_count'], 6)
+        self.assertEqual(page['meta']['count_strategy'], 'exact')
+        self.assertEqual(page['meta']['next'], '/api/v1/notes/?limit=2&offset=2')
+        self.assertEqual(Paginator({}, Note.objects.all()).page()['meta']['count_strategy'], 'exact')
+    
+    def test_cached(self):
+        strategy = CachedCount(timeout=60)
+        page = self.page(strategy)
+        self.assertEqual(page['meta']['total_count'], 6)
+        self.assertEqual(page['meta']['count_strategy'], 'cached')
+        
+        # the count is reused, even though it's out of date, 
+        # but the next page is still worked out correctly
+        Note.objects.filter(pk__in=[5, 6]).delete()
+        page = self.page(strategy, offset=2)
+        self.assertEqual(len(connection.queries), 1)
+        self.assertEqual(page['meta']['total_count'], 6)
+        self.assertEqual(page['meta']['next'], None)
+        
+        # other filters get counted separately
+        page = self.page(strategy, Note.objects.filter(is_active=True))
+        self.assertEqual(page['meta']['total_count'], 3)
+        page = self.page(strategy, Note.objects.filter(is_active=False))
+        self.assertEqual(page['meta']['total_count'], 1)
+        
+        # the SQL that the key is made from is only compiled once
+        get_sql = apiserver.paginator.get_sql
+        compiled = []
+        apiserver.paginator.get_sql = lambda objects: compiled.append(objects) or get_sql(objects)
+        try:
+            self.page(strategy)
+        finally:
+            apiserver.paginator.get_sql = get_sql
+        self.assertEqual(len(compiled), 1)
+    
+    def test_estimated(self):
+        page = self.page(EstimatedCount(estimator=lambda objects: 5000))
+        self.assertEqual(page['meta']['total_count'], 5000)
+        self.assertEqual(page['meta']['count_strategy'], 'estimated')
+        self.assertEqual(len(connection.queries), 1)
+        self.assertEqual(page['meta']['next'], '/api/v1/notes/?limit=2&offset=2')
+        
+        # small or missing estimates are replaced with exact counts
+        page = self.page(EstimatedCount(estimator=lambda objects: 10))
+        self.assertEqual(page['meta']['total_count'], 6)
+        page = self.page(EstimatedCount(estimator=lambda objects: None, threshold=0))
+        self.assertEqual(page['meta']['total_count'], 6)
+        # sqlite has no estimates to give
+        page = self.page(EstimatedCount(threshold=0))
+        self.assertEqual(page['meta']['total_count'], 6)
+    
+    def test_none(self):
+        page = self.page(NoCount())
+        self.assertEqual(len(connection.queries), 1)
+        self.assertEqual(page['meta']['total_count'], None)
+        self.assertEqual(page['meta']['count_strategy'], 'none')
+        self.assertEqual([obj.pk for obj in page['objects']], [1, 2])
+        self.assertEqual(page['meta']['next'], '/api/v1/notes/?limit=2&offset=2')
+        
+        page = self.page(NoCount(), offset=4)
+        self.assertEqual([obj.pk for obj in page['objects']], [5, 6])
+        self.assertEqual(page['meta']['next'], None)
+        self.assertEqual(page['meta']['previous'], '/api/v1/notes/?limit=2&offset=2')
+    
+    def test_collection(self):
+        from core.tests.uri_urls import CountlessNoteCollection
+        request = MockRequest()
+        request.GET = QueryDict('')
+        reset_queries()
+        resp = CountlessNoteCollection().dispatch(request, __format=None)
+        content = json.loads(resp.content)
+        self.assertEqual(len(connection.queries), 1)
+        self.assertEqual(len(content['objects']), 4)
+        self.assertEqual(content['meta']['count_strategy'], 'none')
+        self.assertEqual(content['meta']['total_count'], None)
+        self.assertTrue(content['meta']['next'].startswith('/api/v1/countless/notes?'))
+        
+        request.method = 'HEAD'
+        resp = CountlessNoteCollection().dispatch(request, __format=None)
+        self.assertFalse(resp.has_header('X-Total-Count'))
+        
+        # HEAD counts with the collection's own paginator, as GET does
+        class ShiftedPaginator(Paginator):
+            def get_count(self):
+                return super(ShiftedPaginator, self).get_count() + 100
+        
+        class ShiftedNoteCollection(CountlessNoteCollection):
+            class Meta(CountlessNoteCollection.Meta):
+                paginator_class = ShiftedPaginator
+                count_strategy = ExactCount()
+        
+        resp = ShiftedNoteCollection().dispatch(request, __format=None)
+        self.assertEqual(resp['X-Total-Count'], '106')
@@ -0,0 +1,262 @@
+from django.conf import settings
+from django.db import connection, reset_queries
+from django.http import QueryDict
+from django.test import TestCase
+from apiserver.paginator import NoCount
+from apiserver.utils import plan_queries
+from apiserver.resources import ModelResource, ModelCollection
+from core.models import Note, Subject, MediaBit
+from core.tests.mocks import MockRequest
+from core.tests import uri_urls
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+class QueryPlanTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    
+    def setUp(self):
+        super(QueryPlanTestCase, self).setUp()
+        self.old_debug = settings.DEBUG
+        settings.DEBUG = True
+        
+        music = Subject.objects.create(name='Music', url='http://example.com/music')
+        volcanoes = Subject.objects.create(name='Volcanoes', url='http://example.com/volcanoes')
+        music.notes.add(*Note.objects.filter(pk__in=[1, 2, 3]))
+        volcanoes.notes.add(*Note.objects.filter(pk__in=[3, 4, 5, 6]))
+    
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+        super(QueryPlanTestCase, self).tearDown()
+    
+    def get_queries(self, collection, limit):
+        request = MockRequest()
+        request.GET = QueryDict('limit=%s' % limit)
+        reset_queries()
+        resp = collection.dispatch(request, __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(json.loads(resp.content)['objects']), limit)
+        return len(connection.queries)
+    
+    def test_plan(self):
+        meta = uri_urls.LinkedNoteResource._meta
+        self.assertEqual(meta.select_related, ['author'])
+        self.assertEqual(meta.prefetch, [('subjects', [])])
+        
+        # related objects' URIs need their authors
+        self.assertEqual(uri_urls.UserCollection._meta.prefetch, [('notes', ['author'])])
+        self.assertEqual(uri_urls.NoteResource._meta.select_related, [])
+        self.assertEqual(plan_queries(None, uri_urls.LinkedNoteResource.base_fields), ([], []))
+    
+    def test_constant_queries(self):
+        # a count, a page and one query per ``ToManyField``
+        for collection, queries in [
+                (uri_urls.LinkedNoteCollection(), 3),
+                (uri_urls.UserCollection(), 3),
+                (uri_urls.SubjectCollection(), 3),
+                ]:
+            self.assertEqual(self.get_queries(collection, 1), queries)
+            self.assertEqual(self.get_queries(collection, 2), queries)
+    
+    def test_prefetched(self):
+        request = MockRequest()
+        request.GET = QueryDict('')
+        objects = json.loads(uri_urls.UserCollection().dispatch(request, __format=None).content)['objects']
+        self.assertEqual([len(user['notes']) for user in objects], [3, 3])
+        self.assertEqual(objects[1]['notes'][0], '/api/v1/authors/janedoe/notes/3')
+        
+        # the same as what we'd get without prefetching
+        objects = json.loads(uri_urls.LinkedNoteCollection().dispatch(request, __format=None).content)['objects']
+        for note in objects:
+            subjects = [uri_urls.SubjectResource().get_resource_uri(subject) 
+                for subject in Note.objects.get(pk=note['id']).subjects.all()]
+            self.assertEqual(note['subjects'], subjects)
+
+
+class SparseFieldsetTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    
+    def setUp(self):
+        super(SparseFieldsetTestCase, self).setUp()
+        self.old_debug = settings.DEBUG
+        settings.DEBUG = True
+        self.request = MockRequest()
+    
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+        super(SparseFieldsetTestCase, self).tearDown()
+    
+    def get(self, resource, query, **filters):
+        self.request.GET = QueryDict(query)
+        reset_queries()
+        resp = resource.dispatch(self.request, __format=None, **filters)
+        return resp.status_code, json.loads(resp.content)
+    
+    def test_collection(self):
+        status, content = self.get(uri_urls.NoteCollection(), 'fields=title&limit=2')
+        self.assertEqual(status, 200)
+        self.assertEqual(sorted(content['objects'][0].keys()), ['resource_uri', 'title'])
+        self.assertEqual(content['objects'][0]['resource_uri'], '/api/v1/notes/first-post/1')
+        
+        # only the columns we need, which includes those in the route
+        page = connection.queries[-1]['sql']
+        self.assertTrue('"title"' in page and '"slug"' in page)
+        self.assertFalse('"content"' in page)
+        
+        # the next page will be just as sparse
+        self.assertTrue('fields=title' in content['meta']['next'])
+    
+    def test_detail(self):
+        status, content = self.get(uri_urls.NoteResource(), 'fields=title,content', pk='1', slug='first-post')
+        self.assertEqual(status, 200)
+        self.assertEqual(sorted(content.keys()), ['content', 'resource_uri', 'title'])
+        self.assertFalse('"updated"' in connection.queries[-1]['sql'])
+        
+        status, content = self.get(uri_urls.NoteResource(), 'fields=title,nonsense', pk='1', slug='first-post')
+        self.assertEqual(status, 400)
+        status, content = self.get(uri_urls.NoteCollection(), 'fields=nonsense')
+        self.assertEqual(status, 400)
+    
+    def test_related(self):
+        # relations that weren't asked for aren't followed
+        status, content = self.get(uri_urls.LinkedNoteCollection(), 'fields=title')
+        self.assertEqual(sorted(content['objects'][0].keys()), ['resource_uri', 'title'])
+        self.assertEqual(len(connection.queries), 2)
+        self.assertFalse('auth_user' in connection.queries[-1]['sql'])
+        
+        status, content = self.get(uri_urls.LinkedNoteCollection(), 'fields=author')
+        self.assertEqual(content['objects'][0]['author'], '/api/v1/users/johndoe')
+        self.assertEqual(len(connection.queries), 2)
+        
+        status, content = self.get(uri_urls.LinkedNoteCollection(), 'fields=subjects')
+        self.assertEqual(content['objects'][0]['subjects'], [])
+        self.assertEqual(len(connection.queries), 3)
+    
+    def test_plans(self):
+        collection = uri_urls.NoteCollection()
+        plan = collection.get_dehydration_plan(['title', 'resource_uri'])
+        self.assertEqual([step[0] for step in plan], ['title', 'resource_uri'])
+        self.assertTrue(collection.get_dehydration_plan(('title', 'resource_uri')) is plan)
+        
+        # plans can be dropped by another request at any time
+        class Forgetful(dict):
+            def __setitem__(self, key, value):
+                pass
+        collection._fieldset_plans = Forgetful()
+        self.assertEqual([step[0] for step in collection.get_dehydration_plan(['content'])], ['content'])
+
+
+class TitledNoteCollection(uri_urls.NoteCollection):
+    def dehydrate_title(self, bundle):
+        return bundle.data['title'].upper()
+
+
+class MediaBitResource(ModelResource):
+    class Meta:
+        route = '/bits/<pk:#>'
+        queryset = MediaBit.objects.order_by('pk')
+        fields = ['title', 'image']
+        include_resource_uri = False
+
+
+class MediaBitCollection(ModelCollection, MediaBitResource):
+    class Meta(MediaBitResource.Meta):
+        route = '/bits'
+    
+    def get_resource_collection_uri(self, filters={}):
+        return '/api/v1/bits'
+
+
+class RowPlanTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    
+    def setUp(self):
+        super(RowPlanTestCase, self).setUp()
+        self.old_debug = settings.DEBUG
+        settings.DEBUG = True
+        self.request = MockRequest()
+    
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+        super(RowPlanTestCase, self).tearDown()
+    
+    def get(self, collection, query='', **filters):
+        self.request.GET = QueryDict(query)
+        reset_queries()
+        resp = collection.dispatch(self.request, __format=None, **filters)
+        self.assertEqual(resp.status_code, 200)
+        return json.loads(''.join(resp))
+    
+    def expected(self, collection, objects, fieldset=None):
+        return json.loads(collection.serialize(None, 
+            [collection.full_dehydrate(obj, fieldset) for obj in objects], 'application/json'))
+    
+    def test_plan(self):
+        columns, steps, uri_columns = uri_urls.NoteCollection().get_row_plan()
+        self.assertEqual(sorted(columns), ['content', 'created', 'id', 'is_active', 'slug', 'title', 'updated'])
+        self.assertEqual([columns[index] for index in uri_columns], ['slug', 'id'])
+        
+        columns, steps, uri_columns = uri_urls.AuthorNoteCollection().get_row_plan(['title', 'resource_uri'])
+        self.assertEqual(columns, ['title', 'author__username', 'id'])
+        
+        self.assertEqual(uri_urls.LinkedNoteCollection().get_row_plan(), None)
+        self.assertEqual(uri_urls.LinkedNoteCollection().get_row_plan(['title', 'resource_uri'])[0], ['title', 'id'])
+        self.assertEqual(uri_urls.CursorNoteCollection().get_row_plan(), None)
+        self.assertEqual(TitledNoteCollection().get_row_plan(), None)
+        
+        collection = uri_urls.NoteCollection()
+        collection.full_dehydrate = lambda obj, fieldset=None: obj
+        self.assertEqual(collection.get_row_plan(), None)
+    
+    def test_cached(self):
+        collection = uri_urls.NoteCollection()
+        plan = collection.get_row_plan(['title', 'resource_uri'])
+        self.assertTrue(collection.get_row_plan(('title', 'resource_uri')) is plan)
+        self.assertFalse(collection.get_row_plan() is plan)
+        
+        # collections that need objects don't work that out every time either
+        collection = uri_urls.LinkedNoteCollection()
+        self.assertEqual(collection.get_row_plan(), None)
+        collection.build_row_plan = None
+        self.assertEqual(collection.get_row_plan(), None)
+    
+    def test_rows(self):
+        collection = uri_urls.NoteCollection()
+        content = self.get(collection)
+        self.assertEqual(len(connection.queries), 2)
+        # only the columns that get dehydrated
+        self.assertFalse('"author_id"' in connection.queries[-1]['sql'])
+        self.assertEqual(content['objects'], self.expected(collection, Note.objects.all()))
+        
+        content = self.get(collection, 'fields=title')
+        self.assertEqual(content['objects'], self.expected(collection, Note.objects.all(), ['title', 'resource_uri']))
+        self.assertEqual(content['objects'][0], {'title': 'First Post!', 'resource_uri': '/api/v1/notes/first-post/1'})
+        
+        collection = uri_urls.AuthorNoteCollection()
+        content = self.get(collection, author__username='johndoe')
+        self.assertEqual(content['objects'], self.expected(collection, Note.objects.filter(author__username='johndoe')))
+        self.assertTrue(content['objects'][0]['resource_uri'].startswith('/api/v1/authors/johndoe/notes/'))
+    
+    def test_files(self):
+        # files are URLs on objects, but only names in rows
+        collection = MediaBitCollection()
+        self.assertEqual(collection.get_row_plan(), None)
+        
+        note = Note.objects.get(pk=1)
+        MediaBit.objects.create(note=note, title='Picture', image='bits/a.jpg')
+        MediaBit.objects.create(note=note, title='Nothing')
+        content = self.get(collection)
+        self.assertEqual([obj['image'] for obj in content['objects'][-2:]], [settings.MEDIA_URL + 'bits/a.jpg', None])
+    
+    def test_streaming(self):
+        content = self.get(uri_urls.StreamingNoteCollection(), 'limit=0')
+        self.assertEqual(content['objects'], self.expected(uri_urls.NoteCollection(), Note.objects.all()))
+        
+        content = self.get(uri_urls.CountlessNoteCollection(), 'limit=2')
+        self.assertEqual(len(content['objects']), 2)
+        self.assertEqual(len(connection.queries), 1)
@@ -0,0 +1,124 @@
+from django.conf import settings
+from django.db import connection, reset_queries
+from django.test import TestCase
+from apiserver import fields
+from apiserver.metrics import Registry
+from apiserver.querylog import QueryLog, normalize, resume, suspend, current
+from apiserver.timing import TimingSink
+from core.models import Note
+from core.tests.mocks import MockRequest
+from core.tests import uri_urls
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+class QueryRecordingSink(TimingSink):
+    def __init__(self):
+        self.records = []
+
+    def record(self, resource, request, response, timing):
+        self.records.append(timing.queries)
+
+
+class LoggedNoteCollection(uri_urls.NoteCollection):
+    # a field that needs a query of its own for every note
+    subject_count = fields.IntegerField(readonly=True)
+
+    class Meta(uri_urls.NoteCollection.Meta):
+        query_log = True
+        metrics = Registry()
+        timing_sink = QueryRecordingSink()
+
+    def dehydrate_subject_count(self, bundle):
+        return bundle.obj.subjects.count()
+
+    def get_resource_collection_uri(self, filters={}):
+        return '/api/v1/notes'
+
+
+class LoggedLinkedNoteCollection(uri_urls.LinkedNoteCollection):
+    class Meta(uri_urls.LinkedNoteCollection.Meta):
+        query_log = True
+
+    def get_resource_collection_uri(self, filters={}):
+        return '/api/v1/linked/notes'
+
+
+class QueryLogTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+
+    def setUp(self):
+        super(QueryLogTestCase, self).setUp()
+        self.old_debug = settings.DEBUG
+        LoggedNoteCollection.Meta.metrics.reset()
+        LoggedNoteCollection.Meta.timing_sink.records = []
+
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+        super(QueryLogTestCase, self).tearDown()
+
+    def test_normalize(self):
+        self.assertEqual(normalize('SELECT "core_note"."id" FROM "core_note"\n  WHERE "core_note"."id" = 12 LIMIT 21'),
+            'SELECT "core_note"."id" FROM "core_note" WHERE "core_note"."id" = ? LIMIT ?')
+        self.assertEqual(normalize("SELECT * FROM t1 WHERE title = 'It''s' AND id IN (1, 2, 3)"),
+            "SELECT * FROM t1 WHERE title = ? AND id IN (...)")
+
+    def test_log(self):
+        settings.DEBUG = False
+        before = len(connection.queries)
+        log = QueryLog()
+        previous = resume(log)
+        self.assertTrue(current() is log)
+        list(Note.objects.filter(pk=1))
+        list(Note.objects.filter(pk=2))
+        suspend(log, previous)
+        self.assertTrue(current() is None)
+
+        self.assertEqual(log.count, 2)
+        self.assertEqual(len(log.shapes()), 1)
+        self.assertEqual(log.shapes()[0][1], 2)
+        # without `DEBUG`, the queries aren't kept around
+        self.assertEqual(len(connection.queries), before)
+        list(Note.objects.all())
+        self.assertEqual(len(connection.queries), before)
+
+    def test_repeated(self):
+        settings.DEBUG = False
+        resp = LoggedNoteCollection().dispatch(MockRequest(), __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse('queries' in json.loads(resp.content)['meta'])
+
+        log = LoggedNoteCollection.Meta.timing_sink.records[0]
+        self.assertEqual(log.objects, 6)
+        repeated = log.repeated()
+        self.assertEqual(len(repeated), 1)
+        field, shape, count = repeated[0]
+        self.assertEqual(field, 'subject_count')
+        self.assertEqual(count, 6)
+        self.assertTrue(shape.startswith('SELECT COUNT(*)'))
+
+        queries = LoggedNoteCollection.Meta.metrics.to_dict()['resources']['LoggedNoteCollection']['queries']
+        self.assertEqual(queries['count'], log.count)
+        self.assertEqual(queries['repeated'], {'subject_count': 1})
+
+        # with a single object, there's no telling
+        request = MockRequest()
+        request.GET['limit'] = '1'
+        LoggedNoteCollection().dispatch(request, __format=None)
+        self.assertEqual(LoggedNoteCollection.Meta.timing_sink.records[1].repeated(), [])
+
+    def test_prefetched(self):
+        settings.DEBUG = True
+        reset_queries()
+        resp = LoggedLinkedNoteCollection().dispatch(MockRequest(), __format=None)
+        self.assertEqual(resp.status_code, 200)
+
+        # related fields are fetched for all notes at once
+        queries = json.loads(resp.content)['meta']['queries']
+        self.assertEqual(queries['objects'], 6)
+        self.assertEqual(queries['repeated'], [])
+        self.assertEqual(queries['count'], sum([shape['count'] for shape in queries['shapes']]))
+        self.assertTrue(queries['count'] <= 3)
@@ -1373,10 +1373,16 @@ class ModelResourceTestCase(TestCase):
     
     def test_generate_cache_key(self):
         resource = NoteResource()
-        self.assertEqual(resource.generate_cache_key(), 'None:notes::')
-        self.assertEqual(resource.generate_cache_key('abc', '123'), 'None:notes:abc:123:')
-        self.assertEqual(resource.generate_cache_key(foo='bar', moof='baz'), 'None:notes::foo=bar:moof=baz')
-        self.assertEqual(resource.generate_cache_key('abc', '123', foo='bar', moof='baz'), 'None:notes:abc:123:foo=bar:moof=baz')
+        key = resource.generate_cache_key('detail', {'pk': 1})
+        self.assertTrue(key.startswith('apiserver:1:core.tests.resources.NoteResource:'))
+        self.assertTrue(':detail:' in key)
+        self.assertEqual(resource.generate_cache_key('detail', pk=1), key)
+        self.assertNotEqual(resource.generate_cache_key('list', {'pk': 1}), key)
+        self.assertNotEqual(resource.generate_cache_key('detail', {'pk': 2}), key)
+        self.assertNotEqual(VeryCustomNoteResource().generate_cache_key('detail', {'pk': 1}), key)
+        
+        resource.bump_cache_generation()
+        self.assertNotEqual(resource.generate_cache_key('detail', {'pk': 1}), key)
     
     def test_cached_fetch_list(self):
         resource = NoteResource()
@@ -0,0 +1,95 @@
+import re
+from django.test import TestCase
+from surlex import surlex_to_regex
+from apiserver.resources import r
+from apiserver.router import Router
+
+
+ROUTES = [
+    '',
+    '/organizations',
+    '/organizations/<name:s>',
+    '/organizations/<organization__name:s>/people/<pk:#>',
+    '/organizations/<org:s>/people',
+    '/everybody/<pk:#>',
+    '/messages/<name>',
+    '/feeds/rss.xml',
+    '/archive/<year:Y>-<month:m>',
+    '/files/*',
+    r(r'/raw/(?P<pk>\d+)'),
+]
+
+PATHS = [
+    '',
+    '.json',
+    '/',
+    '/organizations',
+    '/organizations.json',
+    '/organizations/',
+    '/organizations/ACME',
+    '/organizations/ACME.json',
+    '/organizations/ACME.json.xml',
+    '/organizations/ACME/people',
+    '/organizations/ACME/people.json',
+    '/organizations/ACME/people/1',
+    '/organizations/ACME/people/1.json',
+    '/organizations/ACME/people/one',
+    '/everybody/2',
+    '/everybody/2.JSON',
+    '/messages/hello',
+    '/messages/hello.json',
+    '/messages/hello/there',
+    '/feeds/rss.xml',
+    '/feeds/rss.xml.json',
+    '/feeds/rssxxml',
+    '/archive/2011-10',
+    '/archive/2011-10.json',
+    '/files/a/b/c',
+    '/raw/12',
+    '/raw/12.json',
+    '/nothing/here',
+]
+
+
+def linear(routes, path):
+    for route in routes:
+        if not isinstance(route, r):
+            regex = surlex_to_regex(route)
+        else:
+            regex = route
+        match = re.match('^' + regex + r'(\.(?P<__format>[a-z]+))?$', path)
+        if match:
+            return route, match.groupdict()
+
+
+class RouterTestCase(TestCase):
+    def setUp(self):
+        self.router = Router()
+        for route in ROUTES:
+            self.router.connect(route, route, name=route)
+
+    def test_parity(self):
+        for path in PATHS:
+            found = self.router.resolve(path)
+            expected = linear(ROUTES, path)
+
+            if expected is None:
+                self.assertEqual(found, None)
+            else:
+                view, kwargs, name = found
+                self.assertEqual((view, kwargs), expected)
+
+    def test_trie(self):
+        # everything but the wildcard, the raw regex and the tag
+        # without a macro should end up in the trie
+        self.assertEqual(len(self.router.fallbacks), 3)
+        self.assertEqual(sorted(self.router.root.static.keys()), [''])
+        self.assertEqual(sorted(self.router.root.static[''].static.keys()), ['archive', 'everybody', 'feeds', 'organizations'])
+
+    def test_literals_first(self):
+        router = Router()
+        router.connect('/people/<name:s>', 'person')
+        router.connect('/people/me', 'me')
+        self.assertEqual(router.resolve('/people/me')[:2], ('me', {'__format': None}))
+        self.assertEqual(router.resolve('/people/you.json')[:2], ('person', {'name': 'you', '__format': 'json'}))
+        self.assertEqual(router.resolve('/people'), None)
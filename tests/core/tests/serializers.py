@@ -1,8 +1,14 @@
 import datetime
+from decimal import Decimal
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.test import TestCase
-from apiserver.serializers import Serializer
+try:
+    import json
+except ImportError:
+    import simplejson as json
+import apiserver.serializers
+from apiserver.serializers import Serializer, JSONSerializer
 from apiserver.resources import ModelResource
 from core.models import Note
 
@@ -14,23 +20,25 @@ class NoteResource(ModelResource):
 
 
 class SerializerTestCase(TestCase):
+    serializer_class = Serializer
+    
     def test_init(self):
-        serializer_1 = Serializer()
+        serializer_1 = self.serializer_class()
         self.assertEqual(serializer_1.formats, ['json', 'jsonp', 'xml', 'yaml', 'html'])
         self.assertEqual(serializer_1.content_types, {'xml': 'application/xml', 'yaml': 'text/yaml', 'json': 'application/json', 'jsonp': 'text/javascript', 'html': 'text/html'})
         self.assertEqual(serializer_1.supported_formats, ['application/json', 'text/javascript', 'application/xml', 'text/yaml', 'text/html'])
         
-        serializer_2 = Serializer(formats=['json', 'xml'])
+        serializer_2 = self.serializer_class(formats=['json', 'xml'])
         self.assertEqual(serializer_2.formats, ['json', 'xml'])
         self.assertEqual(serializer_2.content_types, {'xml': 'application/xml', 'yaml': 'text/yaml', 'json': 'application/json', 'jsonp': 'text/javascript', 'html': 'text/html'})
         self.assertEqual(serializer_2.supported_formats, ['application/json', 'application/xml'])
         
-        serializer_3 = Serializer(formats=['json', 'xml'], content_types={'json': 'text/json', 'xml': 'application/xml'})
+        serializer_3 = self.serializer_class(formats=['json', 'xml'], content_types={'json': 'text/json', 'xml': 'application/xml'})
         self.assertEqual(serializer_3.formats, ['json', 'xml'])
         self.assertEqual(serializer_3.content_types, {'xml': 'application/xml', 'json': 'text/json'})
         self.assertEqual(serializer_3.supported_formats, ['text/json', 'application/xml'])
         
-        self.assertRaises(ImproperlyConfigured, Serializer, formats=['json', 'xml'], content_types={'json': 'text/json'})
+        self.assertRaises(ImproperlyConfigured, self.serializer_class, formats=['json', 'xml'], content_types={'json': 'text/json'})
 
     def get_sample1(self):
         return {
@@ -49,7 +57,7 @@ class SerializerTestCase(TestCase):
         }
     
     def test_format_datetime(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         self.assertEqual(serializer.format_datetime(datetime.datetime(2010, 12, 16, 2, 31, 33)), '2010-12-16T02:31:33')
         
         serializer = Serializer(datetime_formatting='iso-8601')
@@ -65,22 +73,22 @@ class SerializerTestCase(TestCase):
         old_format = getattr(settings, 'apiserver_DATETIME_FORMATTING', 'iso-8601')
         
         settings.apiserver_DATETIME_FORMATTING = 'iso-8601'
-        serializer = Serializer()
+        serializer = self.serializer_class()
         self.assertEqual(serializer.format_datetime(datetime.datetime(2010, 12, 16, 2, 31, 33)), '2010-12-16T02:31:33')
         
         settings.apiserver_DATETIME_FORMATTING = 'rfc-2822'
-        serializer = Serializer()
+        serializer = self.serializer_class()
         self.assertEqual(serializer.format_datetime(datetime.datetime(2010, 12, 16, 2, 31, 33)), u'Thu, 16 Dec 2010 02:31:33 -0600')
         
         settings.apiserver_DATETIME_FORMATTING = 'random-garbage'
-        serializer = Serializer()
+        serializer = self.serializer_class()
         self.assertEqual(serializer.format_datetime(datetime.datetime(2010, 12, 16, 2, 31, 33)), '2010-12-16T02:31:33')
         
         # Restore.
         settings.apiserver_DATETIME_FORMATTING = old_format
     
     def test_format_date(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         self.assertEqual(serializer.format_date(datetime.date(2010, 12, 16)), '2010-12-16')
         
         serializer = Serializer(datetime_formatting='iso-8601')
@@ -96,22 +104,22 @@ class SerializerTestCase(TestCase):
         old_format = getattr(settings, 'apiserver_DATETIME_FORMATTING', 'iso-8601')
         
         settings.apiserver_DATETIME_FORMATTING = 'iso-8601'
-        serializer = Serializer()
+        serializer = self.serializer_class()
         self.assertEqual(serializer.format_date(datetime.date(2010, 12, 16)), '2010-12-16')
         
         settings.apiserver_DATETIME_FORMATTING = 'rfc-2822'
-        serializer = Serializer()
+        serializer = self.serializer_class()
         self.assertEqual(serializer.format_date(datetime.date(2010, 12, 16)), u'16 Dec 2010')
         
         settings.apiserver_DATETIME_FORMATTING = 'random-garbage'
-        serializer = Serializer()
+        serializer = self.serializer_class()
         self.assertEqual(serializer.format_date(datetime.date(2010, 12, 16)), '2010-12-16')
         
         # Restore.
         settings.apiserver_DATETIME_FORMATTING = old_format
     
     def test_format_time(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         self.assertEqual(serializer.format_time(datetime.time(2, 31, 33)), '02:31:33')
         
         serializer = Serializer(datetime_formatting='iso-8601')
@@ -127,48 +135,48 @@ class SerializerTestCase(TestCase):
         old_format = getattr(settings, 'apiserver_DATETIME_FORMATTING', 'iso-8601')
         
         settings.apiserver_DATETIME_FORMATTING = 'iso-8601'
-        serializer = Serializer()
+        serializer = self.serializer_class()
         self.assertEqual(serializer.format_time(datetime.time(2, 31, 33)), '02:31:33')
         
         settings.apiserver_DATETIME_FORMATTING = 'rfc-2822'
-        serializer = Serializer()
+        serializer = self.serializer_class()
         self.assertEqual(serializer.format_time(datetime.time(2, 31, 33)), u'02:31:33 -0600')
         
         settings.apiserver_DATETIME_FORMATTING = 'random-garbage'
-        serializer = Serializer()
+        serializer = self.serializer_class()
         self.assertEqual(serializer.format_time(datetime.time(2, 31, 33)), '02:31:33')
         
         # Restore.
         settings.apiserver_DATETIME_FORMATTING = old_format
 
     def test_to_xml(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         sample_1 = self.get_sample1()
         self.assertEqual(serializer.to_xml(sample_1), '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<response><age type="integer">27</age><name>Daniel</name><date_joined>2010-03-27</date_joined></response>')
 
     def test_to_xml2(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         sample_2 = self.get_sample2()
         self.assertEqual(serializer.to_xml(sample_2), '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<response><somelist type="list"><value>hello</value><value type="integer">1</value><value type="null"/></somelist><somehash type="hash"><pi type="float">3.14</pi><foo>bar</foo></somehash><false type="boolean">False</false><true type="boolean">True</true><somestring>hello</somestring></response>')
 
     def test_from_xml(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         data = '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<request><age type="integer">27</age><name>Daniel</name><date_joined>2010-03-27</date_joined><rocksdahouse type="boolean">True</rocksdahouse></request>'
         self.assertEqual(serializer.from_xml(data), {'rocksdahouse': True, 'age': 27, 'name': 'Daniel', 'date_joined': '2010-03-27'})
 
     def test_from_xml2(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         data = '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<request><somelist type="list"><value>hello</value><value type="integer">1</value><value type="null"/></somelist><somehash type="hash"><pi type="float">3.14</pi><foo>bar</foo></somehash><false type="boolean">False</false><true type="boolean">True</true><somestring>hello</somestring></request>'
         self.assertEqual(serializer.from_xml(data), self.get_sample2())
     
     def test_to_json(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         
         sample_1 = self.get_sample1()
         self.assertEqual(serializer.to_json(sample_1), '{"age": 27, "date_joined": "2010-03-27", "name": "Daniel"}')
     
     def test_from_json(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         
         sample_1 = serializer.from_json('{"age": 27, "date_joined": "2010-03-27", "name": "Daniel"}')
         self.assertEqual(len(sample_1), 3)
@@ -177,7 +185,7 @@ class SerializerTestCase(TestCase):
         self.assertEqual(sample_1['date_joined'], u'2010-03-27')
 
     def test_round_trip_xml(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         sample_data = self.get_sample2()
         serialized = serializer.to_xml(sample_data)
         # "response" tags need to be changed to "request" to deserialize properly.
@@ -187,21 +195,21 @@ class SerializerTestCase(TestCase):
         self.assertEqual(sample_data, unserialized)
 
     def test_round_trip_json(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         sample_data = self.get_sample2()
         serialized = serializer.to_json(sample_data)
         unserialized = serializer.from_json(serialized)
         self.assertEqual(sample_data, unserialized)
 
     def test_round_trip_yaml(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         sample_data = self.get_sample2()
         serialized = serializer.to_yaml(sample_data)
         unserialized = serializer.from_yaml(serialized)
         self.assertEqual(sample_data, unserialized)
 
     def test_to_jsonp(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
 
         sample_1 = self.get_sample1()
         options = {'callback': 'myCallback'}
@@ -209,6 +217,7 @@ class SerializerTestCase(TestCase):
 
 class ResourceSerializationTestCase(TestCase):
     fixtures = ['note_testdata.json']
+    serializer_class = Serializer
 
     def setUp(self):
         super(ResourceSerializationTestCase, self).setUp()
@@ -216,16 +225,16 @@ class ResourceSerializationTestCase(TestCase):
         self.obj_list = [self.resource.full_dehydrate(obj=obj) for obj in self.resource.obj_get_list()]
 
     def test_to_xml_multirepr(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         self.assertEqual(serializer.to_xml(self.obj_list), '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<objects><object><updated>2010-03-30T20:05:00</updated><created>2010-03-30T20:05:00</created><title>First Post!</title><is_active type="boolean">True</is_active><slug>first-post</slug><content>This is my very first post using my shiny new API. Pretty sweet, huh?</content><id>1</id><resource_uri></resource_uri></object><object><updated>2010-03-31T20:05:00</updated><created>2010-03-31T20:05:00</created><title>Another Post</title><is_active type="boolean">True</is_active><slug>another-post</slug><content>The dog ate my cat today. He looks seriously uncomfortable.</content><id>2</id><resource_uri></resource_uri></object><object><updated>2010-04-01T20:05:00</updated><created>2010-04-01T20:05:00</created><title>Recent Volcanic Activity.</title><is_active type="boolean">True</is_active><slug>recent-volcanic-activity</slug><content>My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.</content><id>4</id><resource_uri></resource_uri></object><object><updated>2010-04-02T10:05:00</updated><created>2010-04-02T10:05:00</created><title>Granny\'s Gone</title><is_active type="boolean">True</is_active><slug>grannys-gone</slug><content>Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!</content><id>6</id><resource_uri></resource_uri></object></objects>')
 
     def test_to_xml_single(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         resource = self.obj_list[0]
         self.assertEqual(serializer.to_xml(resource), '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<object><updated>2010-03-30T20:05:00</updated><created>2010-03-30T20:05:00</created><title>First Post!</title><is_active type="boolean">True</is_active><slug>first-post</slug><content>This is my very first post using my shiny new API. Pretty sweet, huh?</content><id>1</id><resource_uri></resource_uri></object>')
 
     def test_to_xml_nested(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         resource = self.obj_list[0]
         data = {
             'stuff': {
@@ -236,16 +245,16 @@ class ResourceSerializationTestCase(TestCase):
         self.assertEqual(serializer.to_xml(data), '<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<response><stuff type="hash"><foo>bar</foo><object><updated>2010-03-30T20:05:00</updated><created>2010-03-30T20:05:00</created><title>First Post!</title><is_active type="boolean">True</is_active><slug>first-post</slug><content>This is my very first post using my shiny new API. Pretty sweet, huh?</content><id>1</id><resource_uri></resource_uri></object></stuff></response>')
 
     def test_to_json_multirepr(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         self.assertEqual(serializer.to_json(self.obj_list), '[{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00", "id": "1", "is_active": true, "resource_uri": "", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00"}, {"content": "The dog ate my cat today. He looks seriously uncomfortable.", "created": "2010-03-31T20:05:00", "id": "2", "is_active": true, "resource_uri": "", "slug": "another-post", "title": "Another Post", "updated": "2010-03-31T20:05:00"}, {"content": "My neighborhood\'s been kinda weird lately, especially after the lava flow took out the corner store. Granny can hardly outrun the magma with her walker.", "created": "2010-04-01T20:05:00", "id": "4", "is_active": true, "resource_uri": "", "slug": "recent-volcanic-activity", "title": "Recent Volcanic Activity.", "updated": "2010-04-01T20:05:00"}, {"content": "Man, the second eruption came on fast. Granny didn\'t have a chance. On the upshot, I was able to save her walker and I got a cool shawl out of the deal!", "created": "2010-04-02T10:05:00", "id": "6", "is_active": true, "resource_uri": "", "slug": "grannys-gone", "title": "Granny\'s Gone", "updated": "2010-04-02T10:05:00"}]')
 
     def test_to_json_single(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         resource = self.obj_list[0]
         self.assertEqual(serializer.to_json(resource), '{"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00", "id": "1", "is_active": true, "resource_uri": "", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00"}')
 
     def test_to_json_nested(self):
-        serializer = Serializer()
+        serializer = self.serializer_class()
         resource = self.obj_list[0]
         data = {
             'stuff': {
@@ -256,6 +265,45 @@ class ResourceSerializationTestCase(TestCase):
         self.assertEqual(serializer.to_json(data), '{"stuff": {"foo": "bar", "object": {"content": "This is my very first post using my shiny new API. Pretty sweet, huh?", "created": "2010-03-30T20:05:00", "id": "1", "is_active": true, "resource_uri": "", "slug": "first-post", "title": "First Post!", "updated": "2010-03-30T20:05:00"}}}')
 
 
+class StreamingSerializationTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    serializer_class = Serializer
+    
+    def setUp(self):
+        super(StreamingSerializationTestCase, self).setUp()
+        self.resource = NoteResource()
+        self.obj_list = [self.resource.full_dehydrate(obj=obj) for obj in self.resource.obj_get_list()]
+    
+    def test_stream_json(self):
+        serializer = self.serializer_class()
+        
+        for data in [
+            {'objects': self.obj_list},
+            {'objects': []},
+            {'meta': {'limit': 20}, 'objects': self.obj_list},
+            {'meta': {'limit': 20}, 'objects': self.obj_list, 'stats': {'count': 4}},
+            self.obj_list[0],
+            ]:
+            expected = serializer.to_json(data)
+            if isinstance(data, dict):
+                data = dict(data, objects=iter(data['objects']))
+            self.assertEqual(''.join(serializer.stream(data, 'application/json')), expected)
+        
+        # big collections are sent in chunks
+        old_chunk_size = apiserver.serializers.STREAM_CHUNK_SIZE
+        apiserver.serializers.STREAM_CHUNK_SIZE = 1
+        chunks = list(serializer.stream({'objects': iter(self.obj_list)}, 'application/json'))
+        apiserver.serializers.STREAM_CHUNK_SIZE = old_chunk_size
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(''.join(chunks), serializer.to_json({'objects': self.obj_list}))
+        
+        # other formats are serialized in one go
+        options = {'callback': 'myCallback'}
+        chunks = list(serializer.stream({'objects': iter(self.obj_list)}, 'text/javascript', options))
+        self.assertEqual(chunks, [serializer.to_jsonp({'objects': self.obj_list}, options)])
+
+
 class StubbedSerializer(Serializer):
     def __init__(self, *args, **kwargs):
         super(StubbedSerializer, self).__init__(*args, **kwargs)
@@ -336,3 +384,61 @@ class ContentHeaderTest(TestCase):
         serializer.deserialize('', 'text/html; charset=UTF-8')
         self.assertTrue(serializer.from_html_called)
         
+
+
+class JSONSerializerTestCase(TestCase):
+    serializer_class = JSONSerializer
+    
+    # the rest of `SerializerTestCase` is about what both serializers share
+    get_sample1 = SerializerTestCase.__dict__['get_sample1']
+    get_sample2 = SerializerTestCase.__dict__['get_sample2']
+    test_to_json = SerializerTestCase.__dict__['test_to_json']
+    test_from_json = SerializerTestCase.__dict__['test_from_json']
+    test_round_trip_json = SerializerTestCase.__dict__['test_round_trip_json']
+    test_to_jsonp = SerializerTestCase.__dict__['test_to_jsonp']
+    
+    def test_options(self):
+        sample = self.get_sample2()
+        serializer = JSONSerializer(sort_keys=False)
+        self.assertEqual(serializer.to_json(sample), json.dumps(sample))
+        
+        serializer = JSONSerializer(indent=2)
+        self.assertTrue(serializer.to_json(sample).startswith('{\n  "false": false,'))
+        self.assertEqual(serializer.from_json(serializer.to_json(sample)), sample)
+    
+    def test_types(self):
+        serializer = JSONSerializer()
+        data = {
+            'decimal': Decimal('3.10'),
+            'datetime': datetime.datetime(2010, 3, 27, 12, 30, 5),
+            'time': datetime.time(12, 30),
+            'long': 10L ** 20,
+            'float': 0.1,
+            'unicode': u'gr\xfc\xdfe \u2603',
+            'bytes': 'gr\xc3\xbc\xc3\x9fe',
+            'tuple': (1, 'a'),
+            'nested': [{}, [], {'x': [None]}],
+            1: 'one',
+        }
+        self.assertEqual(serializer.to_json(data), Serializer().to_json(data))
+        self.assertRaises(ValueError, serializer.to_json, float('nan'))
+
+
+class JSONResourceSerializationTestCase(StreamingSerializationTestCase):
+    serializer_class = JSONSerializer
+    
+    def test_same_as_to_json(self):
+        data = {'meta': {'limit': 20}, 'objects': self.obj_list}
+        self.assertEqual(JSONSerializer().to_json(data), Serializer().to_json(data))
+        
+        # bundles without resource_uri
+        for bundle in self.obj_list[:2]:
+            del bundle.data['resource_uri']
+        self.assertEqual(JSONSerializer().to_json(data), Serializer().to_json(data))
+    
+    def test_querysets(self):
+        serializer = JSONSerializer()
+        notes = Note.objects.values('title', 'created')
+        self.assertEqual(serializer.to_json({'objects': notes}), serializer.to_json({'objects': list(notes)}))
+        notes = Note.objects.order_by('pk').values_list('pk', flat=True)
+        self.assertEqual(serializer.to_json(notes), '[1, 2, 3, 4, 5, 6]')
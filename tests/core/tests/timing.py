@@ -0,0 +1,77 @@
+import time
+from django.test import TestCase
+from apiserver.timing import Timing, TimingSink, resume, suspend, phase
+from core.tests.mocks import MockRequest
+from core.tests import uri_urls
+
+
+class RecordingSink(TimingSink):
+    def __init__(self):
+        self.records = []
+    
+    def record(self, resource, request, response, timing):
+        self.records.append((resource.name, response.status_code, timing))
+
+
+class TimedNoteCollection(uri_urls.NoteCollection):
+    class Meta(uri_urls.NoteCollection.Meta):
+        timing_sink = RecordingSink()
+        server_timing = True
+    
+    def get_resource_collection_uri(self, filters={}):
+        return '/api/v1/notes'
+
+
+class TimedNoteResource(uri_urls.NoteResource):
+    class Meta(uri_urls.NoteResource.Meta):
+        timing_sink = RecordingSink()
+
+
+class TimingTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    
+    def test_phases(self):
+        request_timing = Timing()
+        previous = resume(request_timing)
+        with phase('query'):
+            time.sleep(0.01)
+            # nested phases don't count towards the outer one
+            with phase('dehydrate'):
+                time.sleep(0.02)
+        with phase('custom'):
+            pass
+        request_timing.stop()
+        suspend(previous)
+        
+        phases = dict(request_timing.items())
+        self.assertEqual([name for name, value in request_timing.items()], ['query', 'dehydrate', 'custom'])
+        self.assertTrue(10 <= phases['query'] < 20)
+        self.assertTrue(20 <= phases['dehydrate'] < 30)
+        self.assertTrue(request_timing.total >= 30)
+        self.assertTrue(request_timing.to_header().startswith('query;dur='))
+        self.assertTrue(request_timing.to_header().endswith(', total;dur=%.2f' % request_timing.total))
+        
+        # nothing gets timed once the timing stops
+        with phase('query'):
+            pass
+        self.assertEqual(dict(request_timing.items()), phases)
+    
+    def test_dispatch(self):
+        collection = TimedNoteCollection()
+        resp = collection.dispatch(MockRequest(), __format=None)
+        self.assertEqual(resp.status_code, 200)
+        
+        name, status, request_timing = collection._meta.timing_sink.records[-1]
+        self.assertEqual((name, status), ('TimedNoteCollection', 200))
+        self.assertEqual([name for name, value in request_timing.items()], ['query', 'dehydrate', 'serialize'])
+        self.assertEqual(resp['Server-Timing'], request_timing.to_header())
+        
+        resource = TimedNoteResource()
+        resp = resource.dispatch(MockRequest(), slug='first-post', pk='1', __format=None)
+        self.assertFalse(resp.has_header('Server-Timing'))
+        name, status, request_timing = resource._meta.timing_sink.records[-1]
+        self.assertEqual([name for name, value in request_timing.items()], ['query', 'dehydrate', 'serialize'])
+        
+        resp = uri_urls.NoteCollection().dispatch(MockRequest(), __format=None)
+        self.assertFalse(resp.has_header('Server-Timing'))
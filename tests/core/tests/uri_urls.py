@@ -0,0 +1,121 @@
+import time
+from django.conf.urls.defaults import *
+from django.contrib.auth.models import User
+from apiserver import fields
+from apiserver.api import API
+from apiserver.decorators import only
+from apiserver.paginator import CursorPaginator, NoCount
+from apiserver.resources import Resource, ModelResource, ModelCollection, Batch
+from core.models import Note, Subject
+
+
+class NoteResource(ModelResource):
+    class Meta:
+        route = '/notes/<slug:s>/<pk:#>'
+        queryset = Note.objects.all()
+
+
+class NoteCollection(ModelCollection, NoteResource):
+    class Meta(NoteResource.Meta):
+        route = '/notes'
+
+
+class StreamingNoteCollection(NoteCollection):
+    class Meta(NoteCollection.Meta):
+        route = '/streaming/notes'
+        stream = True
+
+
+class CursorNoteCollection(NoteCollection):
+    class Meta(NoteCollection.Meta):
+        route = '/cursor/notes'
+        paginator_class = CursorPaginator
+        limit = 4
+
+
+class CountlessNoteCollection(NoteCollection):
+    class Meta(NoteCollection.Meta):
+        route = '/countless/notes'
+        count_strategy = NoCount()
+        limit = 4
+
+
+class AuthorNoteResource(ModelResource):
+    class Meta:
+        route = '/authors/<author__username:s>/notes/<pk:#>'
+        queryset = Note.objects.all()
+
+
+class AuthorNoteCollection(ModelCollection, AuthorNoteResource):
+    class Meta(AuthorNoteResource.Meta):
+        route = '/authors/<author__username:s>/notes'
+
+
+class UserResource(ModelResource):
+    class Meta:
+        route = '/users/<username:s>'
+        queryset = User.objects.all()
+        fields = ['username']
+
+
+class UserCollection(ModelCollection, UserResource):
+    notes = fields.ToManyField(AuthorNoteResource, 'notes')
+    
+    class Meta(UserResource.Meta):
+        route = '/users'
+
+
+class SubjectResource(ModelResource):
+    notes = fields.ToManyField(AuthorNoteResource, 'notes')
+    
+    class Meta:
+        route = '/subjects/<pk:#>'
+        queryset = Subject.objects.all()
+
+
+class SubjectCollection(ModelCollection, SubjectResource):
+    class Meta(SubjectResource.Meta):
+        route = '/subjects'
+
+
+class LinkedNoteResource(ModelResource):
+    author = fields.ToOneField(UserResource, 'author', null=True)
+    subjects = fields.ToManyField(SubjectResource, 'subjects')
+    
+    class Meta:
+        route = '/linked/notes/<pk:#>'
+        queryset = Note.objects.all()
+
+
+class LinkedNoteCollection(ModelCollection, LinkedNoteResource):
+    class Meta(LinkedNoteResource.Meta):
+        route = '/linked/notes'
+
+
+@only('show', 'update')
+class SlowResource(Resource):
+    class Meta:
+        route = '/slow/<name:s>'
+    
+    def show(self, request, filters, format):
+        time.sleep(0.1)
+        return {'name': filters['name']}
+    
+    def update(self, request, filters, format):
+        time.sleep(0.1)
+        return 202
+
+
+class NoteBatch(Batch):
+    class Meta:
+        route = '/batch'
+
+
+api = API('v1')
+api.register([NoteResource, NoteCollection, StreamingNoteCollection, CursorNoteCollection, CountlessNoteCollection, AuthorNoteResource, AuthorNoteCollection])
+api.register([UserResource, UserCollection, SubjectResource, SubjectCollection, LinkedNoteResource, LinkedNoteCollection])
+api.register([NoteBatch, SlowResource])
+
+urlpatterns = patterns('',
+    (r'^api/', include(api.urlconf)),
+)
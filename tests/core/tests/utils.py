@@ -1,7 +1,11 @@
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse, NoReverseMatch, get_script_prefix, set_script_prefix
 from django.http import HttpRequest
 from django.test import TestCase
 from apiserver.serializers import Serializer
 from apiserver.utils.mime import determine_format, build_content_type
+from apiserver.utils.urls import URITemplate
+from core.models import Note
 
 
 class MimeTestCase(TestCase):
@@ -63,3 +67,54 @@ class MimeTestCase(TestCase):
         
         request.META = {'HTTP_ACCEPT': 'text/javascript,application/json'}
         self.assertEqual(determine_format(request, serializer), 'application/json')
+
+
+class URITemplateTestCase(TestCase):
+    urls = 'core.tests.uri_urls'
+    
+    def setUp(self):
+        self.author = User(pk=1, username='johndoe')
+        self.note = Note(pk=3, slug='first-post', author=self.author)
+    
+    def test_compile(self):
+        template = URITemplate('AuthorNoteResource', '/authors/<author__username:s>/notes/<pk:#>')
+        self.assertEqual(template.template, '/authors/%s/notes/%s')
+        self.assertEqual(template.names, ['author__username', 'pk'])
+        self.assertEqual(template.values(self.note), ['johndoe', 3])
+        
+        self.assertEqual(URITemplate('Files', '/files/*').template, None)
+        self.assertEqual(URITemplate('Raw', r'/raw/(?P<pk>\d+)', raw=True).names, ['pk'])
+    
+    def test_fill(self):
+        template = URITemplate('AuthorNoteResource', '/authors/<author__username:s>/notes/<pk:#>')
+        self.assertEqual(template.prefixes, {})
+        self.assertEqual(template.fill(['johndoe', 3]), '/api/v1/authors/johndoe/notes/3')
+        self.assertEqual(template.prefixes.values(), ['/api/v1'])
+        self.assertEqual(template.fill(['janedoe', 4], 'json'), '/api/v1/authors/janedoe/notes/4.json')
+        self.assertRaises(NoReverseMatch, template.fill, ['jane doe', 4])
+        
+        # the API can be mounted elsewhere for another request
+        script_prefix = get_script_prefix()
+        set_script_prefix('/mounted/')
+        try:
+            self.assertEqual(template.fill(['johndoe', 3]), '/mounted/api/v1/authors/johndoe/notes/3')
+        finally:
+            set_script_prefix(script_prefix)
+        self.assertEqual(template.fill(['johndoe', 3]), '/api/v1/authors/johndoe/notes/3')
+    
+    def test_resource_uris(self):
+        from core.tests.uri_urls import NoteResource, NoteCollection, AuthorNoteResource, AuthorNoteCollection
+        
+        for i in range(2):
+            self.assertEqual(NoteResource().get_resource_uri(self.note), reverse('NoteResource', kwargs={'slug': 'first-post', 'pk': 3}))
+            self.assertEqual(NoteCollection().get_resource_uri(self.note), '/api/v1/notes/first-post/3')
+            self.assertEqual(AuthorNoteResource().get_resource_uri(self.note, 'json'), '/api/v1/authors/johndoe/notes/3.json')
+            self.assertEqual(AuthorNoteCollection().get_resource_collection_uri({'author__username': 'johndoe'}), '/api/v1/authors/johndoe/notes')
+            self.assertEqual(NoteCollection().get_resource_collection_uri(), '/api/v1/notes')
+        
+        self.assertRaises(NoReverseMatch, AuthorNoteCollection().get_resource_collection_uri, {})
+        
+        class UnroutedCollection(NoteCollection):
+            pass
+        UnroutedCollection._meta.uri_template = None
+        self.assertRaises(NoReverseMatch, UnroutedCollection().get_resource_collection_uri)
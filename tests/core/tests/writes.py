@@ -0,0 +1,373 @@
+import datetime
+from django.conf import settings
+from django.db import connection, reset_queries
+from django.db.models import signals
+from django.test import TestCase, TransactionTestCase
+from apiserver.resources import ModelResource, ModelCollection
+from apiserver.utils import bulk_insert
+from apiserver.validation import Validation
+from core.models import Note, Subject, Article
+from core.tests.mocks import MockRequest
+from core.tests import uri_urls
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+class TitleValidation(Validation):
+    def is_valid(self, bundle, request=None):
+        if not bundle.data.get('title'):
+            return {'title': 'Notes need a title.'}
+        return {}
+
+
+class ValidatedNoteResource(uri_urls.NoteResource):
+    class Meta(uri_urls.NoteResource.Meta):
+        validation = TitleValidation()
+
+
+class ValidatedNoteCollection(uri_urls.NoteCollection):
+    class Meta(uri_urls.NoteCollection.Meta):
+        validation = TitleValidation()
+
+
+class VersionedNoteResource(uri_urls.NoteResource):
+    class Meta(uri_urls.NoteResource.Meta):
+        version = 'updated'
+
+
+class ArticleResource(ModelResource):
+    class Meta:
+        route = '/articles/<pk:#>'
+        queryset = Article.objects.all()
+
+
+class ArticleCollection(ModelCollection, ArticleResource):
+    class Meta(ArticleResource.Meta):
+        route = '/articles'
+
+
+class SlugNoteCollection(uri_urls.NoteCollection):
+    class Meta(uri_urls.NoteCollection.Meta):
+        match_on = 'slug'
+
+
+def post(collection, data, method='POST', **filters):
+    request = MockRequest()
+    request.method = method
+    request.raw_post_data = json.dumps(data)
+    return collection.dispatch(request, __format=None, **filters)
+
+
+def put(collection, data, **filters):
+    return post(collection, data, method='PUT', **filters)
+
+
+def patch(resource, data, **filters):
+    return post(resource, data, method='PATCH', **filters)
+
+
+class BulkCreateTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    
+    def setUp(self):
+        super(BulkCreateTestCase, self).setUp()
+        self.old_debug = settings.DEBUG
+        settings.DEBUG = True
+    
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+        super(BulkCreateTestCase, self).tearDown()
+    
+    def test_create_many(self):
+        objects = [{'title': 'Note %d' % i, 'slug': 'note-%d' % i} for i in range(3)]
+        resp = post(uri_urls.NoteCollection(), {'objects': objects})
+        self.assertEqual(resp.status_code, 201)
+        
+        notes = Note.objects.filter(slug__startswith='note-').order_by('pk')
+        self.assertEqual([note.title for note in notes], ['Note 0', 'Note 1', 'Note 2'])
+        self.assertEqual(json.loads(resp.content)['objects'],
+            ['/api/v1/notes/note-%d/%d' % (i, note.pk) for i, note in enumerate(notes)])
+    
+    def test_create_one(self):
+        resp = post(uri_urls.NoteCollection(), {'title': 'Note', 'slug': 'note'})
+        self.assertEqual(resp.status_code, 201)
+        note = Note.objects.get(slug='note')
+        self.assertEqual(resp['Location'], '/api/v1/notes/note/%d' % note.pk)
+    
+    def test_invalid(self):
+        objects = [{'title': 'Note', 'slug': 'note'}, {'slug': 'untitled'}, 'nonsense']
+        resp = post(ValidatedNoteCollection(), {'objects': objects})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(json.loads(resp.content), {'errors': {
+            '1': {'title': 'Notes need a title.'},
+            '2': 'Expected an object.',
+            }})
+        self.assertEqual(Note.objects.count(), 6)
+    
+    def test_batches(self):
+        notes = [Note(pk=100 + i, title='Note %d' % i, slug='note-%d' % i) for i in range(5)]
+        reset_queries()
+        bulk_insert(notes, batch_size=2)
+        self.assertEqual(len(connection.queries), 3)
+        self.assertEqual(list(Note.objects.filter(pk__gte=100).values_list('title', flat=True)),
+            ['Note %d' % i for i in range(5)])
+        
+        # objects without keys get those from the database,
+        # which sqlite can only do one INSERT at a time
+        notes = [Note(title='Note %d' % i, slug='note-%d' % i) for i in range(5)]
+        bulk_insert(notes, batch_size=2)
+        self.assertEqual([note.title for note in Note.objects.filter(pk__in=[note.pk for note in notes])],
+            ['Note %d' % i for i in range(5)])
+
+
+    def test_signals(self):
+        sent = []
+        def receiver(signal, sender, instance, **kwargs):
+            sent.append((signal, instance.pk))
+        signals.pre_save.connect(receiver, sender=Note)
+        signals.post_save.connect(receiver, sender=Note)
+        try:
+            # in bulk, and...
+            notes = [Note(pk=100 + i, title='Note %d' % i, slug='note-%d' % i) for i in range(2)]
+            bulk_insert(notes)
+            self.assertEqual(sent, [(signals.pre_save, 100), (signals.pre_save, 101), 
+                (signals.post_save, 100), (signals.post_save, 101)])
+            
+            # ...one by one, through `Note.save`
+            sent = []
+            old = datetime.datetime(2000, 1, 1)
+            notes = [Note(title='Note %d' % i, slug='note-%d' % i, updated=old) for i in range(2)]
+            bulk_insert(notes)
+            self.assertEqual([signal for signal, pk in sent], [signals.pre_save, signals.post_save] * 2)
+            self.assertTrue(old < notes[0].updated)
+        finally:
+            signals.pre_save.disconnect(receiver, sender=Note)
+            signals.post_save.disconnect(receiver, sender=Note)
+
+
+class BulkCreateRollbackTestCase(TransactionTestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    
+    def test_rollback(self):
+        # the last note collides with one that's already there
+        objects = [{'id': 100 + i, 'title': 'Note %d' % i, 'slug': 'note-%d' % i} for i in range(3)]
+        objects.append({'id': 1, 'title': 'Duplicate', 'slug': 'duplicate'})
+        resp = post(uri_urls.NoteCollection(), {'objects': objects})
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(Note.objects.count(), 6)
+        self.assertEqual(Note.objects.get(pk=1).title, 'First Post!')
+
+
+class ReplaceTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    
+    def setUp(self):
+        super(ReplaceTestCase, self).setUp()
+        self.old_debug = settings.DEBUG
+        settings.DEBUG = True
+    
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+        super(ReplaceTestCase, self).tearDown()
+    
+    def get_objects(self):
+        return [{'id': note.pk, 'title': note.title, 'slug': note.slug} 
+            for note in Note.objects.order_by('pk')]
+    
+    def count_queries(self, statement):
+        return len([query for query in connection.queries if query['sql'].startswith(statement)])
+    
+    def test_unchanged(self):
+        reset_queries()
+        resp = put(uri_urls.NoteCollection(), {'objects': self.get_objects()})
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(self.count_queries('UPDATE'), 0)
+        self.assertEqual(self.count_queries('INSERT'), 0)
+        self.assertEqual(self.count_queries('DELETE'), 0)
+    
+    def test_differences(self):
+        objects = self.get_objects()
+        kept = [obj['id'] for obj in objects[1:]]
+        objects[1]['title'] = 'Changed'
+        objects.append({'title': 'New', 'slug': 'new'})
+        updated = dict(Note.objects.values_list('pk', 'updated'))
+        reset_queries()
+        resp = put(uri_urls.NoteCollection(), {'objects': objects[1:]})
+        self.assertEqual(resp.status_code, 202)
+        
+        # only the title of the one note that changed gets updated
+        updates = [query['sql'] for query in connection.queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertTrue('"title"' in updates[0] and '"updated"' in updates[0] and not '"slug"' in updates[0])
+        self.assertEqual(self.count_queries('INSERT'), 1)
+        
+        self.assertFalse(Note.objects.filter(pk=objects[0]['id']).exists())
+        self.assertEqual(Note.objects.get(pk=kept[0]).title, 'Changed')
+        # `Note.save` keeps track of when notes were last updated
+        self.assertTrue(Note.objects.get(pk=kept[0]).updated > updated[kept[0]])
+        self.assertEqual(Note.objects.get(pk=kept[1]).updated, updated[kept[1]])
+        self.assertEqual(Note.objects.get(slug='new').title, 'New')
+        self.assertEqual(Note.objects.count(), len(kept) + 1)
+    
+    def test_inherited(self):
+        # the fields of parent models get saved too
+        article = Article.objects.create(title='Article', slug='article')
+        objects = [{'id': article.pk, 'title': 'Changed', 'slug': 'article', 'summary': 'Short'}]
+        resp = put(ArticleCollection(), {'objects': objects})
+        self.assertEqual(resp.status_code, 202)
+        article = Article.objects.get(pk=article.pk)
+        self.assertEqual(article.title, 'Changed')
+        self.assertEqual(article.summary, 'Short')
+    
+    def test_match_on(self):
+        objects = [{'title': 'Retitled', 'slug': 'first-post'}, {'title': 'New', 'slug': 'new'}]
+        resp = put(SlugNoteCollection(), {'objects': objects})
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(Note.objects.get(slug='first-post').pk, 1)
+        self.assertEqual(Note.objects.get(slug='first-post').title, 'Retitled')
+        self.assertEqual(Note.objects.count(), 2)
+    
+    def test_invalid(self):
+        objects = self.get_objects()
+        objects[0]['title'] = 'Changed'
+        objects[1]['title'] = ''
+        objects.append(dict(objects[2]))
+        before = self.get_objects()
+        
+        resp = put(ValidatedNoteCollection(), {'objects': objects})
+        self.assertEqual(resp.status_code, 400)
+        errors = json.loads(resp.content)['errors']
+        self.assertEqual(sorted(errors), ['1', str(len(objects) - 1)])
+        self.assertEqual(self.get_objects(), before)
+        
+        resp = put(uri_urls.NoteCollection(), objects)
+        self.assertEqual(resp.status_code, 400)
+
+
+class ReplaceRollbackTestCase(TransactionTestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    
+    def test_rollback(self):
+        # the first note gets deleted, but then the new one 
+        # collides with another note that's still there
+        objects = [{'id': note.pk, 'title': 'Changed', 'slug': note.slug} 
+            for note in Note.objects.exclude(pk=1)]
+        objects.append({'id': 2, 'title': 'Duplicate', 'slug': 'duplicate'})
+        resp = put(SlugNoteCollection(), {'objects': objects})
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(Note.objects.count(), 6)
+        self.assertEqual(Note.objects.get(pk=1).title, 'First Post!')
+        self.assertFalse(Note.objects.filter(title='Changed').exists())
+
+
+class PatchTestCase(TestCase):
+    fixtures = ['note_testdata.json']
+    urls = 'core.tests.uri_urls'
+    
+    def setUp(self):
+        super(PatchTestCase, self).setUp()
+        self.old_debug = settings.DEBUG
+        settings.DEBUG = True
+    
+    def tearDown(self):
+        settings.DEBUG = self.old_debug
+        super(PatchTestCase, self).tearDown()
+    
+    def test_patch(self):
+        reset_queries()
+        resp = patch(uri_urls.NoteResource(), {'title': 'Retitled'}, slug='first-post', pk='1')
+        self.assertEqual(resp.status_code, 202)
+        
+        updates = [query['sql'] for query in connection.queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertTrue('"title"' in updates[0] and not '"content"' in updates[0])
+        self.assertTrue(Note.objects.get(pk=1).updated > Note.objects.get(pk=2).updated)
+        note = Note.objects.get(pk=1)
+        self.assertEqual(note.title, 'Retitled')
+        self.assertEqual(note.slug, 'first-post')
+        
+        # nothing changed, nothing to save
+        reset_queries()
+        resp = patch(uri_urls.NoteResource(), {'title': 'Retitled'}, slug='first-post', pk='1')
+        self.assertEqual(resp.status_code, 202)
+        self.assertFalse([query for query in connection.queries if query['sql'].startswith('UPDATE')])
+    
+    def test_version(self):
+        # `Note.save` gets called, so the note has a new version
+        etag = VersionedNoteResource().dispatch(MockRequest(), slug='first-post', pk='1', __format=None)['ETag']
+        resp = patch(VersionedNoteResource(), {'title': 'Retitled'}, slug='first-post', pk='1')
+        self.assertEqual(resp.status_code, 202)
+        
+        request = MockRequest()
+        request.META['HTTP_IF_NONE_MATCH'] = etag
+        resp = VersionedNoteResource().dispatch(request, slug='first-post', pk='1', __format=None)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+        self.assertEqual(json.loads(resp.content)['title'], 'Retitled')
+    
+    def test_related(self):
+        resp = patch(uri_urls.LinkedNoteResource(), {'author': '/api/v1/users/janedoe'}, pk='1')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(Note.objects.get(pk=1).author.username, 'janedoe')
+        
+        resp = patch(uri_urls.LinkedNoteResource(), {'author': None}, pk='1')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(Note.objects.get(pk=1).author, None)
+        
+        subject = Subject.objects.create(name='Subject', url='http://example.com')
+        note = Note.objects.get(pk=2)
+        note.subjects.add(subject)
+        resp = patch(uri_urls.LinkedNoteResource(), {'title': 'Retitled'}, pk='2')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(list(note.subjects.all()), [subject])
+        
+        resp = patch(uri_urls.LinkedNoteResource(), {'subjects': []}, pk='2')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(list(note.subjects.all()), [])
+        
+        resp = patch(uri_urls.LinkedNoteResource(), {'author': '/api/v1/users/nobody'}, pk='1')
+        self.assertEqual(resp.status_code, 400)
+    
+    def test_inherited(self):
+        # the fields of parent models get saved too
+        article = Article.objects.create(title='Article', slug='article')
+        resp = patch(ArticleResource(), {'title': 'Retitled', 'summary': 'Short'}, pk=str(article.pk))
+        self.assertEqual(resp.status_code, 202)
+        article = Article.objects.get(pk=article.pk)
+        self.assertEqual(article.title, 'Retitled')
+        self.assertEqual(article.summary, 'Short')
+        self.assertEqual(Note.objects.get(pk=article.pk).title, 'Retitled')
+    
+    def test_collection(self):
+        # collections don't inherit PATCH from their detail resource
+        collection = uri_urls.NoteCollection()
+        self.assertFalse('PATCH' in collection.methods)
+        self.assertRaises(NotImplementedError, patch, collection, {'title': 'Retitled'})
+        self.assertEqual(Note.objects.get(pk=1).title, 'First Post!')
+    
+    def test_invalid(self):
+        # only the fields provided are validated
+        resp = patch(ValidatedNoteResource(), {'content': 'Changed'}, slug='first-post', pk='1')
+        self.assertEqual(resp.status_code, 202)
+        
+        resp = patch(ValidatedNoteResource(), {'title': ''}, slug='first-post', pk='1')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(json.loads(resp.content)['errors'].keys(), ['title'])
+        
+        # as are the model fields that change
+        resp = patch(uri_urls.NoteResource(), {'title': 'x' * 101}, slug='first-post', pk='1')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(json.loads(resp.content)['errors'].keys(), ['title'])
+        
+        resp = patch(ValidatedNoteResource(), {'nonsense': 1}, slug='first-post', pk='1')
+        self.assertEqual(resp.status_code, 400)
+        
+        resp = patch(ValidatedNoteResource(), {'title': 'Retitled'}, slug='first-post', pk='99')
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(Note.objects.get(pk=1).title, 'First Post!')